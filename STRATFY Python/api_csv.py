@@ -1,17 +1,132 @@
-from flask import Flask, request, jsonify
+import time
+# Tempo de importação do módulo (pandas, Flask, pyarrow...), exposto em /metrics
+INICIO_IMPORTACAO = time.perf_counter()
+
+from flask import Flask, request, jsonify, Response, stream_with_context, g, has_request_context, send_file, url_for
 import pandas as pd
+import numpy as np
 import re
+import csv
+import codecs
+import io
+import json
+from itertools import chain
+from functools import lru_cache, partial
 from flask_cors import CORS
 import traceback
-from modelo_categorizacao import carregar_modelo, prever_categoria
+import atexit
+import multiprocessing
+import os
+import threading
+import zipfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+from modelo_categorizacao import (carregar_modelo, prever_categorias, prever_probabilidades, top_k_categorias,
+                                  CachePrevisoes, versao_modelo, aplicar_correcoes, aplicar_correcoes_salvas,
+                                  PASTA_MODELO_COMPACTO, ARQUIVO_CORRECOES)
+from modelo_compacto import carregar_modelo_compacto, ModeloCompacto, ARQUIVO_METADADOS
+from formato_colunar import (escolher_formato, tabela_movimentacoes, concatenar_tabelas, serializar_tabela,
+                             MIME_JSON)
+from metricas import metricas_processo, AmostradorPerfil
+from cache_resultados import CacheResultados
+from conversao import (converter_datas, converter_valores, detectar_formato_data, detectar_separador_decimal,
+                       relatorio_invalidas)
+from tarefas import (criar_tarefa, consultar_tarefa, executar_tarefa, processar_em_paralelo, caminho_upload_tarefa,
+                     caminho_resultado_tarefa, marcar_tarefas_orfas, PROCESSOS_CATEGORIZACAO)
 
 app = Flask(__name__)
 CORS(app)
 
-# Carregar o modelo de machine learning treinado
-modelo_categorizador = carregar_modelo()
-if not modelo_categorizador:
-    print("Aviso: Modelo de categorização não carregado. A categorização automática não estará disponível.")
+# Tamanho máximo aceito para uploads (o servidor de produção pode sobrescrever)
+TAMANHO_MAXIMO_UPLOAD = 500 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = TAMANHO_MAXIMO_UPLOAD
+
+# Instrumentação: métricas em /metrics, cabeçalho Server-Timing (sempre, ou com ?timing=1) e
+# profiler por amostragem para uma requisição com ?perfil=1 (só se STRATFY_PERFIL=1)
+metricas = metricas_processo()
+metricas.definir("stratfy_inicializacao_segundos", time.perf_counter() - INICIO_IMPORTACAO, etapa="importacao")
+app.config['SERVER_TIMING'] = os.environ.get('STRATFY_SERVER_TIMING') == '1'
+app.config['PERFIL_HABILITADO'] = os.environ.get('STRATFY_PERFIL') == '1'
+
+# Carregar o modelo de machine learning treinado. O formato compacto (arrays NumPy mapeados em memória)
+# não depende do sklearn; o pickle fica como alternativa enquanto o modelo não tiver sido exportado.
+# STRATFY_VERSAO_MODELO fixa uma das versões gravadas por treinar.py (pasta modelos/). Em qualquer caso,
+# as correções dos usuários (ARQUIVO_CORRECOES) valem por cima do modelo carregado (ModeloComCorrecoes).
+# Um modelo promovido por treinar.py passa a ser servido na requisição seguinte, sem reiniciar a API.
+#
+# Com STRATFY_INICIO_RAPIDO=1 o modelo é carregado numa thread e a API já aceita conexões: /api/pronto
+# responde 503 e os uploads esperam (até TEMPO_ESPERA_MODELO_SEGUNDOS) enquanto ele não termina.
+# No servidor de produção o carregamento continua síncrono, para acontecer antes do fork dos workers.
+VERSAO_MODELO_FIXADA = os.environ.get('STRATFY_VERSAO_MODELO')
+ARQUIVO_MODELO = 'modelo_categorizacao.pkl'
+TEMPO_ESPERA_MODELO_SEGUNDOS = 60
+lock_modelo = threading.RLock()
+modelo_pronto = threading.Event()
+modelo_base = None
+modelo_categorizador = None
+# Estado dos arquivos quando o modelo servido foi montado (ver obter_modelo)
+assinatura_base = None
+mtime_correcoes = None
+
+def mtime_arquivo(caminho):
+    try:
+        return os.stat(caminho).st_mtime_ns
+    except OSError:
+        return None
+
+def assinatura_modelo_base():
+    """Muda quando treinar.py promove um modelo (pkl e pasta compacta). A versão fixada nunca muda."""
+    if VERSAO_MODELO_FIXADA:
+        return None
+    return mtime_arquivo(os.path.join(PASTA_MODELO_COMPACTO, ARQUIVO_METADADOS)), mtime_arquivo(ARQUIVO_MODELO)
+
+def carregar_modelo_base():
+    if VERSAO_MODELO_FIXADA:
+        modelo = carregar_modelo(versao=VERSAO_MODELO_FIXADA)
+    elif os.path.isdir(PASTA_MODELO_COMPACTO):
+        modelo = carregar_modelo_compacto(PASTA_MODELO_COMPACTO)
+    else:
+        modelo = carregar_modelo(ARQUIVO_MODELO)
+    if modelo and getattr(modelo, 'temperatura', None) is None and not isinstance(modelo, ModeloCompacto):
+        # O modelo compacto já avisa ao carregar
+        print("Aviso: Modelo de categorização sem temperatura calibrada; as probabilidades de confiança "
+              "não são confiáveis. Rode 'python treinar.py --calibrar'.")
+    return modelo
+
+def carregar_modelo_inicial():
+    global modelo_base, modelo_categorizador, assinatura_base, mtime_correcoes
+    inicio = time.perf_counter()
+    try:
+        with lock_modelo:
+            # Assinaturas lidas antes dos arquivos: o que mudar no meio do caminho é recarregado depois
+            assinatura_base, mtime_correcoes = assinatura_modelo_base(), mtime_arquivo(ARQUIVO_CORRECOES)
+            modelo_base = carregar_modelo_base()
+            modelo_categorizador = modelo_base and aplicar_correcoes_salvas(modelo_base, ARQUIVO_CORRECOES)
+        if not modelo_categorizador:
+            print("Aviso: Modelo de categorização não carregado. A categorização automática não estará disponível.")
+        metricas.definir("stratfy_inicializacao_segundos", time.perf_counter() - inicio, etapa="modelo")
+    finally:
+        modelo_pronto.set()
+
+if os.environ.get('STRATFY_INICIO_RAPIDO') == '1':
+    threading.Thread(target=carregar_modelo_inicial, name='carregar_modelo', daemon=True).start()
+else:
+    carregar_modelo_inicial()
+
+# Cache das categorias previstas, persistido em disco ao encerrar o processo (só o do servidor: os
+# processos do pool de categorização também importam este módulo)
+ARQUIVO_CACHE_PREVISOES = 'cache_previsoes.json'
+cache_previsoes = CachePrevisoes(arquivo=ARQUIVO_CACHE_PREVISOES)
+if multiprocessing.parent_process() is None:
+    atexit.register(cache_previsoes.salvar)
+# Vetores de probabilidade das opções de confiança; só em memória (não cabem no JSON do cache acima)
+cache_probabilidades = CachePrevisoes()
+
+# Tarefas assíncronas deixadas em andamento por uma execução anterior do servidor não vão terminar
+if multiprocessing.parent_process() is None:
+    marcar_tarefas_orfas()
 
 # Mapeamento de sinônimos de colunas
 sinonimos_colunas = {
@@ -28,6 +143,51 @@ padroes_tipo = {
     "Crédito": r'\bcrédito\b|\bcredito\b',
 }
 
+def compilar_padrao_tipos(padroes):
+    """Une os padrões de tipo em uma única regex, com um grupo nomeado por tipo.
+
+    Cada alternativa é um lookahead ancorado no início do texto, então vence a primeira regra (na ordem
+    de `padroes`) que casar em qualquer posição, exatamente como no laço de re.search original.
+    """
+    nomes_grupos = {f"tipo{i}": tipo for i, tipo in enumerate(padroes)}
+    alternativas = [f"(?=.*?(?P<{grupo}>{padroes[tipo]}))" for grupo, tipo in nomes_grupos.items()]
+    return re.compile('^(?:' + '|'.join(alternativas) + ')', re.DOTALL), nomes_grupos
+
+# Regras compiladas uma única vez, na inicialização
+padrao_tipos, grupos_tipos = compilar_padrao_tipos(padroes_tipo)
+padroes_colunas = {
+    chave: re.compile('|'.join(re.escape(sinonimo) for sinonimo in lista_sinonimos))
+    for chave, lista_sinonimos in sinonimos_colunas.items()
+}
+
+# Leitura em streaming: tamanho da amostra usada para detectar o formato e linhas por chunk
+TAMANHO_AMOSTRA = 64 * 1024
+TAMANHO_CHUNK = 20000
+
+def decodificar_legado(erro):
+    """Bytes inválidos em UTF-8 depois da amostra de detectar_formato são lidos como cp1252 (latin1 nos
+    bytes que ele não define), em vez de virarem U+FFFD e serem categorizados assim."""
+    trecho = bytes(erro.object[erro.start:erro.end])
+    metricas.incrementar("stratfy_bytes_recodificados_total", len(trecho))
+    try:
+        return trecho.decode('cp1252'), erro.end
+    except UnicodeDecodeError:
+        return trecho.decode('latin1'), erro.end
+
+ERROS_ENCODING = 'stratfy_legado'
+codecs.register_error(ERROS_ENCODING, decodificar_legado)
+
+# A partir deste número de linhas o upload síncrono também é categorizado no pool de processos
+LIMITE_LINHAS_PARALELO = 50000
+
+# Upload em lote: máximo de arquivos (já contando os de dentro dos .zip) e threads de leitura
+MAX_ARQUIVOS_LOTE = 100
+THREADS_LEITURA_LOTE = min(8, PROCESSOS_CATEGORIZACAO)
+
+# Cache das respostas por hash do arquivo (STRATFY_CACHE_RESULTADOS=0 desativa)
+cache_resultados = CacheResultados()
+app.config['CACHE_RESULTADOS'] = os.environ.get('STRATFY_CACHE_RESULTADOS', '1') == '1'
+
 # Dicionário de mapeamento de nomes de categorias para IDs
 categoria_nome_para_id = {
     "Moradia": 1,
@@ -43,23 +203,185 @@ categoria_nome_para_id = {
     "Outros": 11
 }
 
+# Confiança da categorização, pedida por query string: ?topk=3 acrescenta as 3 categorias mais prováveis
+# com as probabilidades calibradas ("Sugestoes"); ?limiar_outros=0.4 troca por "Outros" a categoria das
+# linhas com confiança abaixo de 0.4 (padrão em STRATFY_LIMIAR_OUTROS, desligado se ausente); ?revisao=0.6
+# devolve só as linhas com confiança abaixo de 0.6, para revisão manual. Tudo sai da mesma passada de
+# predict_proba sobre o arquivo; sem nenhuma dessas opções a resposta não muda.
+app.config['LIMIAR_OUTROS'] = float(os.environ['STRATFY_LIMIAR_OUTROS']) if os.environ.get('STRATFY_LIMIAR_OUTROS') else None
+
+@lru_cache(maxsize=256)
+def resolver_colunas(assinatura_cabecalho):
+    """Resolve os sinônimos para um cabeçalho (tupla de nomes já normalizados).
+
+    O resultado fica em cache: uploads seguintes com o mesmo layout de banco não refazem a detecção.
+    """
+    colunas_detectadas = []
+    for chave, padrao in padroes_colunas.items():
+        for coluna in assinatura_cabecalho:
+            if isinstance(coluna, str) and padrao.search(coluna):
+                colunas_detectadas.append((chave, coluna))
+                break
+    return tuple(colunas_detectadas)
+
+@contextmanager
+def etapa(nome, metrica="stratfy_etapa_segundos"):
+    """Cronometra uma etapa do processamento: vai para o histograma e para o Server-Timing da requisição."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        metricas.observar(metrica, duracao, etapa=nome)
+        if has_request_context():
+            g.setdefault('etapas', []).append((nome, duracao))
+
 def detectar_colunas(df):
     df.columns = df.columns.str.strip().str.lower()
-    colunas_detectadas = {}
+    return dict(resolver_colunas(tuple(df.columns)))
 
-    for chave, lista_sinonimos in sinonimos_colunas.items():
-        match = df.columns[df.columns.str.contains('|'.join(lista_sinonimos), case=False, na=False)]
-        if not match.empty:
-            colunas_detectadas[chave] = match[0]
-
-    return colunas_detectadas
+def obter_modelo():
+    """Retorna o modelo atual, recarregando o modelo promovido e reaplicando as correções quando mudam em disco."""
+    global modelo_base, modelo_categorizador, assinatura_base, mtime_correcoes
+    modelo_pronto.wait(TEMPO_ESPERA_MODELO_SEGUNDOS)
+    assinatura, mtime = assinatura_modelo_base(), mtime_arquivo(ARQUIVO_CORRECOES)
+    if assinatura == assinatura_base and mtime == mtime_correcoes:
+        return modelo_categorizador
+    with lock_modelo:
+        if assinatura != assinatura_base:
+            modelo = carregar_modelo_base()
+            if not modelo:
+                # Promoção no meio da troca de arquivos: continua com o modelo atual e tenta de novo depois
+                return modelo_categorizador
+            modelo_base, assinatura_base, mtime_correcoes = modelo, assinatura, None
+        if mtime != mtime_correcoes and modelo_base is not None:
+            modelo_categorizador = aplicar_correcoes_salvas(modelo_base, ARQUIVO_CORRECOES)
+            mtime_correcoes = mtime
+    return modelo_categorizador
 
 def inferir_tipo(descricao):
-    desc = str(descricao).lower()
-    for tipo, padrao in padroes_tipo.items():
-        if re.search(padrao, desc):
-            return tipo
-    return "Outros"
+    match = padrao_tipos.match(str(descricao).lower())
+    return grupos_tipos[match.lastgroup] if match else "Outros"
+
+def inferir_tipos(descricoes):
+    """Versão vetorizada de inferir_tipo: uma única passada da regex combinada sobre a coluna.
+
+    Extratos repetem muito as mesmas descrições, então a regex roda só sobre os valores distintos.
+    """
+    codigos, distintas = pd.factorize(descricoes.astype(str).str.lower())
+    encontrados = pd.Series(distintas, dtype=object).str.extract(padrao_tipos).notna().to_numpy()
+    tipos = np.array(list(grupos_tipos.values()), dtype=object)
+    por_distinta = np.where(encontrados.any(axis=1), tipos[encontrados.argmax(axis=1)], "Outros")
+    return pd.Series(por_distinta[codigos], index=descricoes.index, dtype=object)
+
+def ler_opcoes_confianca(args):
+    """Opções de confiança da requisição: {"topk", "limiar_outros", "revisao"}, ou None se nenhuma foi pedida.
+
+    Lança ValueError com a mensagem para o cliente se algum valor for inválido.
+    """
+    opcoes = {"topk": args.get('topk'), "limiar_outros": args.get('limiar_outros'), "revisao": args.get('revisao')}
+    try:
+        if opcoes["topk"] is not None:
+            opcoes["topk"] = int(opcoes["topk"])
+            if opcoes["topk"] < 1:
+                raise ValueError
+        for nome in ("limiar_outros", "revisao"):
+            if opcoes[nome] is not None:
+                opcoes[nome] = float(opcoes[nome])
+                if not 0 <= opcoes[nome] <= 1:
+                    raise ValueError
+    except ValueError:
+        raise ValueError('"topk" deve ser um inteiro positivo; "limiar_outros" e "revisao", números entre 0 e 1')
+
+    if opcoes["limiar_outros"] is None:
+        opcoes["limiar_outros"] = app.config['LIMIAR_OUTROS']
+    return opcoes if any(valor is not None for valor in opcoes.values()) else None
+
+def categorizar_com_confianca(descricoes, confianca):
+    """Categorias com as opções de confiança. Retorna (categorias, (nomes, probabilidades)) das k mais prováveis."""
+    classes, probabilidades = prever_probabilidades(obter_modelo(), descricoes, cache_probabilidades)
+    nomes, probabilidades = top_k_categorias(classes, probabilidades, confianca["topk"] or 1)
+    categorias = nomes[:, 0]
+    if confianca["limiar_outros"] is not None:
+        categorias = np.where(probabilidades[:, 0] < confianca["limiar_outros"], "Outros", categorias)
+    return categorias.tolist(), (nomes, probabilidades)
+
+def montar_colunas(df, confianca=None):
+    """Calcula, por coluna, os campos das movimentações a partir do DataFrame já normalizado.
+
+    O último item são as categorias mais prováveis com as probabilidades, só quando há opções de `confianca`.
+    Com "revisao", ficam só as linhas com confiança abaixo do limiar, comparada antes de qualquer
+    arredondamento, para as respostas JSON e Arrow trazerem as mesmas linhas.
+    """
+    df = df.assign(valor=converter_valores(df["valor"]))
+    df = df.dropna(subset=["valor"])
+
+    descricoes = df["descricao"].astype(str).str.strip()
+
+    with etapa("tipos"):
+        tipos = inferir_tipos(descricoes)
+        if "tipo" in df.columns:
+            tipos_informados = df["tipo"].astype(str).str.strip()
+            tipos = tipos_informados.where(df["tipo"].notna(), tipos)
+
+    # Uma única chamada ao modelo para todas as descrições do arquivo
+    with etapa("categorizacao", metrica="stratfy_modelo_latencia_segundos"):
+        if confianca:
+            categorias, sugestoes = categorizar_com_confianca(descricoes, confianca)
+        else:
+            categorias, sugestoes = prever_categorias(obter_modelo(), descricoes, cache_previsoes), None
+
+    if sugestoes is not None and confianca["revisao"] is not None:
+        manter = sugestoes[1][:, 0] < confianca["revisao"]
+        df, descricoes, tipos = df[manter], descricoes[manter], tipos[manter]
+        categorias = [categoria for categoria, mantida in zip(categorias, manter) if mantida]
+        sugestoes = (sugestoes[0][manter], sugestoes[1][manter])
+    return descricoes, df["valor"], tipos, df["data"], categorias, sugestoes
+
+def montar_movimentacoes(df, confianca=None):
+    """Monta a lista de movimentações a partir do DataFrame já normalizado, operando por coluna.
+
+    Com opções de `confianca`, cada movimentação traz também "Confianca" e, se pedido o top-k, "Sugestoes".
+    Se o DataFrame tiver a coluna "nome_arquivo" (upload em lote), ela vira o "Arquivo" de cada movimentação.
+    """
+    descricoes, valores, tipos, datas, categorias, sugestoes = montar_colunas(df, confianca)
+    categorias_ids = [categoria_nome_para_id.get(nome) for nome in categorias]
+
+    with etapa("montar"):
+        movimentacoes = [
+            {
+                "Descricao": descricao,
+                "Valor": valor,
+                "Tipo": tipo,
+                "DataMovimentacao": data_movimentacao,
+                "Categoria": {"Nome": categoria_nome, "Id": categoria_id}
+            }
+            for descricao, valor, tipo, data_movimentacao, categoria_nome, categoria_id in zip(
+                descricoes.tolist(), valores.tolist(), tipos.tolist(), datas.dt.strftime('%Y-%m-%d').tolist(),
+                categorias, categorias_ids
+            )
+        ]
+        if sugestoes is not None:
+            nomes, probabilidades = sugestoes[0].tolist(), sugestoes[1].round(4).tolist()
+            for movimentacao, nomes_linha, probabilidades_linha in zip(movimentacoes, nomes, probabilidades):
+                movimentacao["Confianca"] = probabilidades_linha[0]
+                if confianca["topk"]:
+                    movimentacao["Sugestoes"] = [
+                        {"Nome": nome, "Id": categoria_nome_para_id.get(nome), "Probabilidade": probabilidade}
+                        for nome, probabilidade in zip(nomes_linha, probabilidades_linha)
+                    ]
+        if "nome_arquivo" in df.columns:
+            for movimentacao, nome_arquivo in zip(movimentacoes, df["nome_arquivo"].loc[descricoes.index].tolist()):
+                movimentacao["Arquivo"] = nome_arquivo
+        return movimentacoes
+
+def montar_tabela_movimentacoes(df, confianca=None):
+    """Mesmas movimentações de montar_movimentacoes, como tabela Arrow (respostas colunares)."""
+    descricoes, valores, tipos, datas, categorias, sugestoes = montar_colunas(df, confianca)
+    if sugestoes is None:
+        return tabela_movimentacoes(descricoes, valores, tipos, datas, categorias, categoria_nome_para_id)
+    return tabela_movimentacoes(descricoes, valores, tipos, datas, categorias, categoria_nome_para_id,
+                                confianca=sugestoes[1][:, 0], sugestoes=sugestoes if confianca["topk"] else None)
 
 def ler_csv(file):
     try:
@@ -69,6 +391,265 @@ def ler_csv(file):
         df = pd.read_csv(file, sep=None, engine='python', encoding='latin1')
     return df
 
+def detectar_formato(stream):
+    """Detecta encoding e delimitador a partir dos primeiros KB do arquivo e volta o stream ao início."""
+    amostra = stream.read(TAMANHO_AMOSTRA)
+    stream.seek(0)
+
+    if amostra.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    else:
+        encoding = 'utf-8'
+    try:
+        # final=False ignora um caractere multibyte cortado no fim da amostra
+        texto = codecs.getincrementaldecoder(encoding)().decode(amostra, final=False)
+    except UnicodeDecodeError:
+        encoding = 'latin1'
+        texto = amostra.decode(encoding)
+
+    linhas = texto.splitlines()[:20]
+    try:
+        delimitador = csv.Sniffer().sniff('\n'.join(linhas), delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimitador = ','
+    return encoding, delimitador
+
+def ler_csv_em_chunks(file, tamanho_chunk=TAMANHO_CHUNK):
+    """Lê o arquivo em chunks com o engine C, detectando o formato uma única vez."""
+    encoding, delimitador = detectar_formato(file.stream)
+    return pd.read_csv(file.stream, sep=delimitador, encoding=encoding, encoding_errors=ERROS_ENCODING,
+                       chunksize=tamanho_chunk)
+
+def normalizar_colunas(df, mapeadas, formato_data, decimal):
+    """Renomeia as colunas detectadas para os nomes padrão, converte datas e valores e descarta linhas incompletas."""
+    df.columns = df.columns.str.strip().str.lower()
+    df = df.rename(columns={coluna: campo for campo, coluna in mapeadas.items()})
+    datas, valores = converter_datas(df["data"], formato_data), converter_valores(df["valor"], decimal)
+    registrar_invalidas(validar_conversoes(df, datas, valores))
+    return df.assign(data=datas, valor=valores).dropna(subset=["descricao", "valor", "data"])
+
+def processar_csv_streaming(file, confianca=None):
+    """Processa o arquivo chunk a chunk e devolve as movimentações como JSON (ou NDJSON) em streaming."""
+    try:
+        leitor = ler_csv_em_chunks(file)
+        primeiro_chunk = next(leitor, None)
+    except pd.errors.EmptyDataError:
+        primeiro_chunk = None
+
+    if primeiro_chunk is None or primeiro_chunk.empty:
+        return jsonify({'erro': 'Nenhum dado encontrado no arquivo'}), 400
+
+    mapeadas = detectar_colunas(primeiro_chunk)
+    campos_necessarios = ["descricao", "valor", "data"]
+
+    if not all(campo in mapeadas for campo in campos_necessarios):
+        return jsonify({'erro': f'Colunas obrigatórias ausentes. Detectadas: {mapeadas}. Conteúdo inicial: {primeiro_chunk.head().to_dict(orient="records")}'}), 400
+
+    # Formatos de data e de valor detectados no primeiro chunk valem para o arquivo todo
+    formato_data = detectar_formato_data(primeiro_chunk[mapeadas["data"]])
+    decimal = detectar_separador_decimal(primeiro_chunk[mapeadas["valor"]])
+    ndjson = request.accept_mimetypes.best == 'application/x-ndjson'
+
+    def gerar():
+        if not ndjson:
+            yield '['
+        primeiro = True
+        try:
+            for chunk in chain([primeiro_chunk], leitor):
+                movimentacoes = montar_movimentacoes(normalizar_colunas(chunk, mapeadas, formato_data, decimal), confianca)
+                if not movimentacoes:
+                    continue
+                if ndjson:
+                    yield ''.join(json.dumps(mov) + '\n' for mov in movimentacoes)
+                else:
+                    yield ('' if primeiro else ',') + ','.join(json.dumps(mov) for mov in movimentacoes)
+                primeiro = False
+            if not ndjson:
+                yield ']'
+        except Exception:
+            # O status já foi enviado; registra o erro e encerra a resposta sem fechar o array,
+            # para que o cliente não aceite um resultado truncado como válido
+            traceback.print_exc()
+
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+    return Response(stream_with_context(gerar()), mimetype=mimetype)
+
+@app.before_request
+def iniciar_medicao():
+    g.inicio_requisicao = time.perf_counter()
+    if request.content_length and request.path.startswith('/api/uploadcsv'):
+        metricas.incrementar("stratfy_bytes_lidos_total", request.content_length, rota=request.path)
+    if app.config['PERFIL_HABILITADO'] and request.args.get('perfil') == '1':
+        g.perfil = AmostradorPerfil(threading.get_ident()).iniciar()
+
+@app.after_request
+def registrar_medicao(resposta):
+    duracao = time.perf_counter() - g.get('inicio_requisicao', time.perf_counter())
+    rota = request.url_rule.rule if request.url_rule else 'desconhecida'
+    metricas.incrementar("stratfy_requisicoes_total", rota=rota, status=resposta.status_code)
+    metricas.observar("stratfy_requisicao_segundos", duracao, rota=rota)
+
+    if app.config['SERVER_TIMING'] or request.args.get('timing') == '1':
+        etapas = [f"{nome};dur={segundos * 1000:.1f}" for nome, segundos in g.get('etapas', [])]
+        resposta.headers['Server-Timing'] = ', '.join(etapas + [f"total;dur={duracao * 1000:.1f}"])
+
+    perfil = g.pop('perfil', None)
+    if perfil:
+        # Respostas em streaming continuam depois deste ponto; o perfil cobre só a parte síncrona
+        perfil.parar()
+        resposta.headers['X-Perfil'] = perfil.salvar(rota.strip('/').replace('/', '_').replace('<', '').replace('>', ''))
+
+    atualizar_metricas_cache()
+    metricas.gravar()
+    return resposta
+
+def atualizar_metricas_cache():
+    estatisticas = cache_previsoes.estatisticas()
+    metricas.definir("stratfy_cache_previsoes_acertos_total", estatisticas["acertos"])
+    metricas.definir("stratfy_cache_previsoes_falhas_total", estatisticas["falhas"])
+    metricas.definir("stratfy_cache_previsoes_tamanho", estatisticas["tamanho"])
+    info_colunas = resolver_colunas.cache_info()
+    metricas.definir("stratfy_cache_colunas_acertos_total", info_colunas.hits)
+    metricas.definir("stratfy_cache_colunas_falhas_total", info_colunas.misses)
+
+@app.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    atualizar_metricas_cache()
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
+
+@app.errorhandler(RequestEntityTooLarge)
+def arquivo_muito_grande(e):
+    limite_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({'erro': f'Arquivo excede o limite de {limite_mb} MB'}), 413
+
+@app.before_request
+def aguardar_modelo():
+    """Uploads e correções esperam o carregamento em segundo plano (antes de abrir o pool de processos)."""
+    if request.path.startswith(('/api/uploadcsv', '/api/correcoes')) and not modelo_pronto.wait(TEMPO_ESPERA_MODELO_SEGUNDOS):
+        return jsonify({'erro': 'Modelo de categorização ainda carregando'}), 503, {'Retry-After': '5'}
+
+@app.route('/api/saude', methods=['GET'])
+def saude():
+    """Liveness: o processo está de pé e atendendo, mesmo que o modelo ainda esteja carregando."""
+    return jsonify({'vivo': True, 'carregando_modelo': not modelo_pronto.is_set()})
+
+@app.route('/api/pronto', methods=['GET'])
+def pronto():
+    """Readiness: só responde 200 depois que o modelo de categorização foi carregado."""
+    if not modelo_pronto.is_set() or not modelo_categorizador:
+        return jsonify({'pronto': False}), 503
+    return jsonify({'pronto': True, 'versao_modelo': versao_modelo(modelo_categorizador)})
+
+def validar_conversoes(df, datas, valores):
+    """Relatório das datas e valores que não puderam ser convertidos: {campo: relatorio}."""
+    relatorios = {"data": relatorio_invalidas(df["data"], datas), "valor": relatorio_invalidas(df["valor"], valores)}
+    return {campo: relatorio for campo, relatorio in relatorios.items() if relatorio}
+
+def registrar_invalidas(invalidas):
+    for campo, relatorio in invalidas.items():
+        metricas.incrementar("stratfy_linhas_invalidas_total", relatorio["quantidade"], campo=campo)
+
+def preparar_df(df):
+    """Valida e normaliza o DataFrame lido do arquivo. Retorna (df, mensagem_erro, linhas_invalidas).
+
+    As linhas com data ou valor inválidos são descartadas e aparecem no relatório de validar_conversoes.
+    """
+    if df.empty:
+        return None, 'Nenhum dado encontrado no arquivo', {}
+
+    with etapa("detectar_colunas"):
+        mapeadas = detectar_colunas(df)
+    campos_necessarios = ["descricao", "valor", "data"]
+
+    if not all(campo in mapeadas for campo in campos_necessarios):
+        return None, f'Colunas obrigatórias ausentes. Detectadas: {mapeadas}. Conteúdo inicial: {df.head().to_dict(orient="records")}', {}
+
+    df = df.rename(columns={mapeadas[campo]: campo for campo in campos_necessarios if campo in mapeadas})
+
+    if 'tipo' in mapeadas:
+        df = df.rename(columns={mapeadas['tipo']: 'tipo'})
+
+    try:
+        with etapa("datas"):
+            datas = converter_datas(df["data"])
+    except Exception as e:
+        return None, f'Erro ao converter a coluna "data": {str(e)}. Conteúdo da coluna: {df["data"].head().tolist()}', {}
+    with etapa("valores"):
+        valores = converter_valores(df["valor"])
+
+    invalidas = validar_conversoes(df, datas, valores)
+    registrar_invalidas(invalidas)
+    return df.assign(data=datas, valor=valores).dropna(subset=["descricao", "valor", "data"]), None, invalidas
+
+def processar_arquivo_tarefa(caminho, confianca=None, ao_concluir_shard=None):
+    """Processa um upload salvo em disco no modo assíncrono. Retorna (movimentacoes, mensagem_erro)."""
+    try:
+        with open(caminho, 'rb') as arquivo:
+            df, erro, _ = preparar_df(ler_csv(FileStorage(stream=arquivo)))
+        if erro:
+            return None, erro
+        return processar_em_paralelo(df, partial(montar_movimentacoes, confianca=confianca), ao_concluir_shard), None
+    finally:
+        os.remove(caminho)
+
+def expandir_arquivos_lote(arquivos):
+    """Lista (nome, conteúdo) dos arquivos enviados, abrindo os .zip e pegando os .csv de dentro."""
+    expandidos = []
+    for arquivo in arquivos:
+        conteudo = arquivo.read()
+        if not zipfile.is_zipfile(io.BytesIO(conteudo)):
+            expandidos.append((arquivo.filename, conteudo))
+            continue
+
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+            membros = [membro for membro in pacote.infolist()
+                       if not membro.is_dir() and membro.filename.lower().endswith('.csv')
+                       and not membro.filename.startswith('__MACOSX/')]
+            # O tamanho descompactado conta para o limite de upload, para não aceitar "zip bombs"
+            if sum(membro.file_size for membro in membros) > app.config['MAX_CONTENT_LENGTH']:
+                raise RequestEntityTooLarge()
+            expandidos += [(f"{arquivo.filename}/{membro.filename}", pacote.read(membro)) for membro in membros]
+    return expandidos
+
+def ler_arquivo_lote(nome, conteudo):
+    """Lê e normaliza um arquivo do lote. Retorna (nome, df, mensagem_erro, linhas_invalidas)."""
+    try:
+        arquivo = FileStorage(stream=io.BytesIO(conteudo), filename=nome)
+        encoding, delimitador = detectar_formato(arquivo.stream)
+        df = pd.read_csv(arquivo.stream, sep=delimitador, encoding=encoding, encoding_errors=ERROS_ENCODING)
+    except pd.errors.EmptyDataError:
+        return nome, None, 'Nenhum dado encontrado no arquivo', {}
+    except Exception as e:
+        return nome, None, f'Erro ao ler o arquivo: {str(e)}', {}
+
+    df, erro, invalidas = preparar_df(df)
+    if erro:
+        return nome, None, erro, {}
+    return nome, df[[coluna for coluna in ["descricao", "valor", "data", "tipo"] if coluna in df.columns]], None, invalidas
+
+def chaves_deduplicacao(df):
+    """Hash de (data, valor, descrição normalizada) de cada linha."""
+    descricoes = (df["descricao"].astype(str).str.lower().str.normalize('NFKD')
+                  .str.encode('ascii', 'ignore').str.decode('ascii')
+                  .str.replace(r'\s+', ' ', regex=True).str.strip())
+    return pd.util.hash_pandas_object(
+        pd.DataFrame({"data": df["data"].dt.normalize(), "valor": df["valor"].round(2), "descricao": descricoes}),
+        index=False)
+
+def marcar_duplicadas(df):
+    """Marca as linhas que já apareceram em um arquivo anterior do lote.
+
+    Linhas repetidas dentro do mesmo arquivo são legítimas (duas compras iguais no mesmo dia); entre arquivos,
+    a n-ésima ocorrência de uma chave só é mantida se nenhum arquivo anterior já tinha n ocorrências dela.
+    """
+    chaves = chaves_deduplicacao(df)
+    ocorrencia = chaves.groupby([df["arquivo"], chaves]).cumcount()
+    contagens = chaves.groupby([chaves, df["arquivo"]]).size()
+    anteriores = (contagens.groupby(level=0).cummax().groupby(level=0).shift(fill_value=0)
+                  .rename("anteriores"))
+    anteriores = pd.MultiIndex.from_arrays([chaves, df["arquivo"]]).map(anteriores)
+    return ocorrencia.to_numpy() < np.asarray(anteriores)
+
 @app.route('/api/uploadcsv', methods=['POST'])
 def processar_csv():
     if 'file' not in request.files:
@@ -78,65 +659,204 @@ def processar_csv():
     if file.filename == '':
         return jsonify({'erro': 'Arquivo vazio'}), 400
 
-    try:  
-        df = ler_csv(file)
+    try:
+        confianca = ler_opcoes_confianca(request.args)
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
 
-        if df.empty:
-            return jsonify({'erro': 'Nenhum dado encontrado no arquivo'}), 400
+    try:  
+        if request.args.get('stream') == '1':
+            return processar_csv_streaming(file, confianca)
 
-        mapeadas = detectar_colunas(df)
-        campos_necessarios = ["descricao", "valor", "data"]
+        if request.args.get('async') == '1':
+            id_tarefa = criar_tarefa()
+            caminho = caminho_upload_tarefa(id_tarefa)
+            file.save(caminho)
+            executar_tarefa(id_tarefa, processar_arquivo_tarefa, caminho, confianca)
+            return jsonify({'id': id_tarefa, 'estado': 'pendente'}), 202
 
-        if not all(campo in mapeadas for campo in campos_necessarios):
-            return jsonify({'erro': f'Colunas obrigatórias ausentes. Detectadas: {mapeadas}. Conteúdo inicial: {df.head().to_dict(orient="records")}'}), 400
+        formato = escolher_formato(request.accept_mimetypes)
 
-        df = df.rename(columns={mapeadas[campo]: campo for campo in campos_necessarios if campo in mapeadas})
+        # Reenvio de um arquivo já processado com o mesmo modelo: devolve a resposta gravada
+        chave_cache = None
+        if app.config['CACHE_RESULTADOS']:
+            modelo = obter_modelo()
+            with etapa("hash_arquivo"):
+                # As opções de confiança mudam a resposta; sem elas a chave continua a mesma de antes
+                componentes = [json.dumps(confianca, sort_keys=True)] if confianca else []
+                chave_cache = cache_resultados.chave(file.stream, versao_modelo(modelo) if modelo else None, formato,
+                                                     *componentes)
+            gravado = cache_resultados.obter(chave_cache)
+            if gravado is not None:
+                metricas.incrementar("stratfy_cache_resultados_acertos_total")
+                corpo, cabecalhos = gravado
+                return Response(corpo, mimetype=formato, headers={**cabecalhos, 'X-Cache': 'HIT'})
+            metricas.incrementar("stratfy_cache_resultados_falhas_total")
 
-        if 'tipo' in mapeadas:
-            df = df.rename(columns={mapeadas['tipo']: 'tipo'})
+        with etapa("ler_csv"):
+            df = ler_csv(file)
+        df, erro, invalidas = preparar_df(df)
+        if erro:
+            return jsonify({'erro': erro}), 400
 
-        try:
-            df["data"] = pd.to_datetime(df["data"], errors='coerce').dt.date
-        except Exception as e:
-            return jsonify({'erro': f'Erro ao converter a coluna "data": {str(e)}. Conteúdo da coluna: {df["data"].head().tolist()}'}), 400
-
-        df = df.dropna(subset=["descricao", "valor", "data"])
-
-        movimentacoes = []
-        for _, row in df.iterrows():
-            descricao = str(row["descricao"]).strip()
-            try:
-                valor = float(str(row["valor"]).replace(',', '.'))
-            except ValueError:
-                continue
-            data_movimentacao = row["data"].isoformat()
-            tipo_detectado = None
-
-            if "tipo" in row and pd.notna(row["tipo"]):
-                tipo_detectado = str(row["tipo"]).strip()
+        if formato != MIME_JSON:
+            if len(df) >= LIMITE_LINHAS_PARALELO:
+                with etapa("processamento_paralelo"):
+                    tabela = processar_em_paralelo(df, partial(montar_tabela_movimentacoes, confianca=confianca),
+                                                   juntar=concatenar_tabelas)
             else:
-                tipo_detectado = inferir_tipo(descricao)
+                tabela = montar_tabela_movimentacoes(df, confianca)
+            metricas.incrementar("stratfy_linhas_processadas_total", tabela.num_rows, rota=request.path)
+            with etapa("serializacao"):
+                corpo = serializar_tabela(tabela, formato)
+        else:
+            if len(df) >= LIMITE_LINHAS_PARALELO:
+                with etapa("processamento_paralelo"):
+                    movimentacoes = processar_em_paralelo(df, partial(montar_movimentacoes, confianca=confianca))
+            else:
+                movimentacoes = montar_movimentacoes(df, confianca)
+            metricas.incrementar("stratfy_linhas_processadas_total", len(movimentacoes), rota=request.path)
+            with etapa("serializacao"):
+                corpo = jsonify(movimentacoes).get_data()
 
-            # Tentar categorizar usando o modelo de ML se carregado
-            categoria_nome_predita = None
-            categoria_id_predita = None
-            if modelo_categorizador:
-                categoria_nome_predita = prever_categoria(modelo_categorizador, descricao)
-                categoria_id_predita = categoria_nome_para_id.get(categoria_nome_predita)
+        # Linhas descartadas por data ou valor inválidos, sem mudar o corpo que os clientes já esperam
+        cabecalhos = {'X-Linhas-Invalidas': json.dumps(invalidas)} if invalidas else {}
+        if chave_cache:
+            cache_resultados.guardar(chave_cache, corpo, cabecalhos)
+            cabecalhos['X-Cache'] = 'MISS'
+        return Response(corpo, mimetype=formato, headers=cabecalhos)
 
-            movimentacoes.append({
-                "Descricao": descricao,
-                "Valor": valor,
-                "Tipo": tipo_detectado,
-                "DataMovimentacao": data_movimentacao,
-                "Categoria": {"Nome": categoria_nome_predita, "Id": categoria_id_predita}
-            })
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'erro': str(e)}), 500
+
+@app.route('/api/uploadcsv/lote', methods=['POST'])
+def processar_lote():
+    """Processa vários extratos de uma vez (vários campos "files" e/ou arquivos .zip).
+
+    Retorna o resumo por arquivo e a lista única de movimentações, ordenada por data e sem as
+    duplicadas entre extratos que se sobrepõem. Cada movimentação indica o "Arquivo" de origem.
+    Aceita as mesmas opções de confiança de /api/uploadcsv; com ?revisao, o resumo continua contando
+    todas as movimentações de cada arquivo.
+    """
+    arquivos = [arquivo for arquivo in request.files.getlist('files') + request.files.getlist('file')
+                if arquivo.filename]
+    if not arquivos:
+        return jsonify({'erro': 'Arquivo ausente'}), 400
+    try:
+        confianca = ler_opcoes_confianca(request.args)
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+
+    try:
+        expandidos = expandir_arquivos_lote(arquivos)
+        if not expandidos:
+            return jsonify({'erro': 'Nenhum arquivo CSV encontrado'}), 400
+        if len(expandidos) > MAX_ARQUIVOS_LOTE:
+            return jsonify({'erro': f'Envie no máximo {MAX_ARQUIVOS_LOTE} arquivos por lote'}), 400
+
+        # Leitura em paralelo; detecção de colunas e cache de previsões são compartilhados entre os arquivos
+        with etapa("ler_csv"), ThreadPoolExecutor(max_workers=THREADS_LEITURA_LOTE) as executor:
+            lidos = list(executor.map(lambda item: ler_arquivo_lote(*item), expandidos))
+
+        resumo = [{"arquivo": nome, "movimentacoes": 0, "duplicadas": 0, "linhas_invalidas": invalidas, "erro": erro}
+                  for nome, _, erro, invalidas in lidos]
+        validos = [(indice, df) for indice, (_, df, _, _) in enumerate(lidos) if df is not None and not df.empty]
+        if not validos:
+            return jsonify({'arquivos': resumo, 'movimentacoes': [], 'duplicadas_removidas': 0})
 
-        return jsonify(movimentacoes)
+        nomes = [nome for nome, _, _, _ in lidos]
+        df = pd.concat([df.assign(arquivo=indice, nome_arquivo=nomes[indice]) for indice, df in validos],
+                       ignore_index=True)
+        with etapa("deduplicacao"):
+            duplicadas = marcar_duplicadas(df)
+        contagem_duplicadas = np.bincount(df["arquivo"][duplicadas], minlength=len(lidos))
+        df = df[~duplicadas]
+        df = df.iloc[np.argsort(df["data"].to_numpy(), kind='stable')]
 
+        # Uma única passada de categorização para o lote inteiro
+        if len(df) >= LIMITE_LINHAS_PARALELO:
+            with etapa("processamento_paralelo"):
+                movimentacoes = processar_em_paralelo(df, partial(montar_movimentacoes, confianca=confianca))
+        else:
+            movimentacoes = montar_movimentacoes(df, confianca)
+        metricas.incrementar("stratfy_linhas_processadas_total", len(movimentacoes), rota=request.path)
+        contagem_movimentacoes = np.bincount(df["arquivo"], minlength=len(lidos))
+        for indice, item in enumerate(resumo):
+            item["movimentacoes"] = int(contagem_movimentacoes[indice])
+            item["duplicadas"] = int(contagem_duplicadas[indice])
+
+        return jsonify({'arquivos': resumo, 'movimentacoes': movimentacoes,
+                        'duplicadas_removidas': int(contagem_duplicadas.sum())})
+
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         traceback.print_exc()
         return jsonify({'erro': str(e)}), 500
 
+@app.route('/api/correcoes', methods=['POST'])
+def receber_correcoes():
+    """Recebe um lote de categorias corrigidas pelos usuários e atualiza o modelo sem reiniciar a API.
+
+    Corpo: lista de {"descricao": ..., "categoria": nome} ou {"descricao": ..., "categoriaId": id}.
+    As correções valem por cima do modelo servido; as demais previsões não mudam.
+    """
+    global modelo_categorizador, mtime_correcoes
+
+    correcoes = request.get_json(silent=True)
+    if not isinstance(correcoes, list) or not correcoes:
+        return jsonify({'erro': 'Envie uma lista de correções'}), 400
+
+    categoria_id_para_nome = {id_categoria: nome for nome, id_categoria in categoria_nome_para_id.items()}
+    descricoes, categorias = [], []
+    for correcao in correcoes:
+        if not isinstance(correcao, dict):
+            return jsonify({'erro': f'Correção inválida: {correcao}'}), 400
+        descricao = str(correcao.get("descricao") or "").strip()
+        categoria = correcao.get("categoria") or categoria_id_para_nome.get(correcao.get("categoriaId"))
+        if not descricao or categoria not in categoria_nome_para_id:
+            return jsonify({'erro': f'Correção inválida: {correcao}'}), 400
+        descricoes.append(descricao)
+        categorias.append(categoria)
+
+    if modelo_base is None:
+        return jsonify({'erro': 'Modelo de categorização não carregado'}), 503
+
+    try:
+        with lock_modelo:
+            # Sob um lock entre processos, relendo o histórico: outro worker pode ter acabado de registrar
+            # correções
+            novo_modelo, mtime = aplicar_correcoes(descricoes, categorias, modelo_base, ARQUIVO_CORRECOES)
+
+            # Troca atômica: requisições em andamento continuam com o modelo anterior
+            modelo_categorizador = novo_modelo
+            mtime_correcoes = mtime
+
+        return jsonify({'aplicadas': len(descricoes), 'versao_modelo': versao_modelo(novo_modelo)})
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'erro': str(e)}), 500
+
+@app.route('/api/jobs/<id_tarefa>', methods=['GET'])
+def consultar_job(id_tarefa):
+    """Estado e progresso da tarefa; quando concluída, "resultado_url" aponta para as movimentações."""
+    tarefa = consultar_tarefa(id_tarefa)
+    if tarefa is None:
+        return jsonify({'erro': 'Tarefa não encontrada'}), 404
+    if tarefa.pop("arquivo_resultado", None):
+        tarefa["resultado_url"] = url_for('resultado_job', id_tarefa=id_tarefa)
+    return jsonify(tarefa)
+
+@app.route('/api/jobs/<id_tarefa>/resultado', methods=['GET'])
+def resultado_job(id_tarefa):
+    """Movimentações de uma tarefa concluída, enviadas direto do arquivo gravado."""
+    tarefa = consultar_tarefa(id_tarefa)
+    if tarefa is None or tarefa["estado"] != "concluida":
+        return jsonify({'erro': 'Resultado não encontrado'}), 404
+    return send_file(caminho_resultado_tarefa(id_tarefa), mimetype=MIME_JSON)
+
 if __name__ == "__main__":
-    app.run(port=8000, debug=True, use_reloader=False)
\ No newline at end of file
+    # Só para desenvolvimento local; em produção use servidor.py
+    app.run(port=int(os.environ.get('STRATFY_PORTA', 8000)))
@@ -0,0 +1,430 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from werkzeug.datastructures import FileStorage
+
+import api_csv
+from conversao import converter_datas, converter_valores
+from formato_colunar import MIME_ARROW, MIME_PARQUET, serializar_tabela, ler_tabela, tabela_para_dataframe
+from modelo_categorizacao import prever_categoria, treinar_modelo
+from reducao_series import reduzir_serie_temporal, LIMITE_PONTOS_PADRAO
+from rollups import (construir_rollup, filtrar_rollup, agregar_cartao_rollup, agregar_grafico_rollup,
+                     agregar_por_dia_rollup)
+
+# Os uploads repetem o mesmo arquivo; o cache de resultados faria a medida cronometrar só a leitura do disco
+api_csv.app.config['CACHE_RESULTADOS'] = False
+
+TREINO = pd.read_json('TreinoML.json')
+DESCRICOES_EXEMPLO = TREINO['descricao'].tolist()
+SUFIXOS_TIPO = ["Débito", "Crédito", "PIX", ""]
+
+# Layout do 'Exemplo Extrato.csv'; a suíte também gera outros layouts (ver gerar_layouts)
+LAYOUT_PADRAO = {"delimitador": ",", "encoding": "utf-8",
+                 "colunas": {"data": "Data", "descricao": "Descrição", "valor": "Valor"}}
+TAMANHO_BLOCO_GERACAO = 1_000_000
+TEMPO_MINIMO_COMPARACAO = 0.05
+
+
+def gerar_extrato(linhas, semente=42, layout=LAYOUT_PADRAO):
+    """Gera um extrato sintético em bytes.
+
+    As descrições são sorteadas por categoria do TreinoML.json (cada categoria com o mesmo peso), com um
+    sufixo de forma de pagamento. Com delimitador ";" os valores usam vírgula decimal, como nos bancos
+    brasileiros. A geração é vetorizada e feita em blocos, então escala até dezenas de milhões de linhas.
+    """
+    rng = np.random.default_rng(semente)
+    categorias = TREINO['categoria'].unique()
+    descricoes_por_categoria = [TREINO.loc[TREINO['categoria'] == categoria, 'descricao'].to_numpy(dtype=object)
+                                for categoria in categorias]
+    sufixos = np.array([f" - {sufixo}" if sufixo else "" for sufixo in SUFIXOS_TIPO], dtype=object)
+    colunas = layout["colunas"]
+    decimal = ',' if layout["delimitador"] == ';' else '.'
+
+    buffer = io.BytesIO()
+    for inicio in range(0, linhas, TAMANHO_BLOCO_GERACAO):
+        tamanho = min(TAMANHO_BLOCO_GERACAO, linhas - inicio)
+        sorteio_categorias = rng.integers(len(categorias), size=tamanho)
+        descricoes = np.empty(tamanho, dtype=object)
+        for indice, opcoes in enumerate(descricoes_por_categoria):
+            posicoes = np.flatnonzero(sorteio_categorias == indice)
+            descricoes[posicoes] = opcoes[rng.integers(len(opcoes), size=len(posicoes))]
+        sorteio_sufixos = rng.integers(len(sufixos), size=tamanho)
+        bloco = {
+            colunas["data"]: pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(365 * 5, size=tamanho), unit='D'),
+            colunas["descricao"]: descricoes + sufixos[sorteio_sufixos],
+            colunas["valor"]: np.round(rng.uniform(-2000, 5000, size=tamanho), 2),
+        }
+        if "tipo" in colunas:
+            bloco[colunas["tipo"]] = np.array(["Débito", "Crédito", "Pix", "Pix"], dtype=object)[sorteio_sufixos]
+        pd.DataFrame(bloco).to_csv(buffer, sep=layout["delimitador"], encoding=layout["encoding"], index=False,
+                                   header=inicio == 0, date_format='%Y-%m-%d', float_format='%.2f', decimal=decimal)
+    return buffer.getvalue()
+
+
+def gerar_csv(linhas, semente=42):
+    """Gera um extrato sintético no formato do 'Exemplo Extrato.csv'."""
+    return gerar_extrato(linhas, semente)
+
+
+def gerar_layouts(quantidade, semente=42):
+    """Sorteia layouts de extrato variando delimitador, encoding e nomes de colunas (de `sinonimos_colunas`).
+
+    Só entram combinações que a detecção de colunas resolve corretamente.
+    """
+    rnd = random.Random(semente)
+    layouts = [LAYOUT_PADRAO]
+    while len(layouts) < quantidade:
+        campos = ["data", "descricao", "valor"] + (["tipo"] if rnd.random() < 0.5 else [])
+        colunas = {campo: rnd.choice(api_csv.sinonimos_colunas[campo]) for campo in campos}
+        colunas = {campo: nome.title() if rnd.random() < 0.5 else nome for campo, nome in colunas.items()}
+        cabecalho = tuple(nome.strip().lower() for nome in colunas.values())
+        if dict(api_csv.resolver_colunas(cabecalho)) != {campo: nome.lower() for campo, nome in colunas.items()}:
+            continue
+        layouts.append({"delimitador": rnd.choice([",", ";", "\t"]), "encoding": rnd.choice(["utf-8", "latin1"]),
+                        "colunas": colunas})
+    return layouts
+
+
+def descrever_layout(layout):
+    delimitador = {"\t": "tab"}.get(layout["delimitador"], layout["delimitador"])
+    return f"{delimitador} {layout['encoding']} {'/'.join(layout['colunas'].values())}"
+
+
+def montar_movimentacoes_linha_a_linha(df):
+    """Implementação anterior (df.iterrows + predict por linha), mantida apenas como referência."""
+    movimentacoes = []
+    for _, row in df.iterrows():
+        descricao = str(row["descricao"]).strip()
+        try:
+            valor = float(str(row["valor"]).replace(',', '.'))
+        except ValueError:
+            continue
+        if "tipo" in row and pd.notna(row["tipo"]):
+            tipo_detectado = str(row["tipo"]).strip()
+        else:
+            tipo_detectado = api_csv.inferir_tipo(descricao)
+        categoria_nome_predita = prever_categoria(api_csv.modelo_categorizador, descricao)
+        movimentacoes.append({
+            "Descricao": descricao,
+            "Valor": valor,
+            "Tipo": tipo_detectado,
+            "DataMovimentacao": row["data"].date().isoformat(),
+            "Categoria": {"Nome": categoria_nome_predita, "Id": api_csv.categoria_nome_para_id.get(categoria_nome_predita)}
+        })
+    return movimentacoes
+
+
+def preparar_df(conteudo):
+    df = pd.read_csv(io.BytesIO(conteudo))
+    mapeadas = api_csv.detectar_colunas(df)
+    df = df.rename(columns={coluna: campo for campo, coluna in mapeadas.items()})
+    df["data"] = pd.to_datetime(df["data"], errors='coerce')
+    return df.dropna(subset=["descricao", "valor", "data"])
+
+
+def cronometrar(funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def benchmark_categorizacao(linhas):
+    conteudo = gerar_csv(linhas)
+    df = preparar_df(conteudo)
+
+    antes, tempo_antes = cronometrar(montar_movimentacoes_linha_a_linha, df)
+    depois, tempo_depois = cronometrar(api_csv.montar_movimentacoes, df)
+    if antes != depois:
+        raise AssertionError("Resultados divergentes entre a versão por linha e a vetorizada")
+
+    cliente = api_csv.app.test_client()
+    resposta, tempo_endpoint = cronometrar(
+        lambda: cliente.post('/api/uploadcsv', data={'file': (io.BytesIO(conteudo), 'extrato.csv')},
+                             content_type='multipart/form-data')
+    )
+    if resposta.status_code != 200:
+        raise AssertionError(f"Falha no upload: {resposta.status_code} {resposta.get_data(as_text=True)[:200]}")
+
+    print(f"Linhas: {linhas}")
+    print(f"Por linha (iterrows):  {tempo_antes:8.2f}s  {linhas / tempo_antes:12.0f} linhas/s")
+    print(f"Vetorizado:            {tempo_depois:8.2f}s  {linhas / tempo_depois:12.0f} linhas/s")
+    print(f"/api/uploadcsv:        {tempo_endpoint:8.2f}s  {linhas / tempo_endpoint:12.0f} linhas/s")
+    print(f"Ganho:                 {tempo_antes / tempo_depois:8.1f}x")
+
+
+def inferir_tipo_com_re_search(descricao):
+    """Implementação anterior de inferir_tipo (um re.search por padrão), mantida apenas como referência."""
+    desc = str(descricao).lower()
+    for tipo, padrao in api_csv.padroes_tipo.items():
+        if re.search(padrao, desc):
+            return tipo
+    return "Outros"
+
+
+def detectar_colunas_sem_cache(df):
+    """Implementação anterior de detectar_colunas (regex montada a cada chamada), mantida apenas como referência."""
+    df.columns = df.columns.str.strip().str.lower()
+    colunas_detectadas = {}
+    for chave, lista_sinonimos in api_csv.sinonimos_colunas.items():
+        match = df.columns[df.columns.str.contains('|'.join(map(re.escape, lista_sinonimos)), na=False)]
+        if not match.empty:
+            colunas_detectadas[chave] = match[0]
+    return colunas_detectadas
+
+
+def benchmark_regras(linhas, repeticoes_cabecalho=10_000):
+    descricoes = pd.read_csv(io.BytesIO(gerar_csv(linhas)))["Descrição"]
+
+    antes, tempo_antes = cronometrar(lambda: descricoes.map(inferir_tipo_com_re_search))
+    por_linha, tempo_por_linha = cronometrar(lambda: descricoes.map(api_csv.inferir_tipo))
+    depois, tempo_depois = cronometrar(api_csv.inferir_tipos, descricoes)
+    if not (antes.equals(por_linha) and antes.tolist() == depois.tolist()):
+        raise AssertionError("Resultados divergentes entre as implementações de inferência de tipo")
+
+    print(f"Inferência de tipo ({linhas} linhas)")
+    print(f"re.search por linha:        {tempo_antes:8.3f}s  {linhas / tempo_antes:12.0f} linhas/s")
+    print(f"Regex combinada por linha:  {tempo_por_linha:8.3f}s  {linhas / tempo_por_linha:12.0f} linhas/s")
+    print(f"Regex combinada vetorizada: {tempo_depois:8.3f}s  {linhas / tempo_depois:12.0f} linhas/s")
+
+    df = pd.DataFrame(columns=["Data Lançamento", "Histórico", "Valor (R$)", "Tipo de lançamento"])
+    _, tempo_sem_cache = cronometrar(
+        lambda: [detectar_colunas_sem_cache(df) for _ in range(repeticoes_cabecalho)])
+    _, tempo_com_cache = cronometrar(
+        lambda: [api_csv.detectar_colunas(df) for _ in range(repeticoes_cabecalho)])
+
+    print(f"Detecção de colunas ({repeticoes_cabecalho} cabeçalhos)")
+    print(f"Sem cache:                  {tempo_sem_cache * 1e6 / repeticoes_cabecalho:8.1f} µs/arquivo")
+    print(f"Com cache por cabeçalho:    {tempo_com_cache * 1e6 / repeticoes_cabecalho:8.1f} µs/arquivo")
+
+
+def converter_valor_linha_a_linha(valor):
+    """Conversão anterior do valor (por linha, só troca vírgula por ponto), mantida apenas como referência."""
+    try:
+        return float(str(valor).replace(',', '.'))
+    except ValueError:
+        return np.nan
+
+
+def benchmark_conversao(linhas, semente=42):
+    """Datas dd/mm/aaaa e valores no padrão brasileiro ("R$ -1.234,56"): inferência por elemento x formato detectado."""
+    rng = np.random.default_rng(semente)
+    dias = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(365 * 5, size=linhas), unit='D')
+    datas = pd.Series(dias.strftime('%d/%m/%Y'), dtype=object)
+    centavos = rng.integers(-200_000, 500_000, size=linhas)
+    valores = pd.Series([f"R$ {'-' if c < 0 else ''}{abs(c) // 100:,}".replace(',', '.') + f",{abs(c) % 100:02d}"
+                         for c in centavos.tolist()], dtype=object)
+
+    datas_antes, tempo_datas_antes = cronometrar(lambda: pd.to_datetime(datas, errors='coerce'))
+    valores_antes, tempo_valores_antes = cronometrar(lambda: valores.map(converter_valor_linha_a_linha))
+    datas_depois, tempo_datas_depois = cronometrar(converter_datas, datas)
+    valores_depois, tempo_valores_depois = cronometrar(converter_valores, valores)
+    if not (datas_depois.to_numpy() == dias.to_numpy()).all() or not np.allclose(valores_depois * 100, centavos):
+        raise AssertionError("Conversão vetorizada divergente dos valores gerados")
+
+    corretas_antes = (datas_antes.to_numpy() == dias.to_numpy()).mean()
+    print(f"Conversão de datas e valores ({linhas} linhas)")
+    print(f"Datas sem formato:          {tempo_datas_antes:8.3f}s  {corretas_antes:7.1%} corretas")
+    print(f"Datas com formato detectado:{tempo_datas_depois:8.3f}s  {1:7.1%} corretas")
+    print(f"Valores por linha:          {tempo_valores_antes:8.3f}s  {valores_antes.notna().mean():7.1%} convertidos")
+    print(f"Valores vetorizados:        {tempo_valores_depois:8.3f}s  {1:7.1%} convertidos")
+
+
+def benchmark_formato(linhas):
+    df = preparar_df(gerar_csv(linhas))
+    movimentacoes = api_csv.montar_movimentacoes(df)
+    tabela = api_csv.montar_tabela_movimentacoes(df)
+
+    corpo_json, tempo_codificar_json = cronometrar(lambda: json.dumps(movimentacoes).encode('utf-8'))
+    _, tempo_decodificar_json = cronometrar(lambda: pd.json_normalize(json.loads(corpo_json)))
+
+    print(f"Formato das movimentações ({linhas} linhas)")
+    print(f"{'':10} {'tamanho':>12} {'codificar':>10} {'decodificar':>12}")
+    print(f"{'JSON':10} {len(corpo_json) / 1024:9.0f} KB {tempo_codificar_json:9.3f}s {tempo_decodificar_json:11.3f}s")
+    for nome, formato in [('Arrow', MIME_ARROW), ('Parquet', MIME_PARQUET)]:
+        corpo, tempo_codificar = cronometrar(serializar_tabela, tabela, formato)
+        decodificado, tempo_decodificar = cronometrar(lambda: tabela_para_dataframe(ler_tabela(corpo, formato)))
+        if decodificado["Valor"].tolist() != [mov["Valor"] for mov in movimentacoes]:
+            raise AssertionError(f"Valores divergentes entre JSON e {nome}")
+        print(f"{nome:10} {len(corpo) / 1024:9.0f} KB {tempo_codificar:9.3f}s {tempo_decodificar:11.3f}s")
+
+
+def como_upload(conteudo):
+    """FileStorage sobre um arquivo temporário em modo binário, como o Werkzeug entrega os uploads."""
+    arquivo = tempfile.SpooledTemporaryFile(mode='w+b')
+    arquivo.write(conteudo)
+    arquivo.seek(0)
+    return FileStorage(stream=arquivo, filename='extrato.csv')
+
+
+def medir(funcao, repeticoes):
+    """Menor tempo entre `repeticoes` execuções (o mínimo é o menos sujeito a ruído)."""
+    tempos = []
+    for _ in range(repeticoes):
+        resultado, tempo = cronometrar(funcao)
+        tempos.append(tempo)
+    return resultado, min(tempos)
+
+
+def montar_dataframe_dashboard(movimentacoes):
+    """DataFrame no mesmo formato que a dashboard monta a partir do backend."""
+    df = pd.json_normalize(movimentacoes).drop(columns=["Categoria.Id"]).rename(columns={"Categoria.Nome": "Categoria"})
+    df.columns = df.columns.str.lower()
+    df["datamovimentacao"] = pd.to_datetime(df["datamovimentacao"])
+    return df
+
+
+def benchmark_dashboard(df, repeticoes):
+    """Agregações da dashboard: caminho direto no DataFrame e caminho pelos rollups."""
+    inicio, fim = df["datamovimentacao"].min(), df["datamovimentacao"].max()
+    rollup, tempo_rollup = medir(lambda: construir_rollup(df), repeticoes)
+
+    def agregar_direto():
+        filtrado = df[(df["datamovimentacao"] >= inicio) & (df["datamovimentacao"] <= fim)]
+        return (filtrado["valor"].sum(), filtrado.groupby("categoria")["valor"].sum(),
+                filtrado.groupby(filtrado["datamovimentacao"].dt.strftime('%d-%m-%Y'))["valor"].sum(),
+                filtrado.groupby(["categoria", "tipo"]).size())
+
+    def agregar_rollup():
+        filtrado = filtrar_rollup(rollup, inicio, fim, None)
+        por_data = agregar_grafico_rollup(filtrado, "datamovimentacao", "valor", "data", '%d-%m-%Y')
+        return (agregar_cartao_rollup(filtrado, "valor", "soma"),
+                agregar_grafico_rollup(filtrado, "categoria", "valor", "categoria", None),
+                reduzir_serie_temporal(por_data, lambda: agregar_por_dia_rollup(filtrado, "valor"), "valor",
+                                       '%d-%m-%Y', "linha", LIMITE_PONTOS_PADRAO),
+                agregar_grafico_rollup(filtrado, "categoria", "tipo", "empilhado", None))
+
+    _, tempo_direto = medir(agregar_direto, repeticoes)
+    _, tempo_com_rollup = medir(agregar_rollup, repeticoes)
+    return {"dashboard_rollup_construcao": tempo_rollup, "dashboard_agregacoes_direto": tempo_direto,
+            "dashboard_agregacoes_rollup": tempo_com_rollup}
+
+
+def benchmark_suite(tamanhos, quantidade_layouts, repeticoes, semente=42):
+    """Mede cada etapa para cada tamanho e layout. Retorna a lista de resultados."""
+    resultados = []
+
+    def registrar(cenario, linhas, layout, segundos):
+        resultados.append({"cenario": cenario, "linhas": linhas, "layout": layout, "segundos": segundos,
+                           "linhas_por_segundo": linhas / segundos if segundos else None})
+        print(f"{cenario:30} {linhas:>10} {segundos:10.4f}s  {layout}")
+
+    treinar_modelo(TREINO)  # aquecimento: o import do sklearn não entra na medida
+    _, tempo_treino = medir(lambda: treinar_modelo(TREINO), repeticoes)
+    registrar("treinar_modelo", len(TREINO), "TreinoML.json", tempo_treino)
+
+    cliente = api_csv.app.test_client()
+    for linhas in tamanhos:
+        for indice, layout in enumerate(gerar_layouts(quantidade_layouts, semente)):
+            nome_layout = descrever_layout(layout)
+            conteudo = gerar_extrato(linhas, semente + indice, layout)
+
+            df, tempo = medir(lambda: api_csv.ler_csv(como_upload(conteudo)), repeticoes)
+            registrar("ler_csv", linhas, nome_layout, tempo)
+
+            # Sem o cache por cabeçalho, que mediria só a consulta ao dicionário
+            def detectar():
+                api_csv.resolver_colunas.cache_clear()
+                return api_csv.detectar_colunas(df.copy(deep=False))
+            _, tempo = medir(detectar, repeticoes)
+            registrar("detectar_colunas", linhas, nome_layout, tempo)
+
+            def enviar():
+                resposta = cliente.post('/api/uploadcsv', data={'file': (io.BytesIO(conteudo), 'extrato.csv')},
+                                        content_type='multipart/form-data')
+                if resposta.status_code != 200:
+                    raise AssertionError(f"Falha no upload ({nome_layout}): {resposta.status_code} "
+                                         f"{resposta.get_data(as_text=True)[:200]}")
+                return resposta.get_json()
+            movimentacoes, tempo = medir(enviar, repeticoes)
+            registrar("uploadcsv", linhas, nome_layout, tempo)
+
+        # Dashboard: independe do layout, usa o resultado do último upload
+        for cenario, tempo in benchmark_dashboard(montar_dataframe_dashboard(movimentacoes), repeticoes).items():
+            registrar(cenario, linhas, "", tempo)
+    return resultados
+
+
+def versao_codigo():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def salvar_resultados(resultados, caminho):
+    relatorio = {
+        "commit": versao_codigo(),
+        "data": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "plataforma": platform.platform(),
+        "processadores": os.cpu_count(),
+        "resultados": resultados,
+    }
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {caminho}")
+
+
+def comparar_resultados(resultados, caminho_anterior, tolerancia=0.25):
+    """Compara com um relatório anterior; tempos acima da tolerância são marcados como regressão.
+
+    Medidas abaixo de TEMPO_MINIMO_COMPARACAO são só exibidas: nessa escala o ruído domina.
+    """
+    with open(caminho_anterior, 'r', encoding='utf-8') as arquivo:
+        anterior = json.load(arquivo)
+    tempos_anteriores = {(r["cenario"], r["linhas"], r["layout"]): r["segundos"] for r in anterior["resultados"]}
+
+    print(f"Comparação com {anterior.get('commit') or caminho_anterior}")
+    regressoes = 0
+    for resultado in resultados:
+        antes = tempos_anteriores.get((resultado["cenario"], resultado["linhas"], resultado["layout"]))
+        if not antes:
+            continue
+        razao = resultado["segundos"] / antes
+        marca = "REGRESSÃO" if razao > 1 + tolerancia and resultado["segundos"] >= TEMPO_MINIMO_COMPARACAO else ""
+        regressoes += bool(marca)
+        print(f"{resultado['cenario']:30} {resultado['linhas']:>10} {razao:8.2f}x  {marca} {resultado['layout']}")
+    return regressoes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark da categorização de extratos.")
+    parser.add_argument('--linhas', type=int, default=100_000)
+    parser.add_argument('--cenario', choices=['categorizacao', 'regras', 'conversao', 'formato', 'suite'], default='categorizacao')
+    parser.add_argument('--tamanhos', default='1000,100000',
+                        help="Suíte: tamanhos dos extratos, separados por vírgula (ex.: 1000,100000,10000000)")
+    parser.add_argument('--layouts', type=int, default=4, help="Suíte: quantos layouts de extrato gerar")
+    parser.add_argument('--repeticoes', type=int, default=3, help="Suíte: execuções por medida (vale a menor)")
+    parser.add_argument('--saida', help="Suíte: arquivo JSON de resultados (padrão: benchmark_<commit>.json)")
+    parser.add_argument('--comparar', help="Suíte: JSON de uma execução anterior para comparar")
+    parser.add_argument('--tolerancia', type=float, default=0.25,
+                        help="Suíte: aumento relativo de tempo aceito antes de acusar regressão")
+    args = parser.parse_args()
+
+    if args.cenario == 'regras':
+        benchmark_regras(args.linhas)
+    elif args.cenario == 'conversao':
+        benchmark_conversao(args.linhas)
+    elif args.cenario == 'formato':
+        benchmark_formato(args.linhas)
+    elif args.cenario == 'suite':
+        tamanhos = [int(tamanho) for tamanho in args.tamanhos.split(',')]
+        resultados = benchmark_suite(tamanhos, args.layouts, args.repeticoes)
+        salvar_resultados(resultados, args.saida or f"benchmark_{versao_codigo() or 'local'}.json")
+        if args.comparar and comparar_resultados(resultados, args.comparar, args.tolerancia):
+            sys.exit(1)
+    else:
+        benchmark_categorizacao(args.linhas)
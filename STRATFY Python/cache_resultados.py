@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+
+# Cache em disco das respostas de /api/uploadcsv, por hash do arquivo enviado. Um reenvio do mesmo
+# extrato devolve a resposta gravada sem ler nem categorizar de novo. Fica em disco para valer para
+# todos os workers do servidor; o LRU usa o mtime dos arquivos, atualizado a cada acerto.
+#
+# As respostas são extratos categorizados dos usuários: a pasta (STRATFY_PASTA_CACHE_RESULTADOS, ou uma
+# pasta por usuário do sistema no diretório temporário) só é acessível ao dono (0o700).
+PASTA_CACHE_RESULTADOS = (os.environ.get('STRATFY_PASTA_CACHE_RESULTADOS')
+                          or os.path.join(tempfile.gettempdir(), f"stratfy_resultados_{getattr(os, 'getuid', lambda: '')()}"))
+TAMANHO_MAXIMO_CACHE_RESULTADOS = int(os.environ.get('STRATFY_CACHE_RESULTADOS_MB', 1024)) * 1024 * 1024
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+
+def hash_arquivo(stream):
+    """SHA-256 do conteúdo, lido em blocos; o stream volta ao início."""
+    hasher = hashlib.sha256()
+    for bloco in iter(lambda: stream.read(TAMANHO_BLOCO_HASH), b''):
+        hasher.update(bloco)
+    stream.seek(0)
+    return hasher.hexdigest()
+
+
+class CacheResultados:
+    """Respostas prontas (corpo em bytes e cabeçalhos) em arquivos, com limite de tamanho total e
+    descarte dos menos usados.
+
+    Corpo e cabeçalhos ficam no mesmo arquivo, para que um nunca seja descartado sem o outro.
+    """
+
+    def __init__(self, pasta=PASTA_CACHE_RESULTADOS, tamanho_maximo=TAMANHO_MAXIMO_CACHE_RESULTADOS):
+        self.pasta = pasta
+        self.tamanho_maximo = tamanho_maximo
+        self._lock = threading.Lock()
+        self._pasta_pronta = False
+
+    def _preparar_pasta(self):
+        if self._pasta_pronta:
+            return
+        os.makedirs(self.pasta, mode=0o700, exist_ok=True)
+        # Se a pasta já existia com outra permissão (ou de outro usuário, quando o chmod falha)
+        os.chmod(self.pasta, 0o700)
+        self._pasta_pronta = True
+
+    def chave(self, stream, *componentes):
+        """Chave a partir do conteúdo do arquivo e do que mais mudar a resposta (versão do modelo, formato)."""
+        return hashlib.sha256('|'.join([hash_arquivo(stream), *map(str, componentes)]).encode('utf-8')).hexdigest()
+
+    def _caminho(self, chave):
+        return os.path.join(self.pasta, f"{chave}.bin")
+
+    def obter(self, chave):
+        """Retorna (conteudo, cabecalhos) ou None se a chave não estiver no cache."""
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, 'rb') as arquivo:
+                # Formato: tamanho dos cabeçalhos (4 bytes), cabeçalhos em JSON e o corpo
+                tamanho_cabecalhos, = struct.unpack('>I', arquivo.read(4))
+                cabecalhos = json.loads(arquivo.read(tamanho_cabecalhos))
+                conteudo = arquivo.read()
+            os.utime(caminho)
+        except (OSError, ValueError, struct.error):
+            return None
+        return conteudo, cabecalhos
+
+    def guardar(self, chave, conteudo, cabecalhos=None):
+        cabecalhos = json.dumps(cabecalhos or {}).encode('utf-8')
+        if len(conteudo) + len(cabecalhos) > self.tamanho_maximo:
+            return
+        self._preparar_pasta()
+        caminho = self._caminho(chave)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporario, 'wb') as arquivo:
+            arquivo.write(struct.pack('>I', len(cabecalhos)))
+            arquivo.write(cabecalhos)
+            arquivo.write(conteudo)
+        os.replace(temporario, caminho)
+        self.descartar_excedente()
+
+    def descartar_excedente(self):
+        """Remove os arquivos usados há mais tempo até o total caber em `tamanho_maximo`."""
+        with self._lock:
+            entradas = []
+            for nome in os.listdir(self.pasta):
+                if not nome.endswith('.bin'):
+                    continue
+                try:
+                    info = os.stat(os.path.join(self.pasta, nome))
+                except OSError:
+                    continue
+                entradas.append((info.st_mtime, info.st_size, nome))
+
+            total = sum(tamanho for _, tamanho, _ in entradas)
+            for _, tamanho, nome in sorted(entradas):
+                if total <= self.tamanho_maximo:
+                    break
+                try:
+                    os.remove(os.path.join(self.pasta, nome))
+                except OSError:
+                    pass
+                total -= tamanho
+
+    def limpar(self):
+        with self._lock:
+            for nome in os.listdir(self.pasta) if os.path.isdir(self.pasta) else []:
+                if nome.endswith('.bin'):
+                    os.remove(os.path.join(self.pasta, nome))
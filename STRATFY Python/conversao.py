@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Conversão vetorizada das colunas de data e valor dos extratos. O formato de cada coluna (formato da
+# data, separador decimal) é detectado uma única vez, a partir de uma amostra; depois a coluna inteira é
+# convertida numa passada com o formato explícito. Sem formato, o pandas adivinharia pelo primeiro
+# elemento (lendo "01/02/2025" como 2 de janeiro) e anularia tudo o que não seguisse esse palpite.
+#
+# Extratos repetem muito as mesmas datas, então só as datas distintas passam pelo strptime. Os valores
+# são tratados com os kernels de texto do Arrow, sem criar um objeto Python por linha.
+TAMANHO_AMOSTRA_CONVERSAO = 1000
+LIMITE_EXEMPLOS_INVALIDAS = 20
+
+# Em caso de empate na amostra vale o primeiro da lista: datas ambíguas são lidas como dia/mês
+FORMATOS_DATA = [
+    "%Y-%m-%d",
+    "%d/%m/%Y",
+    "%d/%m/%y",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%Y/%m/%d",
+    "%m/%d/%Y",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+]
+
+# Regex no dialeto RE2 do Arrow. Símbolo da moeda e espaços (inclusive o não separável) somem antes da
+# conversão; depois disso só passa o que for um número no formato do float do Python.
+PADRAO_MOEDA_ESPACOS = r'(?i)r\$|[\s\x{00A0}]'
+PADRAO_NUMERO = r'^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$'
+
+
+def amostra_coluna(valores, tamanho=TAMANHO_AMOSTRA_CONVERSAO):
+    """Até `tamanho` valores distintos e não vazios do começo da coluna, como texto."""
+    textos = valores.dropna().head(tamanho * 10).astype(str).str.strip()
+    return textos[textos != ''].drop_duplicates().head(tamanho)
+
+
+def detectar_formato_data(valores):
+    """Formato de FORMATOS_DATA que converte mais valores da amostra, ou None se nenhum servir."""
+    amostra = amostra_coluna(valores)
+    melhor, convertidos_melhor = None, 0
+    for formato in FORMATOS_DATA:
+        convertidos = pd.to_datetime(amostra, format=formato, errors='coerce').notna().sum()
+        if convertidos > convertidos_melhor:
+            melhor, convertidos_melhor = formato, convertidos
+    return melhor
+
+
+def converter_datas(valores, formato=None):
+    """Converte a coluna de datas numa passada. Valores inválidos viram NaT."""
+    if pd.api.types.is_datetime64_any_dtype(valores):
+        return valores
+    codigos, distintos = pd.factorize(valores)
+    distintos = pd.Series(distintos, dtype=object)
+    formato = formato or detectar_formato_data(distintos)
+    textos = distintos.astype(str).str.strip()
+    if formato is None:
+        # Nenhum formato conhecido: inferência por elemento, ainda preferindo dia/mês
+        convertidos = pd.to_datetime(textos, errors='coerce', format='mixed', dayfirst=True)
+    else:
+        convertidos = pd.to_datetime(textos, errors='coerce', format=formato)
+    # O código -1 (valor ausente) aponta para o NaT acrescentado no fim
+    datas = np.append(convertidos.to_numpy(dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))[codigos]
+    return pd.Series(datas, index=valores.index, name=valores.name)
+
+
+def textos_arrow(valores):
+    return pa.array(valores.astype(str).to_numpy(), type=pa.string())
+
+
+def limpar_valores(textos):
+    """Tira moeda e espaços e leva o sinal para a frente ("(30,00)" e "30,00-" viram "-30,00")."""
+    textos = pc.replace_substring(pc.replace_substring_regex(textos, PADRAO_MOEDA_ESPACOS, ''), '−', '-')
+    # As regex de sinal só rodam se a coluna tiver algum valor nesses formatos
+    if pc.any(pc.starts_with(textos, '(')).as_py():
+        textos = pc.replace_substring_regex(textos, r'^\((.*)\)$', r'-\1')
+    if pc.any(pc.ends_with(textos, '-')).as_py():
+        textos = pc.replace_substring_regex(textos, r'^(.*[\d.,])-$', r'-\1')
+    return textos
+
+
+def detectar_separador_decimal(valores):
+    """Separador decimal (',' ou '.') mais provável para a coluna, a partir de uma amostra.
+
+    Com os dois separadores no mesmo valor, o último é o decimal; um separador repetido é o de milhar.
+    "1.234" e "1,234" são ambíguos e só decidem se não houver outra evidência (e aí o separador presente
+    é tratado como decimal).
+    """
+    amostra = limpar_valores(textos_arrow(amostra_coluna(valores))).to_pandas()
+    virgulas, pontos = amostra.str.count(','), amostra.str.count(r'\.')
+    ultima_virgula, ultimo_ponto = amostra.str.rfind(','), amostra.str.rfind('.')
+    ambiguos = ((virgulas + pontos) == 1) & amostra.str.contains(r'[.,]\d{3}$')
+
+    decimal_virgula = (
+        ((virgulas > 0) & (pontos > 0) & (ultima_virgula > ultimo_ponto))
+        | ((virgulas == 1) & (pontos == 0) & ~ambiguos)
+        | ((pontos > 1) & (virgulas == 0))
+    )
+    decimal_ponto = (
+        ((virgulas > 0) & (pontos > 0) & (ultimo_ponto > ultima_virgula))
+        | ((pontos == 1) & (virgulas == 0) & ~ambiguos)
+        | ((virgulas > 1) & (pontos == 0))
+    )
+    if decimal_virgula.sum() == decimal_ponto.sum() == 0:
+        decimal_virgula, decimal_ponto = ambiguos & (virgulas == 1), ambiguos & (pontos == 1)
+    return ',' if decimal_virgula.sum() > decimal_ponto.sum() else '.'
+
+
+def converter_valores(valores, decimal=None):
+    """Converte a coluna de valores para float numa passada ("1.234,56", "R$ -30,00", "-30.00").
+
+    Valores inválidos viram NaN.
+    """
+    if pd.api.types.is_numeric_dtype(valores):
+        return valores.astype(float)
+    decimal = decimal or detectar_separador_decimal(valores)
+    milhar = '.' if decimal == ',' else ','
+    textos = pc.replace_substring(limpar_valores(textos_arrow(valores)), milhar, '')
+    if decimal == ',':
+        textos = pc.replace_substring(textos, ',', '.')
+    numeros = pc.cast(pc.if_else(pc.match_substring_regex(textos, PADRAO_NUMERO), textos, None), pa.float64())
+    return pd.Series(numeros.to_numpy(zero_copy_only=False), index=valores.index, name=valores.name)
+
+
+def relatorio_invalidas(originais, convertidos, limite=LIMITE_EXEMPLOS_INVALIDAS):
+    """Linhas preenchidas que não puderam ser convertidas, de uma vez para a coluna toda.
+
+    Retorna None se não houver nenhuma; as linhas são numeradas como no arquivo (o cabeçalho é a linha 1).
+    """
+    invalidas = convertidos.isna().to_numpy() & originais.notna().to_numpy()
+    candidatas = np.flatnonzero(invalidas)
+    invalidas[candidatas] = (originais.iloc[candidatas].astype(str).str.strip() != '').to_numpy()
+    quantidade = int(invalidas.sum())
+    if not quantidade:
+        return None
+    # Pela posição, não pelo índice: o pandas pode ter usado a primeira coluna como índice
+    posicoes = np.flatnonzero(invalidas)[:limite]
+    exemplos = originais.iloc[posicoes]
+    return {
+        "quantidade": quantidade,
+        "linhas": (posicoes + 2).tolist(),
+        "exemplos": exemplos.astype(str).str.slice(0, 100).tolist(),
+    }
@@ -1,9 +1,17 @@
 import streamlit as st
 import pandas as pd
 import requests
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-import plotly.express as px
+import hashlib
+import time
+from requests.adapters import HTTPAdapter
+from rollups import (construir_rollup, filtrar_rollup, suporta_cartao, agregar_cartao_rollup,
+                     suporta_grafico, agregar_grafico_rollup, agregar_por_dia_rollup)
+from formato_colunar import (ler_tabela, metadados_tabela, tabela_para_dataframe, MIME_ARROW, MIME_PARQUET,
+                             MIME_JSON)
+from reducao_series import (LIMITE_PONTOS_PADRAO, TOP_N_PADRAO, TOP_N_PIZZA_PADRAO, top_n_com_outros,
+                            reduzir_tabela_categorias, reduzir_tabela_empilhada, reduzir_serie_temporal)
+# matplotlib e plotly são importados só quando um gráfico é desenhado (somam ~1 s na primeira execução
+# do script); uma dashboard só com cartões, ou que ainda está carregando, não paga por eles
 
 st.set_page_config(layout="wide")
 
@@ -21,6 +29,8 @@ def get_luminosity(hex_color):
 
 # Função para gerar paleta de cores ajustada para contraste
 def generate_contrasting_palette(base_hex_color, num_colors, reverse=False):
+    import matplotlib.colors as mcolors
+
     base_rgb = mcolors.to_rgb(base_hex_color)
     palette = []
     h, s, l = mcolors.rgb_to_hsv(base_rgb)
@@ -43,42 +53,217 @@ def generate_contrasting_palette(base_hex_color, num_colors, reverse=False):
 
     return palette
 
+# ====== Cache dos dados da dashboard ======
+URL_DASHBOARD_DATA = "http://localhost:5211/api/dashboarddata/{}"
+# Por quanto tempo os dados são reutilizados sem consultar o backend; depois disso
+# é feita uma requisição condicional (If-None-Match), que só traz o corpo se algo mudou
+TTL_DADOS_SEGUNDOS = 60
+
+# O backend pode responder em Arrow (movimentações em colunas tipadas); JSON continua aceito
+ACCEPT_DADOS = f"{MIME_ARROW}, {MIME_JSON};q=0.9"
+
+@st.cache_resource
+def obter_sessao():
+    """Sessão HTTP compartilhada entre os reruns, reaproveitando as conexões com o backend."""
+    sessao = requests.Session()
+    sessao.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=2))
+    return sessao
+
+@st.cache_resource
+def obter_cache_dashboards():
+    """Dados já carregados, por id da dashboard. Sobrevive aos reruns e é compartilhado entre as sessões."""
+    return {}
+
+def montar_dataframe(data):
+    df = pd.DataFrame(data["movimentacoes"])
+    df.columns = df.columns.str.lower()
+    if "datamovimentacao" in df.columns:
+        # Converte para datetime logo no início para consistência
+        df["datamovimentacao"] = pd.to_datetime(df["datamovimentacao"])
+    return df
+
+def montar_dataframe_colunar(tabela):
+    df = tabela_para_dataframe(tabela)
+    df.columns = df.columns.str.lower()
+    return df
+
+def carregar_dashboard(dashboard_id):
+    """Retorna {"data", "df", "versao"} da dashboard, ou None se o backend não a encontrar.
+
+    A versão é o ETag enviado pelo backend (ou um hash do corpo, se não houver ETag) e faz parte
+    da chave de todos os agregados memorizados abaixo.
+    """
+    cache = obter_cache_dashboards()
+    entrada = cache.get(dashboard_id)
+    agora = time.monotonic()
+    if entrada and agora - entrada["carregado_em"] < TTL_DADOS_SEGUNDOS:
+        return entrada
+
+    headers = {"Accept": ACCEPT_DADOS}
+    if entrada and entrada["etag"]:
+        headers["If-None-Match"] = entrada["etag"]
+    response = obter_sessao().get(URL_DASHBOARD_DATA.format(dashboard_id), headers=headers, timeout=30)
+
+    if response.status_code == 304 and entrada:
+        entrada["carregado_em"] = agora
+        return entrada
+    if response.status_code != 200:
+        cache.pop(dashboard_id, None)
+        return None
+
+    etag = response.headers.get("ETag")
+    formato = response.headers.get("Content-Type", "").split(";")[0].strip()
+    if formato in (MIME_ARROW, MIME_PARQUET):
+        # Caminho colunar: as movimentações chegam como arrays tipados e a definição da dashboard nos metadados
+        tabela = ler_tabela(response.content, formato)
+        data = metadados_tabela(tabela)
+        df = montar_dataframe_colunar(tabela)
+    else:
+        data = response.json()
+        df = montar_dataframe(data)
+    entrada = {
+        "data": data,
+        "df": df,
+        "rollup": construir_rollup(df),
+        "etag": etag,
+        "versao": etag or hashlib.sha256(response.content).hexdigest(),
+        "carregado_em": agora,
+    }
+    cache[dashboard_id] = entrada
+    return entrada
+
+def invalidar_dashboard(dashboard_id):
+    """Descarta os dados da dashboard; o próximo carregamento busca tudo de novo no backend."""
+    obter_cache_dashboards().pop(dashboard_id, None)
+
+# Os agregados abaixo são memorizados por versão dos dados + filtros + definição do gráfico/cartão.
+# Parâmetros com "_" não entram no hash: o DataFrame é identificado pela versão e pelos filtros.
+@st.cache_resource(max_entries=32)
+def filtrar_dataframe(versao, _df, data_inicio, data_fim, categorias, formato_exibicao):
+    """Aplica os filtros da barra lateral. O resultado é compartilhado e não deve ser alterado."""
+    df_filtrado = _df
+    if data_inicio is not None:
+        datas = _df["datamovimentacao"]
+        df_filtrado = _df[(datas >= pd.to_datetime(data_inicio)) & (datas <= pd.to_datetime(data_fim))]
+    if categorias is not None:
+        df_filtrado = df_filtrado[df_filtrado["categoria"].isin(categorias)]
+    df_filtrado = df_filtrado.copy()
+
+    if formato_exibicao is not None:
+        # Aplica o formato de exibição como uma nova coluna
+        # IMPORTANTE: Converte para string (object) para que o Plotly não tente reformatar
+        df_filtrado["data_exibicao"] = df_filtrado["datamovimentacao"].dt.strftime(formato_exibicao).astype(str)
+    else:
+        # Garante que 'data_exibicao' exista mesmo sem filtro de data
+        df_filtrado["data_exibicao"] = ""
+    return df_filtrado
+
+@st.cache_resource(max_entries=32)
+def filtrar_rollup_cache(versao, _rollup, data_inicio, data_fim, categorias):
+    return filtrar_rollup(_rollup, data_inicio, data_fim, categorias)
+
+@st.cache_data(max_entries=512)
+def agregar_cartao(versao, chave_filtros, _df_filtrado, _rollup_filtrado, campo, tipo_agregacao):
+    if _rollup_filtrado is not None and suporta_cartao(_rollup_filtrado, campo, tipo_agregacao):
+        return agregar_cartao_rollup(_rollup_filtrado, campo, tipo_agregacao)
+
+    if tipo_agregacao == "soma":
+        valor = _df_filtrado[campo].sum()
+        return valor.round(2)
+    elif tipo_agregacao == "media":
+        return _df_filtrado[campo].mean().round(2)
+    elif tipo_agregacao == "max":
+        return _df_filtrado[campo].max()
+    elif tipo_agregacao == "min":
+        return _df_filtrado[campo].min()
+    elif tipo_agregacao == "contagem":
+        return _df_filtrado[campo].nunique()
+    return "Agregação inválida"
+
+def _agregar_grafico_completo(chave_filtros, _df_filtrado, _rollup_filtrado, campo1, campo2, modo):
+    if _rollup_filtrado is not None and suporta_grafico(_rollup_filtrado, campo1, campo2, modo):
+        formato_exibicao = chave_filtros[3]
+        return agregar_grafico_rollup(_rollup_filtrado, campo1, campo2, modo, formato_exibicao)
+
+    if modo == "data":
+        # Ordenar antes de agrupar para manter a ordem cronológica
+        return _df_filtrado.sort_values(by="datamovimentacao").groupby("data_exibicao")[campo2].sum().reset_index()
+    if modo == "categoria":
+        return _df_filtrado.groupby(campo1)[campo2].sum().reset_index() # reset_index para ter colunas nomeadas
+    if modo == "empilhado":
+        return _df_filtrado.groupby([campo1, campo2]).size().reset_index(name='count')
+    if pd.api.types.is_numeric_dtype(_df_filtrado[campo2]):
+        return _df_filtrado.groupby(campo1)[campo2].sum().abs()
+    return _df_filtrado[campo1].value_counts().abs()
+
+@st.cache_data(max_entries=512)
+def agregar_grafico(versao, chave_filtros, _df_filtrado, _rollup_filtrado, campo1, campo2, modo,
+                    tipo=None, limite_pontos=LIMITE_PONTOS_PADRAO, top_n=TOP_N_PADRAO):
+    """Série/tabela agregada de um gráfico, já reduzida para desenhar.
+
+    modo: "data" (soma de campo2 por data de exibição), "categoria" (soma de campo2 por campo1),
+    "empilhado" (contagem por campo1 e campo2) ou "pizza" (soma absoluta ou contagem por campo1).
+    Usa o rollup quando o gráfico depende só de dia/categoria/tipo e valor.
+    Séries por data acima de `limite_pontos` são promovidas para semana/mês (e amostradas com LTTB
+    se for linha); eixos categóricos ficam com as `top_n` maiores entradas mais "Outros".
+    """
+    agregado = _agregar_grafico_completo(chave_filtros, _df_filtrado, _rollup_filtrado, campo1, campo2, modo)
+
+    if modo == "data":
+        def por_dia():
+            if _rollup_filtrado is not None and suporta_grafico(_rollup_filtrado, campo1, campo2, modo):
+                return agregar_por_dia_rollup(_rollup_filtrado, campo2)
+            return _df_filtrado.groupby("datamovimentacao")[campo2].sum()
+        return reduzir_serie_temporal(agregado, por_dia, campo2, chave_filtros[3], tipo, limite_pontos)
+    if modo == "categoria":
+        return reduzir_tabela_categorias(agregado, campo1, campo2, top_n)
+    if modo == "empilhado":
+        return reduzir_tabela_empilhada(agregado, campo1, campo2, top_n)
+    return top_n_com_outros(agregado, top_n)
+
+def limites_grafico(graf, tipo):
+    """Limite de pontos e top-N configurados no gráfico (LimitePontos/TopN), ou os padrões."""
+    limite_pontos = graf.get("limitePontos") or LIMITE_PONTOS_PADRAO
+    top_n = graf.get("topN") or (TOP_N_PIZZA_PADRAO if tipo == "pizza" else TOP_N_PADRAO)
+    return limite_pontos, top_n
+
 if dashboard_id:
-    url = f"http://localhost:5211/api/dashboarddata/{dashboard_id}"
-    response = requests.get(url)
+    dados_dashboard = carregar_dashboard(dashboard_id)
 
-    if response.status_code == 200:
-        data = response.json()
-        df = pd.DataFrame(data["movimentacoes"])
-        df.columns = df.columns.str.lower()
+    if dados_dashboard:
+        data = dados_dashboard["data"]
+        df = dados_dashboard["df"]
+        rollup = dados_dashboard["rollup"]
+        versao = dados_dashboard["versao"]
         st.title(f"Dashboard: {data['descricao']}")
 
         # ====== Filtros na barra lateral ======
         st.sidebar.header("Configurações")
 
+        if st.sidebar.button("Atualizar dados"):
+            invalidar_dashboard(dashboard_id)
+            st.rerun()
+
         # Expander para Filtros de Dados
         with st.sidebar.expander("Filtros de Dados"):
             # Filtro por data
+            data_inicio = data_fim = None
             if "datamovimentacao" in df.columns:
-                # Converte para datetime logo no início para consistência
-                df["datamovimentacao"] = pd.to_datetime(df["datamovimentacao"])
                 datas = df["datamovimentacao"]
                 data_inicio = st.date_input("Data inicial", datas.min())
                 data_fim = st.date_input("Data final", datas.max())
-                df_filtrado = df[(datas >= pd.to_datetime(data_inicio)) & (datas <= pd.to_datetime(data_fim))].copy()
-            else:
-                df_filtrado = df.copy()
 
             # Filtro por categoria
+            categorias_selecionadas = None
             if "categoria" in df.columns:
                 categorias = df["categoria"].dropna().unique().tolist()
-                categorias_selecionadas = st.multiselect("Categorias", categorias, default=categorias)
-                df_filtrado = df_filtrado[df_filtrado["categoria"].isin(categorias_selecionadas)]
+                categorias_selecionadas = tuple(st.multiselect("Categorias", categorias, default=categorias))
         
         # Expander para Opções de Visualização
         with st.sidebar.expander("Opções de Visualização"):
             st.subheader("Formato da Data")
             # Filtro de formato de data (movido para cá)
+            formato_exibicao = None
             if "datamovimentacao" in df.columns:
                 formato_data_selecionado = st.radio(
                     "Selecione o formato da data para os gráficos",
@@ -93,13 +278,6 @@ if dashboard_id:
                     formato_exibicao = "%d-%m"
                 elif formato_data_selecionado == "Dia, Mês e Ano":
                     formato_exibicao = "%d-%m-%Y"
-                
-                # Aplica o formato de exibição como uma nova coluna
-                # IMPORTANTE: Converte para string (object) para que o Plotly não tente reformatar
-                df_filtrado["data_exibicao"] = df_filtrado["datamovimentacao"].dt.strftime(formato_exibicao).astype(str)
-            else:
-                # Garante que 'data_exibicao' exista mesmo sem filtro de data
-                df_filtrado["data_exibicao"] = df_filtrado["datamovimentacao"].astype(str) if "datamovimentacao" in df.columns else ""
 
             st.markdown("---") # Separador visual
             st.subheader("Cores do Texto")
@@ -121,6 +299,12 @@ if dashboard_id:
             chart_text_color = "black" if text_color_charts == "Preto" else "white"
 
 
+        chave_filtros = (data_inicio, data_fim, categorias_selecionadas, formato_exibicao)
+        df_filtrado = filtrar_dataframe(versao, df, *chave_filtros)
+        rollup_filtrado = None
+        if rollup is not None:
+            rollup_filtrado = filtrar_rollup_cache(versao, rollup, data_inicio, data_fim, categorias_selecionadas)
+
         st.markdown("---")
 
         # ====== Cartões (métricas) estilizados com CSS ======
@@ -134,19 +318,7 @@ if dashboard_id:
                 cor_cartao = card.get("cor", "#f0f2f6")
 
                 if campo in df.columns:
-                    if tipo_agregacao == "soma":
-                        valor = df_filtrado[campo].sum()
-                        valor = valor.round(2)
-                    elif tipo_agregacao == "media":
-                        valor = df_filtrado[campo].mean().round(2)
-                    elif tipo_agregacao == "max":
-                        valor = df_filtrado[campo].max()
-                    elif tipo_agregacao == "min":
-                        valor = df_filtrado[campo].min()
-                    elif tipo_agregacao == "contagem":
-                        valor = df_filtrado[campo].nunique()
-                    else:
-                        valor = "Agregação inválida"
+                    valor = agregar_cartao(versao, chave_filtros, df_filtrado, rollup_filtrado, campo, tipo_agregacao)
 
                     cor_texto_card = card_text_color 
 
@@ -179,6 +351,7 @@ if dashboard_id:
                     campo2 = graf["campo2"].lower()
                     tipo = graf["tipo"].lower()
                     cor = graf.get("cor", "blue").lower()
+                    limite_pontos, top_n = limites_grafico(graf, tipo)
 
                     if campo1 in df_filtrado.columns and campo2 in df_filtrado.columns:
                         st.subheader(graf["titulo"])
@@ -190,11 +363,13 @@ if dashboard_id:
 
                         # Lógica para gráficos de Barras e Linhas
                         if tipo in ["barra", "linha"]:
+                            import plotly.express as px
+
                             # Se o campo1 original é uma data, usa 'data_exibicao' e renomeia o rótulo
                             if is_campo1_original_date and is_campo2_numeric:
                                 # Agrupa e garante que o índice resultante seja tratado como categórico para o Plotly
                                 # Ordenar antes de agrupar para manter a ordem cronológica
-                                grouped_df_for_plot = df_filtrado.sort_values(by="datamovimentacao").groupby("data_exibicao")[campo2].sum().reset_index()
+                                grouped_df_for_plot = agregar_grafico(versao, chave_filtros, df_filtrado, rollup_filtrado, campo1, campo2, "data", tipo, limite_pontos, top_n)
                                 
                                 if tipo == "barra":
                                     fig = px.bar(grouped_df_for_plot, x="data_exibicao", y=campo2, 
@@ -218,7 +393,7 @@ if dashboard_id:
                                 st.plotly_chart(fig, use_container_width=True)
 
                             elif not is_campo1_original_date and is_campo2_numeric: # Campo1 é categórico, Campo2 é numérico
-                                agrupado = df_filtrado.groupby(campo1)[campo2].sum().reset_index() # reset_index para ter colunas nomeadas
+                                agrupado = agregar_grafico(versao, chave_filtros, df_filtrado, rollup_filtrado, campo1, campo2, "categoria", tipo, limite_pontos, top_n)
                                 fig = px.bar(agrupado, x=campo1, y=campo2, # Usa nomes das colunas após reset_index
                                              title=graf["titulo"], color_discrete_sequence=[cor],
                                              labels={campo1: campo1.capitalize(), campo2: campo2.capitalize()})
@@ -234,7 +409,7 @@ if dashboard_id:
 
                             # Caso: Eixo X e Y são categóricos (barras empilhadas com Plotly)
                             elif not is_campo1_original_date and not is_campo2_numeric:
-                                df_grouped = df_filtrado.groupby([campo1, campo2]).size().reset_index(name='count')
+                                df_grouped = agregar_grafico(versao, chave_filtros, df_filtrado, rollup_filtrado, campo1, campo2, "empilhado", tipo, limite_pontos, top_n)
 
                                 unique_types_in_stack = df_grouped[campo2].unique()
                                 plotly_palette = generate_contrasting_palette(cor, len(unique_types_in_stack), reverse=True)
@@ -264,14 +439,12 @@ if dashboard_id:
 
                         # Lógica para gráficos de Pizza
                         elif tipo == "pizza":
-                            if is_campo2_numeric:
-                                dados = df_filtrado.groupby(campo1)[campo2].sum().abs()
-                            else:
-                                dados = df_filtrado[campo1].value_counts().abs()
+                            dados = agregar_grafico(versao, chave_filtros, df_filtrado, rollup_filtrado, campo1, campo2, "pizza", tipo, limite_pontos, top_n)
 
                             n = len(dados)
                             pizza_palette = generate_contrasting_palette(cor, n)
 
+                            import matplotlib.pyplot as plt
                             fig, ax = plt.subplots()
                             
                             fig.patch.set_alpha(0.0) 
@@ -0,0 +1,106 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+# Formatos colunares das movimentações, negociados pelo cabeçalho Accept. Em vez de uma lista de
+# objetos JSON, cada coluna viaja como um array tipado: valores em float64, datas em date32 e
+# tipo/categoria codificados como dicionário (um id pequeno por linha e os nomes uma única vez).
+MIME_JSON = 'application/json'
+MIME_ARROW = 'application/vnd.apache.arrow.stream'
+MIME_PARQUET = 'application/vnd.apache.parquet'
+FORMATOS = [MIME_JSON, MIME_ARROW, MIME_PARQUET]
+
+# O restante do payload (ex.: definição da dashboard) vai como JSON nos metadados do schema
+CHAVE_METADADOS = b'stratfy'
+
+
+def escolher_formato(accept_mimetypes):
+    """Formato da resposta a partir do Accept da requisição; JSON quando não há preferência."""
+    return accept_mimetypes.best_match(FORMATOS, default=MIME_JSON)
+
+
+def tabela_movimentacoes(descricoes, valores, tipos, datas, categorias, categoria_nome_para_id,
+                        confianca=None, sugestoes=None):
+    """Monta a tabela Arrow das movimentações com os mesmos campos do JSON de /api/uploadcsv.
+
+    A coluna Categoria usa como dicionário os nomes na ordem de `categoria_nome_para_id`;
+    CategoriaId traz o id correspondente (nulo para categorias fora do mapeamento).
+    `confianca` (uma probabilidade por linha) e `sugestoes` ((nomes, probabilidades) das k categorias
+    mais prováveis, linhas × k) viram as colunas opcionais Confianca e Sugestoes.
+    """
+    nomes_categorias = sorted(categoria_nome_para_id, key=categoria_nome_para_id.get)
+    codigos = pd.Categorical(categorias, categories=nomes_categorias).codes
+    ids = np.array([categoria_nome_para_id[nome] for nome in nomes_categorias], dtype=np.int16)
+
+    colunas = {
+        "Descricao": pa.array(descricoes, type=pa.string()),
+        "Valor": pa.array(valores, type=pa.float64()),
+        "Tipo": pa.array(tipos, type=pa.string()).dictionary_encode(),
+        "DataMovimentacao": pa.array(np.asarray(datas, dtype='datetime64[D]'), type=pa.date32()),
+        "Categoria": pa.DictionaryArray.from_arrays(
+            pa.array(codigos, type=pa.int8(), mask=codigos < 0), pa.array(nomes_categorias, type=pa.string())),
+        "CategoriaId": pa.array(ids[np.maximum(codigos, 0)], type=pa.int16(), mask=codigos < 0),
+    }
+    if confianca is not None:
+        colunas["Confianca"] = pa.array(confianca, type=pa.float32())
+    if sugestoes is not None:
+        colunas["Sugestoes"] = lista_sugestoes(*sugestoes, categoria_nome_para_id)
+    return pa.table(colunas)
+
+
+def lista_sugestoes(nomes, probabilidades, categoria_nome_para_id):
+    """Coluna list<struct<Nome, Id, Probabilidade>> a partir das matrizes linhas × k, sem laço por linha."""
+    linhas, k = nomes.shape
+    nomes = nomes.ravel()
+    ids = pd.Series(nomes).map(categoria_nome_para_id)
+    itens = pa.StructArray.from_arrays(
+        [pa.array(nomes, type=pa.string()),
+         pa.array(ids.fillna(0).to_numpy(dtype=np.int16), type=pa.int16(), mask=ids.isna().to_numpy()),
+         pa.array(probabilidades.ravel(), type=pa.float32())],
+        names=["Nome", "Id", "Probabilidade"])
+    return pa.ListArray.from_arrays(pa.array(np.arange(0, linhas * k + 1, k), type=pa.int32()), itens)
+
+
+def concatenar_tabelas(tabelas):
+    """Junta as tabelas dos shards num único lote, com um dicionário só por coluna."""
+    return pa.concat_tables(tabelas).unify_dictionaries().combine_chunks()
+
+
+def serializar_tabela(tabela, formato, metadados=None):
+    """Serializa a tabela em Arrow IPC (stream) ou Parquet. `metadados` é gravado como JSON no schema."""
+    if metadados is not None:
+        tabela = tabela.replace_schema_metadata({CHAVE_METADADOS: json.dumps(metadados).encode('utf-8')})
+
+    saida = pa.BufferOutputStream()
+    if formato == MIME_PARQUET:
+        pq.write_table(tabela, saida, compression='zstd')
+    else:
+        with ipc.new_stream(saida, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+    return saida.getvalue().to_pybytes()
+
+
+def ler_tabela(conteudo, formato):
+    if formato == MIME_PARQUET:
+        return pq.read_table(pa.BufferReader(conteudo))
+    return ipc.open_stream(conteudo).read_all()
+
+
+def metadados_tabela(tabela):
+    bruto = (tabela.schema.metadata or {}).get(CHAVE_METADADOS)
+    return json.loads(bruto) if bruto else {}
+
+
+def tabela_para_dataframe(tabela):
+    """Converte para pandas com os mesmos tipos que o caminho JSON produz (texto como object, datas em ns)."""
+    df = tabela.to_pandas(date_as_object=False)
+    for coluna in df.columns:
+        if isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            df[coluna] = df[coluna].astype(object)
+        elif pd.api.types.is_datetime64_any_dtype(df[coluna]):
+            df[coluna] = df[coluna].astype('datetime64[ns]')
+    return df
@@ -1,14 +1,154 @@
+import argparse
+import os
+import re
 import subprocess
-import threading
+import sys
 import time
+import urllib.request
 
-def run_flask():
-    subprocess.run(["python", "api_csv.py"])
+# Sobe a API e a dashboard e fica de olho nas duas: cada processo é considerado iniciado quando a URL de
+# prontidão responde 200, e depois disso a URL de saúde é consultada periodicamente. Um processo que
+# encerra, não fica pronto a tempo ou falha várias verificações seguidas é reiniciado, com espera
+# crescente entre reinícios sucessivos.
+INTERVALO_VERIFICACAO_SEGUNDOS = 2
+TEMPO_LIMITE_VERIFICACAO_SEGUNDOS = 5
+FALHAS_ATE_REINICIAR = 3
+TEMPO_LIMITE_INICIO_SEGUNDOS = 120
+ESPERA_REINICIO_SEGUNDOS = 1
+ESPERA_MAXIMA_REINICIO_SEGUNDOS = 60
+# Depois de tanto tempo de pé, o processo volta à espera mínima no próximo reinício
+TEMPO_ESTAVEL_SEGUNDOS = 60
+
+# Módulos pesados medidos por --medir-importacoes (cada um num interpretador novo)
+MODULOS_MEDIDOS = ["pandas", "flask", "pyarrow", "sklearn.pipeline", "requests", "streamlit", "matplotlib.pyplot",
+                   "plotly.express", "api_csv"]
+
+
+class ProcessoSupervisionado:
+    def __init__(self, nome, comando, url_pronto, url_saude, env=None):
+        self.nome = nome
+        self.comando = comando
+        self.url_pronto = url_pronto
+        self.url_saude = url_saude
+        self.env = env
+        self.processo = None
+        self.espera = ESPERA_REINICIO_SEGUNDOS
+        self.reiniciar_em = None
+
+    def iniciar(self):
+        self.processo = subprocess.Popen(self.comando, env=self.env)
+        self.inicio = time.monotonic()
+        self.pronto_em = None
+        self.falhas = 0
+        self.reiniciar_em = None
+
+    def parar(self):
+        if self.processo is None or self.processo.poll() is not None:
+            return
+        self.processo.terminate()
+        try:
+            self.processo.wait(10)
+        except subprocess.TimeoutExpired:
+            self.processo.kill()
+            self.processo.wait()
+
+    def agendar_reinicio(self, motivo):
+        self.parar()
+        if self.pronto_em is not None and time.monotonic() - self.pronto_em > TEMPO_ESTAVEL_SEGUNDOS:
+            self.espera = ESPERA_REINICIO_SEGUNDOS
+        print(f"[main] {self.nome}: {motivo}; reiniciando em {self.espera} s", flush=True)
+        self.reiniciar_em = time.monotonic() + self.espera
+        self.espera = min(self.espera * 2, ESPERA_MAXIMA_REINICIO_SEGUNDOS)
+
+    def verificar(self):
+        """Uma rodada de supervisão: reinicia, acompanha a inicialização ou confere a saúde."""
+        agora = time.monotonic()
+        if self.reiniciar_em is not None:
+            if agora >= self.reiniciar_em:
+                self.iniciar()
+            return
+
+        codigo = self.processo.poll()
+        if codigo is not None:
+            self.agendar_reinicio(f"encerrou com código {codigo}")
+        elif self.pronto_em is None:
+            if responde(self.url_pronto):
+                self.pronto_em = agora
+                print(f"[main] {self.nome}: pronto em {agora - self.inicio:.1f} s", flush=True)
+            elif agora - self.inicio > TEMPO_LIMITE_INICIO_SEGUNDOS:
+                if responde(self.url_saude):
+                    # De pé mas sem ficar pronto (ex.: API sem modelo): reiniciar não resolveria
+                    self.pronto_em = agora
+                    print(f"[main] {self.nome}: no ar, mas não ficou pronto em {TEMPO_LIMITE_INICIO_SEGUNDOS} s", flush=True)
+                else:
+                    self.agendar_reinicio(f"não ficou pronto em {TEMPO_LIMITE_INICIO_SEGUNDOS} s")
+        elif responde(self.url_saude):
+            self.falhas = 0
+        else:
+            self.falhas += 1
+            if self.falhas >= FALHAS_ATE_REINICIAR:
+                self.agendar_reinicio(f"{self.falhas} verificações de saúde sem resposta")
+
+
+def responde(url):
+    try:
+        with urllib.request.urlopen(url, timeout=TEMPO_LIMITE_VERIFICACAO_SEGUNDOS) as resposta:
+            return resposta.status == 200
+    except OSError:
+        return False
+
+
+def supervisionar(processos):
+    for processo in processos:
+        processo.iniciar()
+    try:
+        while True:
+            time.sleep(INTERVALO_VERIFICACAO_SEGUNDOS)
+            for processo in processos:
+                processo.verificar()
+    except KeyboardInterrupt:
+        print("[main] Encerrando...", flush=True)
+    finally:
+        for processo in processos:
+            processo.parar()
+
+
+def medir_importacoes(modulos=MODULOS_MEDIDOS):
+    """Tempo de importação de cada módulo (com as dependências) num interpretador novo, via -X importtime."""
+    tempos = {}
+    for modulo in modulos:
+        resultado = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                                   capture_output=True, text=True)
+        # Formato das linhas: "import time: <próprio us> | <acumulado us> | <módulo>"
+        acumulados = [int(linha.group(1)) for linha in re.finditer(rf"\|\s*(\d+)\s*\|\s*{re.escape(modulo)}\s*$",
+                                                                   resultado.stderr, re.MULTILINE)]
+        tempos[modulo] = acumulados[-1] / 1e6 if resultado.returncode == 0 and acumulados else None
+    return tempos
 
-def run_streamlit():
-    subprocess.run(["streamlit", "run", "dashboard.py", "--server.port=8501"])
 
 if __name__ == "__main__":
-    threading.Thread(target=run_flask).start()
-    time.sleep(2)  
-    run_streamlit()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sobe a API e a dashboard e as reinicia se caírem.")
+    parser.add_argument('--porta-api', type=int, default=8000)
+    parser.add_argument('--porta-dashboard', type=int, default=8501)
+    parser.add_argument('--inicio-lento', action='store_true',
+                        help="Carrega o modelo antes de a API aceitar conexões (sem STRATFY_INICIO_RAPIDO). "
+                             "Com gunicorn é sempre assim: o modelo é carregado antes do fork dos workers")
+    parser.add_argument('--medir-importacoes', action='store_true',
+                        help="Só mede o tempo de importação dos módulos pesados e sai")
+    args = parser.parse_args()
+
+    if args.medir_importacoes:
+        for modulo, segundos in sorted(medir_importacoes().items(), key=lambda item: -(item[1] or 0)):
+            print(f"{modulo:20} {'erro' if segundos is None else f'{segundos:6.2f} s'}")
+        sys.exit(0)
+
+    # A API sobe pelo servidor de produção (servidor.py), não pelo servidor de desenvolvimento do Flask
+    env_api = {**os.environ, 'STRATFY_INICIO_RAPIDO': '0' if args.inicio_lento else '1'}
+    api = ProcessoSupervisionado(
+        "API", [sys.executable, "servidor.py", f"--porta={args.porta_api}"],
+        f"http://127.0.0.1:{args.porta_api}/api/pronto", f"http://127.0.0.1:{args.porta_api}/api/saude", env_api)
+    dashboard = ProcessoSupervisionado(
+        "Dashboard", [sys.executable, "-m", "streamlit", "run", "dashboard.py", f"--server.port={args.porta_dashboard}"],
+        f"http://127.0.0.1:{args.porta_dashboard}/_stcore/health",
+        f"http://127.0.0.1:{args.porta_dashboard}/_stcore/health")
+    supervisionar([api, dashboard])
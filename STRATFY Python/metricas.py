@@ -0,0 +1,249 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Métricas da API no formato texto do Prometheus. Cada processo acumula as suas em memória e grava
+# um instantâneo em disco; o /metrics de qualquer worker soma os instantâneos de todos os processos.
+# A pasta leva o pid de quem importou o módulo primeiro (o processo principal, antes do fork).
+PASTA_METRICAS = os.path.join(tempfile.gettempdir(), 'stratfy_metricas', str(os.getpid()))
+INTERVALO_GRAVACAO_SEGUNDOS = 1.0
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Profiler por amostragem: intervalo entre amostras e onde ficam as pilhas coletadas
+INTERVALO_AMOSTRAGEM_SEGUNDOS = 0.005
+PASTA_PERFIS = os.path.join(tempfile.gettempdir(), 'stratfy_perfis')
+
+# nome: (tipo, ajuda)
+DESCRICOES = {
+    "stratfy_requisicoes_total": ("counter", "Requisições atendidas, por rota e status"),
+    "stratfy_requisicao_segundos": ("histogram", "Duração das requisições, por rota"),
+    "stratfy_etapa_segundos": ("histogram", "Duração de cada etapa do processamento de um upload"),
+    "stratfy_modelo_latencia_segundos": ("histogram", "Duração de cada chamada de categorização em lote"),
+    "stratfy_linhas_processadas_total": ("counter", "Movimentações devolvidas, por rota"),
+    "stratfy_bytes_lidos_total": ("counter", "Bytes recebidos nos uploads, por rota"),
+    "stratfy_linhas_invalidas_total": ("counter", "Linhas descartadas por data ou valor inválidos, por campo"),
+    "stratfy_bytes_recodificados_total": ("counter", "Bytes fora do UTF-8 lidos como cp1252 nos uploads"),
+    "stratfy_cache_previsoes_acertos_total": ("counter", "Descrições respondidas pelo cache de previsões"),
+    "stratfy_cache_previsoes_falhas_total": ("counter", "Descrições enviadas ao modelo"),
+    "stratfy_cache_previsoes_tamanho": ("gauge", "Entradas no cache de previsões"),
+    "stratfy_cache_resultados_acertos_total": ("counter", "Uploads respondidos pelo cache de resultados"),
+    "stratfy_cache_resultados_falhas_total": ("counter", "Uploads que não estavam no cache de resultados"),
+    "stratfy_cache_colunas_acertos_total": ("counter", "Cabeçalhos resolvidos pelo cache de detecção de colunas"),
+    "stratfy_inicializacao_segundos": ("gauge", "Duração da inicialização do processo, por etapa (importacao, modelo)"),
+    "stratfy_cache_colunas_falhas_total": ("counter", "Cabeçalhos que precisaram de detecção de colunas"),
+}
+
+
+def _chave(nome, rotulos):
+    return nome, tuple(sorted((chave, str(valor)) for chave, valor in rotulos.items()))
+
+
+_registro_processo = None
+
+
+def metricas_processo():
+    """O RegistroMetricas deste processo, criado na primeira chamada (é o que a API usa)."""
+    global _registro_processo
+    if _registro_processo is None:
+        _registro_processo = RegistroMetricas()
+    return _registro_processo
+
+
+class RegistroMetricas:
+    """Contadores, medidores e histogramas (com buckets fixos em segundos) de um processo."""
+
+    def __init__(self, pasta=PASTA_METRICAS):
+        self.pasta = pasta
+        self.lock = threading.Lock()
+        self.valores = defaultdict(float)
+        self.histogramas = {}
+        self._ultima_gravacao = 0.0
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        with self.lock:
+            self.valores[_chave(nome, rotulos)] += valor
+
+    def definir(self, nome, valor, **rotulos):
+        with self.lock:
+            self.valores[_chave(nome, rotulos)] = valor
+
+    def observar(self, nome, valor, **rotulos):
+        chave = _chave(nome, rotulos)
+        with self.lock:
+            # [contagem por bucket..., soma, total]
+            histograma = self.histogramas.setdefault(chave, [0] * len(BUCKETS_SEGUNDOS) + [0.0, 0])
+            for indice, limite in enumerate(BUCKETS_SEGUNDOS):
+                if valor <= limite:
+                    histograma[indice] += 1
+                    break
+            histograma[-2] += valor
+            histograma[-1] += 1
+
+    def instantaneo(self):
+        with self.lock:
+            return {
+                "valores": [[nome, list(rotulos), valor] for (nome, rotulos), valor in self.valores.items()],
+                "histogramas": [[nome, list(rotulos), list(dados)] for (nome, rotulos), dados in self.histogramas.items()],
+            }
+
+    def extrair(self):
+        """Retorna e zera os contadores e histogramas acumulados, para somar no registro de outro processo.
+
+        Os processos do pool de categorização não gravam instantâneos: cada shard devolve o que registrou
+        (ver tarefas.processar_em_paralelo). Medidores ficam, pois valem só para o próprio processo.
+        """
+        with self.lock:
+            contadores = [chave for chave in self.valores if DESCRICOES.get(chave[0], ("untyped",))[0] == "counter"]
+            extraido = {
+                "valores": [[nome, list(rotulos), self.valores.pop((nome, rotulos))] for nome, rotulos in contadores],
+                "histogramas": [[nome, list(rotulos), dados] for (nome, rotulos), dados in self.histogramas.items()],
+            }
+            self.histogramas = {}
+        return extraido
+
+    def somar(self, extraido):
+        """Acrescenta a este registro o que `extrair` devolveu em outro processo."""
+        with self.lock:
+            for nome, rotulos, valor in extraido["valores"]:
+                self.valores[nome, tuple(map(tuple, rotulos))] += valor
+            for nome, rotulos, dados in extraido["histogramas"]:
+                chave = nome, tuple(map(tuple, rotulos))
+                acumulado = self.histogramas.get(chave, [0] * len(dados))
+                self.histogramas[chave] = [a + b for a, b in zip(acumulado, dados)]
+
+    def gravar(self, forcar=False):
+        """Grava o instantâneo deste processo (no máximo uma vez por INTERVALO_GRAVACAO_SEGUNDOS)."""
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima_gravacao < INTERVALO_GRAVACAO_SEGUNDOS:
+            return
+        self._ultima_gravacao = agora
+        os.makedirs(self.pasta, exist_ok=True)
+        caminho = os.path.join(self.pasta, f"{os.getpid()}.json")
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(self.instantaneo(), arquivo)
+        os.replace(temporario, caminho)
+
+    def coletar(self):
+        """Soma os instantâneos de todos os processos do servidor.
+
+        Instantâneos de processos que já terminaram (workers reciclados ou que caíram) são apagados.
+        """
+        self.gravar(forcar=True)
+        valores, histogramas = defaultdict(float), {}
+        for nome_arquivo in os.listdir(self.pasta):
+            if not nome_arquivo.endswith('.json'):
+                continue
+            pid = nome_arquivo[:-len('.json')]
+            if pid.isdigit() and not processo_vivo(int(pid)):
+                try:
+                    os.remove(os.path.join(self.pasta, nome_arquivo))
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(os.path.join(self.pasta, nome_arquivo), 'r', encoding='utf-8') as arquivo:
+                    instantaneo = json.load(arquivo)
+            except (OSError, ValueError):
+                continue
+            for nome, rotulos, valor in instantaneo["valores"]:
+                valores[nome, tuple(map(tuple, rotulos))] += valor
+            for nome, rotulos, dados in instantaneo["histogramas"]:
+                acumulado = histogramas.setdefault((nome, tuple(map(tuple, rotulos))), [0] * len(dados))
+                histogramas[nome, tuple(map(tuple, rotulos))] = [a + b for a, b in zip(acumulado, dados)]
+        return valores, histogramas
+
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus."""
+        valores, histogramas = self.coletar()
+        linhas = []
+        nomes = sorted({nome for nome, _ in valores} | {nome for nome, _ in histogramas})
+        for nome in nomes:
+            tipo, ajuda = DESCRICOES.get(nome, ("untyped", ""))
+            linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}"]
+            for (nome_valor, rotulos), valor in sorted(valores.items()):
+                if nome_valor == nome:
+                    linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {_formatar_numero(valor)}")
+            for (nome_histograma, rotulos), dados in sorted(histogramas.items()):
+                if nome_histograma != nome:
+                    continue
+                acumulado = 0
+                for limite, contagem in zip(BUCKETS_SEGUNDOS, dados):
+                    acumulado += contagem
+                    linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos + (('le', str(limite)),))} {acumulado}")
+                linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos + (('le', '+Inf'),))} {dados[-1]}")
+                linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {_formatar_numero(dados[-2])}")
+                linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {dados[-1]}")
+        return '\n'.join(linhas) + '\n'
+
+
+def processo_vivo(pid):
+    if os.name != 'posix':
+        # No Windows os.kill encerraria o processo; lá o servidor roda num processo só
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _formatar_rotulos(rotulos):
+    if not rotulos:
+        return ''
+    pares = (f'{chave}="{str(valor).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for chave, valor in rotulos)
+    return '{' + ','.join(pares) + '}'
+
+
+def _formatar_numero(valor):
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+class AmostradorPerfil:
+    """Profiler por amostragem de uma única thread, sem dependências.
+
+    Uma thread auxiliar lê a pilha da thread alvo a cada `intervalo` segundos e conta as pilhas no
+    formato "colapsado" (funções separadas por ";"), que ferramentas de flame graph leem diretamente.
+    """
+
+    def __init__(self, id_thread, intervalo=INTERVALO_AMOSTRAGEM_SEGUNDOS):
+        self.id_thread = id_thread
+        self.intervalo = intervalo
+        self.amostras = Counter()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, daemon=True)
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            quadro = sys._current_frames().get(self.id_thread)
+            pilha = []
+            while quadro is not None:
+                codigo = quadro.f_code
+                pilha.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                quadro = quadro.f_back
+            if pilha:
+                self.amostras[';'.join(reversed(pilha))] += 1
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def salvar(self, prefixo):
+        """Grava as pilhas colapsadas em PASTA_PERFIS e retorna o nome do arquivo."""
+        os.makedirs(PASTA_PERFIS, exist_ok=True)
+        nome = f"{prefixo}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.txt"
+        with open(os.path.join(PASTA_PERFIS, nome), 'w', encoding='utf-8') as arquivo:
+            for pilha, contagem in self.amostras.most_common():
+                arquivo.write(f"{pilha} {contagem}\n")
+        return nome
@@ -1,54 +1,427 @@
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.naive_bayes import MultinomialNB
-from sklearn.pipeline import Pipeline
+import pyarrow as pa
+import pyarrow.compute as pc
 import pickle
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    # Windows: o servidor roda num processo só (waitress) e o lock de threads da API basta
+    fcntl = None
+from modelo_compacto import exportar_modelo_compacto
 
-def treinar_modelo(dados_treinamento):
+PASTA_MODELO_COMPACTO = 'modelo_categorizacao_npy'
+PASTA_VERSOES_MODELO = 'modelos'
+ARQUIVO_CORRECOES = 'correcoes.jsonl'
+
+# Hiperparâmetros do modelo padrão; treinar.py procura combinações melhores
+PARAMETROS_PADRAO = {"analyzer": "word", "ngram_range": (1, 2), "min_df": 1, "alpha": 1.0}
+
+def criar_vetorizador(parametros):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    return TfidfVectorizer(analyzer=parametros["analyzer"], ngram_range=tuple(parametros["ngram_range"]),
+                           min_df=parametros["min_df"])
+
+def criar_pipeline(parametros=None):
+    """Pipeline TF-IDF + MultinomialNB ainda não treinado."""
+    # sklearn só é necessário para treinar; a API usa o modelo compacto (ver modelo_compacto.py)
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import Pipeline
+
+    parametros = {**PARAMETROS_PADRAO, **(parametros or {})}
+    return Pipeline([
+        ('tfidf', criar_vetorizador(parametros)),
+        ('clf', MultinomialNB(alpha=parametros["alpha"]))
+    ])
+
+def treinar_modelo(dados_treinamento, parametros=None):
     """Treina o modelo de categorização."""
     df_treinamento = pd.DataFrame(dados_treinamento)
     X_treino = df_treinamento['descricao']
     y_treino = df_treinamento['categoria']
 
-    modelo = Pipeline([
-        ('tfidf', TfidfVectorizer(ngram_range=(1, 2))),
-        ('clf', MultinomialNB())
-    ])
+    modelo = criar_pipeline(parametros)
     modelo.fit(X_treino, y_treino)
     return modelo
 
+class ModeloComCorrecoes:
+    """Modelo servido com as correções dos usuários aplicadas por cima.
+
+    Descrições cuja chave (normalizar_descricao) foi corrigida recebem a categoria corrigida, com
+    probabilidade 1; todas as outras vão para o modelo base sem nenhuma alteração, com a mesma
+    temperatura. As correções entram no próprio modelo no próximo treino completo (treinar.py).
+    """
+
+    def __init__(self, base, correcoes):
+        self.base = base
+        self.correcoes = dict(correcoes)
+        self.temperatura = getattr(base, 'temperatura', None)
+        # Uma correção pode usar uma categoria que o modelo base não conhece
+        self.classes_ = np.union1d(np.asarray(base.classes_, dtype=object),
+                                   np.asarray(sorted(set(self.correcoes.values())), dtype=object))
+        conteudo = json.dumps(sorted(self.correcoes.items()), ensure_ascii=False).encode('utf-8')
+        self.versao = hashlib.sha256(versao_modelo(base).encode('utf-8') + conteudo).hexdigest()[:16]
+
+    def _corrigidas(self, descricoes):
+        """(linhas com correção, categorias corrigidas)."""
+        pares = [(indice, self.correcoes[chave]) for indice, chave in enumerate(normalizar_descricoes(descricoes))
+                 if chave in self.correcoes]
+        return [indice for indice, _ in pares], [categoria for _, categoria in pares]
+
+    def predict(self, descricoes):
+        descricoes = list(descricoes)
+        previstas = np.asarray(self.base.predict(descricoes), dtype=object)
+        linhas, categorias = self._corrigidas(descricoes)
+        previstas[linhas] = categorias
+        return previstas
+
+    def predict_proba(self, descricoes):
+        descricoes = list(descricoes)
+        probabilidades = np.zeros((len(descricoes), len(self.classes_)))
+        colunas_base = np.searchsorted(self.classes_, np.asarray(self.base.classes_, dtype=object))
+        probabilidades[:, colunas_base] = self.base.predict_proba(descricoes)
+        linhas, categorias = self._corrigidas(descricoes)
+        probabilidades[linhas] = 0.0
+        probabilidades[linhas, np.searchsorted(self.classes_, np.asarray(categorias, dtype=object))] = 1.0
+        return probabilidades
+
+def ler_correcoes(arquivo_correcoes=ARQUIVO_CORRECOES):
+    """{chave normalizada: categoria} do histórico de correções; a mais recente de cada chave prevalece."""
+    try:
+        with open(arquivo_correcoes, 'r', encoding='utf-8') as arquivo:
+            correcoes = [json.loads(linha) for linha in arquivo if linha.strip()]
+    except FileNotFoundError:
+        return {}
+    chaves = normalizar_descricoes([correcao["descricao"] for correcao in correcoes])
+    return dict(zip(chaves, (correcao["categoria"] for correcao in correcoes)))
+
+def aplicar_correcoes_salvas(base, arquivo_correcoes=ARQUIVO_CORRECOES):
+    """O modelo base com as correções já registradas por cima (o próprio base, se não houver nenhuma)."""
+    correcoes = ler_correcoes(arquivo_correcoes)
+    return ModeloComCorrecoes(base, correcoes) if correcoes else base
+
+@contextmanager
+def bloqueio_arquivo(nome_arquivo):
+    """Lock exclusivo entre processos sobre `nome_arquivo`, via flock num arquivo "<nome>.lock" ao lado."""
+    with open(f"{nome_arquivo}.lock", 'a') as arquivo_lock:
+        if fcntl:
+            fcntl.flock(arquivo_lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+
+def aplicar_correcoes(descricoes, categorias, base, arquivo_correcoes=ARQUIVO_CORRECOES):
+    """Registra as correções e retorna (modelo base com todas as correções por cima, mtime do histórico).
+
+    Gravação e releitura acontecem sob bloqueio_arquivo: lotes recebidos ao mesmo tempo por workers
+    diferentes não se perdem, e cada um volta com as correções dos outros também.
+    """
+    with bloqueio_arquivo(arquivo_correcoes):
+        registrar_correcoes(descricoes, categorias, arquivo_correcoes)
+        return aplicar_correcoes_salvas(base, arquivo_correcoes), os.stat(arquivo_correcoes).st_mtime_ns
+
+def registrar_correcoes(descricoes, categorias, nome_arquivo=ARQUIVO_CORRECOES):
+    """Acrescenta as correções ao histórico em disco, para que entrem nos próximos treinos completos."""
+    with open(nome_arquivo, 'a', encoding='utf-8') as arquivo:
+        for descricao, categoria in zip(descricoes, categorias):
+            arquivo.write(json.dumps({"descricao": descricao, "categoria": categoria}, ensure_ascii=False) + '\n')
+
 def salvar_modelo(modelo, nome_arquivo='modelo_categorizacao.pkl'):
-    """Salva o modelo treinado em um arquivo."""
-    with open(nome_arquivo, 'wb') as arquivo:
+    """Salva o modelo treinado em um arquivo (de forma atômica, para não expor um arquivo pela metade)."""
+    temporario = f"{nome_arquivo}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporario, 'wb') as arquivo:
         pickle.dump(modelo, arquivo)
+    os.replace(temporario, nome_arquivo)
 
-def carregar_modelo(nome_arquivo='modelo_categorizacao.pkl'):
-    """Carrega o modelo treinado de um arquivo."""
+def salvar_versao_modelo(modelo, metadados, pasta=PASTA_VERSOES_MODELO):
+    """Grava o modelo em `pasta/<versao>/` junto com um metadados.json. Retorna a versão."""
+    conteudo = pickle.dumps(modelo)
+    versao = hashlib.sha256(conteudo).hexdigest()[:16]
+    modelo.versao = versao
+    pasta_versao = os.path.join(pasta, versao)
+    os.makedirs(pasta_versao, exist_ok=True)
+    salvar_modelo(modelo, os.path.join(pasta_versao, 'modelo.pkl'))
+    with open(os.path.join(pasta_versao, 'metadados.json'), 'w', encoding='utf-8') as arquivo:
+        json.dump({"versao": versao, **metadados}, arquivo, ensure_ascii=False, indent=2)
+    return versao
+
+def listar_versoes_modelo(pasta=PASTA_VERSOES_MODELO):
+    """Metadados das versões salvas, da mais recente para a mais antiga."""
+    versoes = []
+    for nome in os.listdir(pasta) if os.path.isdir(pasta) else []:
+        try:
+            with open(os.path.join(pasta, nome, 'metadados.json'), 'r', encoding='utf-8') as arquivo:
+                versoes.append(json.load(arquivo))
+        except (OSError, ValueError):
+            continue
+    return sorted(versoes, key=lambda metadados: metadados.get("criado_em", ""), reverse=True)
+
+def carregar_modelo(nome_arquivo='modelo_categorizacao.pkl', versao=None):
+    """Carrega o modelo treinado de um arquivo, ou a versão indicada de PASTA_VERSOES_MODELO."""
+    if versao is not None:
+        nome_arquivo = os.path.join(PASTA_VERSOES_MODELO, versao, 'modelo.pkl')
     try:
         with open(nome_arquivo, 'rb') as arquivo:
-            return pickle.load(arquivo)
+            conteudo = arquivo.read()
     except FileNotFoundError:
         print(f"Erro: Arquivo '{nome_arquivo}' não encontrado.")
         return None
+    modelo = pickle.loads(conteudo)
+    if getattr(modelo, 'versao', None) is None:
+        modelo.versao = hashlib.sha256(conteudo).hexdigest()[:16]
+    return modelo
+
+def versao_modelo(modelo):
+    """Identificador do modelo carregado; muda sempre que o modelo é retreinado."""
+    versao = getattr(modelo, 'versao', None)
+    if versao is None:
+        versao = hashlib.sha256(pickle.dumps(modelo)).hexdigest()[:16]
+        modelo.versao = versao
+    return versao
+
+# A chave do cache não vai além do pré-processamento do próprio vetorizador (minúsculas; espaços não
+# mudam os tokens de analyzer='word' nem os n-gramas de 'char_wb'), e é ela que vai para o modelo: um
+# acerto no cache é sempre igual a uma previsão nova. Mascarar acentos, dígitos ou datas juntaria
+# descrições que o modelo categoriza de forma diferente. Regex no dialeto RE2 do Arrow, aplicada à
+# coluna inteira de uma vez.
+PADRAO_ESPACOS = r'\s+'
+# Muda junto com normalizar_descricoes: caches gravados com outro formato de chave são descartados
+FORMATO_CHAVES = 2
+
+def normalizar_descricoes(descricoes):
+    """Normaliza as descrições para uso como chave de cache e entrada do modelo (minúsculas, espaços simples)."""
+    textos = pc.utf8_lower(pa.array([str(descricao) for descricao in descricoes], type=pa.string()))
+    return pc.utf8_trim_whitespace(pc.replace_substring_regex(textos, PADRAO_ESPACOS, ' ')).to_pylist()
 
-def prever_categoria(modelo, descricao):
+def normalizar_descricao(descricao):
+    return normalizar_descricoes([descricao])[0]
+
+def agrupar_descricoes(descricoes):
+    """Agrupa as descrições pela chave normalizada, normalizando só os textos distintos.
+
+    Retorna (códigos, chaves): `chaves[códigos[i]]` é a chave da linha i.
+    """
+    codigos, distintas = pd.factorize(pd.Series(descricoes, dtype=object), use_na_sentinel=False)
+    codigos_chaves, chaves = pd.factorize(pd.Series(normalizar_descricoes(distintas), dtype=object))
+    return codigos_chaves[codigos], chaves.tolist()
+
+class CachePrevisoes:
+    """Cache LRU de categorias previstas, indexado pela descrição normalizada.
+
+    As entradas valem apenas para a versão do modelo que as gerou; ao trocar o modelo o cache é esvaziado.
+    Se `arquivo` for informado, o conteúdo pode ser persistido em disco com `salvar()` e é recarregado na criação.
+    """
+
+    def __init__(self, tamanho_maximo=100000, arquivo=None):
+        self.tamanho_maximo = tamanho_maximo
+        self.arquivo = arquivo
+        self.versao = None
+        self.acertos = 0
+        self.falhas = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        if arquivo:
+            self.carregar()
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def validar_versao(self, versao):
+        """Esvazia o cache se ele foi preenchido por outra versão do modelo."""
+        with self._lock:
+            if self.versao != versao:
+                self._entradas.clear()
+                self.versao = versao
+
+    def obter_varios(self, chaves):
+        """Retorna {chave: categoria} para as chaves presentes e atualiza os contadores."""
+        encontrados = {}
+        with self._lock:
+            for chave in chaves:
+                if chave in self._entradas:
+                    self._entradas.move_to_end(chave)
+                    encontrados[chave] = self._entradas[chave]
+            self.acertos += len(encontrados)
+            self.falhas += len(chaves) - len(encontrados)
+        return encontrados
+
+    def registrar_acertos(self, quantidade):
+        with self._lock:
+            self.acertos += quantidade
+
+    def guardar_varios(self, itens):
+        with self._lock:
+            for chave, categoria in itens:
+                self._entradas[chave] = categoria
+                self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.tamanho_maximo:
+                self._entradas.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self.acertos = 0
+            self.falhas = 0
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            "tamanho": len(self._entradas),
+            "tamanho_maximo": self.tamanho_maximo,
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": self.acertos / total if total else 0.0,
+            "versao_modelo": self.versao,
+        }
+
+    def salvar(self):
+        """Grava o cache em disco de forma atômica (arquivo temporário + rename)."""
+        if not self.arquivo:
+            return
+        with self._lock:
+            conteudo = {"formato": FORMATO_CHAVES, "versao": self.versao, "entradas": list(self._entradas.items())}
+        temporario = f"{self.arquivo}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(conteudo, arquivo, ensure_ascii=False)
+        os.replace(temporario, self.arquivo)
+
+    def carregar(self):
+        try:
+            with open(self.arquivo, 'r', encoding='utf-8') as arquivo:
+                conteudo = json.load(arquivo)
+        except (FileNotFoundError, ValueError):
+            return
+        if conteudo.get("formato") != FORMATO_CHAVES:
+            return
+        with self._lock:
+            self.versao = conteudo.get("versao")
+            self._entradas = OrderedDict(conteudo.get("entradas", [])[-self.tamanho_maximo:])
+
+def calibrar_probabilidades(probabilidades, temperatura=1.0):
+    """Escala de temperatura: softmax(log(p) / T). T < 1 acentua as probabilidades e T > 1 as suaviza.
+
+    Não muda a ordem das categorias; a temperatura é ajustada por treinar.py na validação cruzada. No
+    modelo atual ela fica abaixo de 1 (≈ 0,28): com muitas categorias, o Naive Bayes com suavização
+    espalha a probabilidade e subestima a confiança da categoria prevista.
+    """
+    if temperatura == 1.0:
+        return probabilidades
+    log_probabilidades = np.log(np.maximum(probabilidades, np.finfo(float).tiny)) / temperatura
+    log_probabilidades -= log_probabilidades.max(axis=1, keepdims=True)
+    calibradas = np.exp(log_probabilidades)
+    return calibradas / calibradas.sum(axis=1, keepdims=True)
+
+# Versões de modelo sem temperatura já avisadas (um aviso por modelo, não por requisição)
+versoes_sem_temperatura = set()
+
+def temperatura_do_modelo(modelo):
+    """Temperatura de calibração do modelo; 1.0 (sem calibração) com um aviso se ele não tiver uma."""
+    temperatura = getattr(modelo, 'temperatura', None)
+    if temperatura is not None:
+        return temperatura
+    versao = versao_modelo(modelo)
+    if versao not in versoes_sem_temperatura:
+        versoes_sem_temperatura.add(versao)
+        print(f"Aviso: o modelo {versao} não tem temperatura calibrada; as probabilidades de confiança saem "
+              "sem calibração. Rode 'python treinar.py --calibrar'.")
+    return 1.0
+
+def prever_probabilidades(modelo, descricoes, cache=None):
+    """Probabilidades calibradas de todas as categorias, numa única chamada a predict_proba.
+
+    Retorna (classes, matriz linhas × classes). Descrições com a mesma chave normalizada passam pelo
+    modelo uma vez só e, com `cache` (um CachePrevisoes só para vetores de probabilidade), apenas as
+    chaves ainda não vistas, como em prever_categorias.
+    """
+    descricoes = list(descricoes)
+    classes = np.asarray(modelo.classes_)
+    if not descricoes:
+        return classes, np.empty((0, len(classes)))
+    codigos, chaves = agrupar_descricoes(descricoes)
+    temperatura = temperatura_do_modelo(modelo)
+    if cache is None:
+        return classes, calibrar_probabilidades(modelo.predict_proba(chaves), temperatura)[codigos]
+
+    cache.validar_versao(versao_modelo(modelo))
+    encontradas = cache.obter_varios(chaves)
+    por_chave = np.empty((len(chaves), len(classes)))
+    faltantes = []
+    for indice, chave in enumerate(chaves):
+        if chave in encontradas:
+            por_chave[indice] = encontradas[chave]
+        else:
+            faltantes.append(indice)
+    if faltantes:
+        novas = calibrar_probabilidades(modelo.predict_proba([chaves[indice] for indice in faltantes]), temperatura)
+        por_chave[faltantes] = novas
+        cache.guardar_varios([(chaves[indice], linha.copy()) for indice, linha in zip(faltantes, novas)])
+    cache.registrar_acertos(len(descricoes) - len(chaves))
+    return classes, por_chave[codigos]
+
+def top_k_categorias(classes, probabilidades, k):
+    """As `k` categorias mais prováveis de cada linha, da maior para a menor: (nomes, probabilidades)."""
+    k = min(k, len(classes))
+    indices = np.argsort(-probabilidades, axis=1, kind='stable')[:, :k]
+    return classes[indices], np.take_along_axis(probabilidades, indices, axis=1)
+
+def prever_categoria(modelo, descricao, cache=None):
     """Prevê a categoria para uma dada descrição."""
     if modelo:
-        return modelo.predict([descricao])[0]
+        return prever_categorias(modelo, [descricao], cache)[0]
     return None
 
+def prever_categorias(modelo, descricoes, cache=None):
+    """Prevê as categorias de várias descrições em uma única chamada ao modelo.
+
+    Com `cache`, apenas as descrições normalizadas ainda não vistas passam pelo modelo.
+    """
+    descricoes = list(descricoes)
+    if not modelo:
+        return [None] * len(descricoes)
+    if not descricoes:
+        return []
+    if cache is None:
+        return modelo.predict(descricoes).tolist()
+
+    cache.validar_versao(versao_modelo(modelo))
+    # O modelo recebe cada chave uma vez; as repetidas no mesmo arquivo contam como acerto
+    codigos, chaves = agrupar_descricoes(descricoes)
+    categorias = cache.obter_varios(chaves)
+    faltantes = [indice for indice, chave in enumerate(chaves) if chave not in categorias]
+    if faltantes:
+        previstas = modelo.predict([chaves[indice] for indice in faltantes]).tolist()
+        novas = [(chaves[indice], categoria) for indice, categoria in zip(faltantes, previstas)]
+        cache.guardar_varios(novas)
+        categorias.update(novas)
+    cache.registrar_acertos(len(descricoes) - len(chaves))
+
+    por_chave = np.array([categorias[chave] for chave in chaves], dtype=object)
+    return por_chave[codigos].tolist()
+
 
 if __name__ == '__main__':
 
     # Treinar o modelo
     dados_treinamento_exemplo = pd.read_json('TreinoML.json')
     modelo_treinado = treinar_modelo(dados_treinamento_exemplo)
+    # Sem temperatura ajustada, as probabilidades de confiança da API não são confiáveis
+    from treinar import ajustar_temperatura
+    modelo_treinado.temperatura, _, _ = ajustar_temperatura(dados_treinamento_exemplo, PARAMETROS_PADRAO)
 
     # Salvar o modelo treinado
     salvar_modelo(modelo_treinado)
+    exportar_modelo_compacto(modelo_treinado, PASTA_MODELO_COMPACTO, versao_modelo(carregar_modelo()))
 
     print("Modelo de categorização treinado e salvo como 'modelo_categorizacao.pkl'")
+    print(f"Modelo compacto exportado para '{PASTA_MODELO_COMPACTO}'")
 
     # Carregar o modelo treinado
     modelo_carregado_teste = carregar_modelo()
@@ -0,0 +1,174 @@
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+# Formato compacto do modelo: um .npy por array, para poder abrir com np.load(mmap_mode='r').
+# Processos que carregam a mesma pasta compartilham as páginas do sistema de arquivos.
+ARQUIVO_METADADOS = 'metadados.json'
+VERSAO_FORMATO = 1
+
+
+def exportar_modelo_compacto(modelo, pasta, versao=None):
+    """Exporta um Pipeline (TfidfVectorizer + MultinomialNB) treinado para arrays NumPy.
+
+    Só é suportada a configuração usada em `treinar_modelo`: analisador de palavras com token_pattern,
+    sem stop words nem remoção de acentos.
+
+    Os arquivos são gravados numa pasta temporária que depois toma o lugar de `pasta`: processos que
+    estão com o modelo anterior mapeado em memória continuam lendo os arquivos antigos, sem ver um
+    arquivo pela metade.
+    """
+    tfidf = modelo.named_steps['tfidf']
+    clf = modelo.named_steps['clf']
+
+    if (tfidf.analyzer != 'word' or tfidf.tokenizer is not None or tfidf.preprocessor is not None
+            or tfidf.stop_words is not None or tfidf.strip_accents is not None or tfidf.norm not in ('l2', None)):
+        raise ValueError("Configuração do TfidfVectorizer não suportada pelo formato compacto")
+
+    termos = np.array(tfidf.get_feature_names_out(), dtype=str)
+    ordem = np.argsort(termos, kind='stable')
+
+    pasta = os.path.normpath(pasta)
+    nova = f"{pasta}.{os.getpid()}.tmp"
+    shutil.rmtree(nova, ignore_errors=True)
+    os.makedirs(nova)
+    np.save(os.path.join(nova, 'vocabulario.npy'), termos[ordem])
+    np.save(os.path.join(nova, 'indices_vocabulario.npy'), ordem.astype(np.int64))
+    if tfidf.use_idf:
+        np.save(os.path.join(nova, 'idf.npy'), tfidf.idf_.astype(np.float64))
+    np.save(os.path.join(nova, 'log_prob_termos.npy'), np.ascontiguousarray(clf.feature_log_prob_.T))
+    np.save(os.path.join(nova, 'log_prior_classes.npy'), clf.class_log_prior_)
+    np.save(os.path.join(nova, 'classes.npy'), np.array(clf.classes_, dtype=str))
+
+    metadados = {
+        "formato": VERSAO_FORMATO,
+        "versao": versao,
+        "token_pattern": tfidf.token_pattern,
+        "lowercase": tfidf.lowercase,
+        "ngram_range": list(tfidf.ngram_range),
+        "use_idf": tfidf.use_idf,
+        "sublinear_tf": tfidf.sublinear_tf,
+        "norm": tfidf.norm,
+        # Escala de temperatura das probabilidades (ver calibrar_probabilidades); null = não calibrado
+        "temperatura": getattr(modelo, 'temperatura', None),
+    }
+    with open(os.path.join(nova, ARQUIVO_METADADOS), 'w', encoding='utf-8') as arquivo:
+        json.dump(metadados, arquivo, indent=2)
+
+    # Um diretório não substitui outro com os.replace; a pasta anterior sai do caminho antes
+    antiga = f"{pasta}.{os.getpid()}.antiga"
+    if os.path.isdir(pasta):
+        os.replace(pasta, antiga)
+    os.replace(nova, pasta)
+    shutil.rmtree(antiga, ignore_errors=True)
+
+
+def carregar_modelo_compacto(pasta):
+    """Carrega o modelo compacto com os arrays mapeados em memória. Retorna None se a pasta não existir."""
+    try:
+        with open(os.path.join(pasta, ARQUIVO_METADADOS), 'r', encoding='utf-8') as arquivo:
+            metadados = json.load(arquivo)
+    except FileNotFoundError:
+        print(f"Erro: Modelo compacto não encontrado em '{pasta}'.")
+        return None
+    if metadados.get("formato") != VERSAO_FORMATO:
+        print(f"Erro: Formato do modelo compacto em '{pasta}' não suportado.")
+        return None
+    if metadados.get("temperatura") is None:
+        print(f"Aviso: o modelo compacto em '{pasta}' não tem temperatura calibrada; as probabilidades de "
+              "confiança (topk, limiar_outros, revisao) não são confiáveis. Rode 'python treinar.py --calibrar'.")
+    return ModeloCompacto(pasta, metadados)
+
+
+class ModeloCompacto:
+    """Reproduz `Pipeline.predict` e `predict_proba` do TF-IDF + MultinomialNB usando apenas NumPy."""
+
+    def __init__(self, pasta, metadados):
+        def abrir(nome):
+            return np.load(os.path.join(pasta, nome), mmap_mode='r')
+
+        self.versao = metadados["versao"]
+        self.temperatura = metadados.get("temperatura")
+        self.lowercase = metadados["lowercase"]
+        self.token_pattern = re.compile(metadados["token_pattern"])
+        self.ngram_min, self.ngram_max = metadados["ngram_range"]
+        self.sublinear_tf = metadados["sublinear_tf"]
+        self.norm = metadados["norm"]
+
+        self.vocabulario = abrir('vocabulario.npy')
+        self.indices_vocabulario = abrir('indices_vocabulario.npy')
+        self.idf = abrir('idf.npy') if metadados["use_idf"] else None
+        self.log_prob_termos = abrir('log_prob_termos.npy')
+        self.log_prior_classes = abrir('log_prior_classes.npy')
+        self.classes_ = np.load(os.path.join(pasta, 'classes.npy'))
+
+    def _ngramas(self, descricao):
+        if self.lowercase:
+            descricao = descricao.lower()
+        tokens = self.token_pattern.findall(descricao)
+        ngramas = list(tokens) if self.ngram_min == 1 else []
+        for n in range(max(self.ngram_min, 2), min(self.ngram_max, len(tokens)) + 1):
+            ngramas += [" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+        return ngramas
+
+    def _termos(self, descricoes):
+        """Retorna (linhas, colunas, valores) da matriz TF-IDF em ordem de linha e coluna, como a CSR do sklearn."""
+        # O vocabulário tem largura fixa (<U{n}): um termo maior seria truncado na conversão e poderia
+        # coincidir com outro termo. Nenhum termo maior que a largura está no vocabulário.
+        largura = self.vocabulario.dtype.itemsize // np.dtype('U1').itemsize
+        linhas, termos = [], []
+        for linha, descricao in enumerate(descricoes):
+            ngramas = [ngrama for ngrama in self._ngramas(descricao) if len(ngrama) <= largura]
+            termos += ngramas
+            linhas += [linha] * len(ngramas)
+
+        if not termos:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+
+        termos = np.array(termos, dtype=self.vocabulario.dtype)
+        linhas = np.array(linhas, dtype=np.int64)
+        posicoes = np.searchsorted(self.vocabulario, termos)
+        posicoes[posicoes == len(self.vocabulario)] = 0
+        conhecidos = self.vocabulario[posicoes] == termos
+        colunas = self.indices_vocabulario[posicoes[conhecidos]]
+        linhas = linhas[conhecidos]
+
+        num_termos = len(self.vocabulario)
+        chaves, contagens = np.unique(linhas * num_termos + colunas, return_counts=True)
+        linhas, colunas = np.divmod(chaves, num_termos)
+        valores = contagens.astype(np.float64)
+
+        if self.sublinear_tf:
+            valores = np.log(valores) + 1.0
+        if self.idf is not None:
+            valores *= self.idf[colunas]
+        if self.norm == 'l2':
+            normas = np.zeros(len(descricoes))
+            np.add.at(normas, linhas, valores * valores)
+            normas = np.sqrt(normas)
+            valores /= normas[linhas]
+        return linhas, colunas, valores
+
+    def _log_verossimilhanca(self, descricoes):
+        linhas, colunas, valores = self._termos(descricoes)
+        verossimilhanca = np.zeros((len(descricoes), self.log_prob_termos.shape[1]))
+        np.add.at(verossimilhanca, linhas, valores[:, None] * self.log_prob_termos[colunas])
+        return verossimilhanca + self.log_prior_classes
+
+    def predict(self, descricoes):
+        descricoes = list(descricoes)
+        if not descricoes:
+            return self.classes_[:0]
+        return self.classes_[np.argmax(self._log_verossimilhanca(descricoes), axis=1)]
+
+    def predict_proba(self, descricoes):
+        descricoes = list(descricoes)
+        if not descricoes:
+            return np.empty((0, len(self.classes_)))
+        verossimilhanca = self._log_verossimilhanca(descricoes)
+        verossimilhanca -= verossimilhanca.max(axis=1, keepdims=True)
+        probabilidades = np.exp(verossimilhanca)
+        return probabilidades / probabilidades.sum(axis=1, keepdims=True)
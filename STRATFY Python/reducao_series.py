@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# Redução das séries antes de desenhar: evita mandar milhares de barras/pontos para o Plotly
+# e pizzas com centenas de fatias para o matplotlib. Os limites podem ser definidos por gráfico
+# (colunas LimitePontos e TopN da tabela Graficos); sem isso valem os padrões abaixo.
+LIMITE_PONTOS_PADRAO = 500
+TOP_N_PADRAO = 20
+TOP_N_PIZZA_PADRAO = 10
+ROTULO_OUTROS = "Outros"
+
+FORMATO_DATA_COMPLETA = "%d-%m-%Y"
+GRANULARIDADES = [
+    # (frequência do pandas, formato do rótulo)
+    ("W", "Sem. %d-%m-%Y"),
+    ("M", "%m-%Y"),
+    ("Y", "%Y"),
+]
+
+
+def top_n_com_outros(serie, top_n):
+    """Mantém as `top_n` maiores entradas (em valor absoluto) e soma o resto em "Outros".
+
+    As entradas mantidas conservam a ordem original; "Outros" vai para o fim.
+    """
+    if top_n is None or len(serie) <= top_n:
+        return serie
+    mantidos = serie.abs().nlargest(top_n).index
+    manter = serie.index.isin(mantidos)
+    reduzida = serie[manter]
+    resto = serie[~manter].sum()
+    if ROTULO_OUTROS in reduzida.index:
+        reduzida = reduzida.copy()
+        reduzida[ROTULO_OUTROS] += resto
+        return reduzida
+    return pd.concat([reduzida, pd.Series([resto], index=[ROTULO_OUTROS])]).rename_axis(serie.index.name).rename(serie.name)
+
+
+def reduzir_tabela_categorias(tabela, campo_categoria, campo_valor, top_n):
+    """top_n_com_outros para uma tabela [campo_categoria, campo_valor] (gráfico de barras por categoria)."""
+    serie = tabela.set_index(campo_categoria)[campo_valor]
+    return top_n_com_outros(serie, top_n).reset_index().set_axis([campo_categoria, campo_valor], axis=1)
+
+
+def reduzir_tabela_empilhada(tabela, campo_categoria, campo_pilha, top_n):
+    """Barras empilhadas: mantém as `top_n` categorias do eixo X com maior contagem total."""
+    totais = tabela.groupby(campo_categoria)["count"].sum()
+    if top_n is None or len(totais) <= top_n:
+        return tabela
+    mantidos = totais.nlargest(top_n).index
+    tabela = tabela.copy()
+    tabela[campo_categoria] = tabela[campo_categoria].where(tabela[campo_categoria].isin(mantidos), ROTULO_OUTROS)
+    return tabela.groupby([campo_categoria, campo_pilha], sort=False)["count"].sum().reset_index()
+
+
+def promover_granularidade(por_dia, limite_pontos):
+    """Reagrupa uma série diária por semana, mês ou ano até caber em `limite_pontos`.
+
+    Retorna a série com rótulos de texto em ordem cronológica.
+    """
+    for frequencia, formato in GRANULARIDADES:
+        periodos = por_dia.index.to_period(frequencia)
+        agrupada = por_dia.groupby(periodos).sum()
+        if len(agrupada) <= limite_pontos or frequencia == GRANULARIDADES[-1][0]:
+            rotulos = agrupada.index.start_time.strftime(formato).astype(str)
+            return pd.Series(agrupada.to_numpy(), index=pd.Index(rotulos, name="data_exibicao"), name=por_dia.name)
+
+
+def lttb(y, limite_pontos):
+    """Índices escolhidos pelo Largest-Triangle-Three-Buckets para desenhar `y` com `limite_pontos` pontos."""
+    n = len(y)
+    if limite_pontos >= n or limite_pontos < 3:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    x = np.arange(n, dtype=float)
+    tamanho_balde = (n - 2) / (limite_pontos - 2)
+    indices = [0]
+    anterior = 0
+    for balde in range(limite_pontos - 2):
+        inicio = int(balde * tamanho_balde) + 1
+        fim = int((balde + 1) * tamanho_balde) + 1
+        proximo_fim = min(int((balde + 2) * tamanho_balde) + 1, n)
+        if fim >= proximo_fim:
+            media_x, media_y = x[-1], y[-1]
+        else:
+            media_x, media_y = x[fim:proximo_fim].mean(), y[fim:proximo_fim].mean()
+
+        areas = np.abs((x[anterior] - media_x) * (y[inicio:fim] - y[anterior])
+                       - (x[anterior] - x[inicio:fim]) * (media_y - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        indices.append(anterior)
+    indices.append(n - 1)
+    return np.array(indices)
+
+
+def reduzir_serie_temporal(tabela, por_dia, campo_valor, formato_exibicao, tipo_grafico, limite_pontos):
+    """Aplica a redução a uma série por data [data_exibicao, campo_valor].
+
+    Com o formato de data completo, séries acima do limite são promovidas de dia para semana/mês/ano
+    (`por_dia` é chamado só nesse caso, para obter a série diária). Linhas que ainda passarem do limite
+    são amostradas com LTTB.
+    """
+    if len(tabela) <= limite_pontos:
+        return tabela
+    if formato_exibicao == FORMATO_DATA_COMPLETA:
+        tabela = promover_granularidade(por_dia(), limite_pontos).reset_index()
+    if tipo_grafico == "linha" and len(tabela) > limite_pontos:
+        tabela = tabela.iloc[lttb(tabela[campo_valor].to_numpy(), limite_pontos)].reset_index(drop=True)
+    return tabela
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+# Rollups da dashboard: agregados dia × categoria × tipo calculados uma vez quando os dados chegam.
+# Cartões e gráficos que só dependem dessas dimensões e de "valor" são respondidos a partir deles,
+# sem varrer as movimentações de novo; o resto continua usando o DataFrame filtrado.
+#
+# As somas são guardadas em centavos (inteiros exatos em float64), então o resultado é a soma exata;
+# a soma linha a linha do pandas pode diferir dela apenas no último dígito de ponto flutuante.
+
+DIMENSOES = ["categoria", "tipo"]
+
+
+def construir_rollup(df):
+    """Agrega as movimentações por dia, categoria e tipo. Retorna None se os dados não permitirem."""
+    if "datamovimentacao" not in df.columns or "valor" not in df.columns:
+        return None
+    if not pd.api.types.is_numeric_dtype(df["valor"]) or not pd.api.types.is_datetime64_any_dtype(df["datamovimentacao"]):
+        return None
+
+    # O filtro por período compara timestamps; só dá para agregar por dia se não houver horário
+    datas = df["datamovimentacao"]
+    if not (datas.dropna() == datas.dropna().dt.normalize()).all():
+        return None
+
+    # Só vale para valores com até duas casas decimais, que viram centavos exatos
+    if pd.api.types.is_integer_dtype(df["valor"]):
+        centavos = df["valor"] * 100
+    else:
+        centavos = np.round(df["valor"] * 100)
+        if not (centavos / 100 == df["valor"])[df["valor"].notna()].all():
+            return None
+
+    chaves = ["datamovimentacao"] + [dimensao for dimensao in DIMENSOES if dimensao in df.columns]
+    rollup = (
+        df.assign(centavos=centavos)
+        .groupby(chaves, dropna=False, sort=True)
+        .agg(
+            soma_centavos=("centavos", "sum"),
+            quantidade=("valor", "count"),
+            linhas=("valor", "size"),
+            minimo=("valor", "min"),
+            maximo=("valor", "max"),
+        )
+        .reset_index()
+    )
+    return rollup
+
+
+def filtrar_rollup(rollup, data_inicio, data_fim, categorias):
+    """Mesmo filtro de período e categorias aplicado às movimentações, sobre o rollup."""
+    dias = rollup["datamovimentacao"]
+    filtrado = rollup[(dias >= pd.to_datetime(data_inicio)) & (dias <= pd.to_datetime(data_fim))]
+    if categorias is not None:
+        filtrado = filtrado[filtrado["categoria"].isin(categorias)]
+    return filtrado
+
+
+def _centavos_para_valor(centavos):
+    """Converte de volta para a unidade original (inteiro se a coluna "valor" era inteira)."""
+    if np.issubdtype(np.asarray(centavos).dtype, np.integer):
+        return centavos // 100
+    return centavos / 100
+
+
+def suporta_cartao(rollup, campo, tipo_agregacao):
+    if campo == "valor":
+        return tipo_agregacao in ("soma", "media", "max", "min")
+    return tipo_agregacao == "contagem" and (campo == "datamovimentacao" or (campo in DIMENSOES and campo in rollup.columns))
+
+
+def agregar_cartao_rollup(filtrado, campo, tipo_agregacao):
+    if tipo_agregacao == "contagem":
+        return filtrado[campo].nunique()
+
+    if tipo_agregacao == "max":
+        return filtrado["maximo"].max()
+    if tipo_agregacao == "min":
+        return filtrado["minimo"].min()
+
+    soma = _centavos_para_valor(filtrado["soma_centavos"].sum())
+    if tipo_agregacao == "soma":
+        return soma.round(2)
+    quantidade = filtrado["quantidade"].sum()
+    return np.float64(soma / quantidade if quantidade else np.nan).round(2)
+
+
+def suporta_grafico(rollup, campo1, campo2, modo):
+    dimensoes = [dimensao for dimensao in DIMENSOES if dimensao in rollup.columns]
+    if modo == "data":
+        return campo2 == "valor"
+    if modo in ("categoria", "pizza"):
+        return campo1 in dimensoes and campo2 == "valor"
+    if modo == "empilhado":
+        return campo1 in dimensoes and campo2 in dimensoes and campo1 != campo2
+    return False
+
+
+def agregar_por_dia_rollup(filtrado, campo2):
+    """Soma de "valor" por dia, na unidade original."""
+    return _centavos_para_valor(filtrado.groupby("datamovimentacao")["soma_centavos"].sum()).rename(campo2)
+
+
+def agregar_grafico_rollup(filtrado, campo1, campo2, modo, formato_exibicao):
+    if modo == "empilhado":
+        return filtrado.groupby([campo1, campo2])["linhas"].sum().reset_index(name='count')
+
+    if modo == "data":
+        por_dia = filtrado.groupby("datamovimentacao")["soma_centavos"].sum()
+        por_data = por_dia.groupby(por_dia.index.strftime(formato_exibicao).astype(str)).sum()
+        por_data.index.name = "data_exibicao"
+    else:
+        por_data = filtrado.groupby(campo1)["soma_centavos"].sum()
+
+    serie = _centavos_para_valor(por_data).rename(campo2)
+    if modo == "pizza":
+        return serie.abs()
+    return serie.reset_index()
@@ -0,0 +1,81 @@
+import argparse
+import gc
+import os
+import sys
+
+# O app só é importado depois de ler os argumentos (ver __main__), mas ainda no processo principal,
+# antes do fork dos workers: assim todos compartilham a mesma cópia do modelo em memória (copy-on-write).
+#
+# Cada worker cria depois o seu pool de categorização (tarefas.py) quando recebe um upload grande. Esses
+# processos vêm do forkserver, não do fork do worker, e carregam o próprio modelo; o tamanho padrão do pool
+# divide os núcleos pelo número de workers, que vai para STRATFY_WORKERS antes da importação.
+
+
+def configurar_argumentos():
+    parser = argparse.ArgumentParser(description="Servidor de produção da API de categorização de extratos.")
+    parser.add_argument('--host', default=os.environ.get('STRATFY_HOST', '127.0.0.1'))
+    parser.add_argument('--porta', type=int, default=int(os.environ.get('STRATFY_PORTA', 8000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('STRATFY_WORKERS', os.cpu_count() or 1)),
+                        help="Número de processos (ignorado no Windows, que não tem fork)")
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('STRATFY_THREADS', 4)),
+                        help="Threads por processo")
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('STRATFY_TIMEOUT', 120)),
+                        help="Tempo máximo de uma requisição, em segundos")
+    parser.add_argument('--limite-upload-mb', type=int, default=int(os.environ.get('STRATFY_LIMITE_UPLOAD_MB', 500)),
+                        help="Tamanho máximo do arquivo enviado, em MB")
+    return parser.parse_args()
+
+
+def rodar_gunicorn(app, args):
+    from gunicorn.app.base import BaseApplication
+
+    class ServidorGunicorn(BaseApplication):
+        def __init__(self, aplicacao, opcoes):
+            self.aplicacao = aplicacao
+            self.opcoes = opcoes
+            super().__init__()
+
+        def load_config(self):
+            for chave, valor in self.opcoes.items():
+                self.cfg.set(chave, valor)
+
+        def load(self):
+            return self.aplicacao
+
+    # Objetos criados até aqui (modelo, cache) não são mais varridos pelo GC,
+    # o que evita que os workers toquem nessas páginas e quebrem o compartilhamento
+    gc.freeze()
+
+    ServidorGunicorn(app, {
+        'bind': f"{args.host}:{args.porta}",
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'graceful_timeout': args.timeout,
+        'preload_app': True,
+    }).run()
+
+
+def rodar_waitress(app, args):
+    from waitress import serve
+
+    print("Aviso: fork indisponível nesta plataforma; usando um único processo com várias threads.")
+    serve(app, host=args.host, port=args.porta, threads=args.threads, channel_timeout=args.timeout,
+          max_request_body_size=app.config['MAX_CONTENT_LENGTH'])
+
+
+if __name__ == "__main__":
+    args = configurar_argumentos()
+    # Sem fork no Windows: um único processo
+    os.environ['STRATFY_WORKERS'] = '1' if sys.platform == 'win32' else str(args.workers)
+    if sys.platform != 'win32':
+        # Uma thread de carregamento não sobrevive ao fork: o modelo precisa estar pronto antes dos workers
+        os.environ['STRATFY_INICIO_RAPIDO'] = '0'
+    from api_csv import app
+    app.config['MAX_CONTENT_LENGTH'] = args.limite_upload_mb * 1024 * 1024
+
+    if sys.platform == 'win32':
+        rodar_waitress(app, args)
+    else:
+        rodar_gunicorn(app, args)
@@ -0,0 +1,200 @@
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import chain
+
+from metricas import metricas_processo, processo_vivo
+
+# Status das tarefas fica em disco para que qualquer worker do servidor consiga responder à consulta. O
+# resultado vai para um arquivo à parte, referenciado no status. Cada status guarda o pid do worker que
+# executa a tarefa: se ele morrer (reinício ou reciclagem do worker), a tarefa é marcada como erro.
+PASTA_TAREFAS = os.path.join(tempfile.gettempdir(), 'stratfy_tarefas')
+VALIDADE_TAREFAS_SEGUNDOS = 60 * 60
+
+# Cada worker do servidor de produção (servidor.py) cria o seu próprio pool, então por padrão os núcleos
+# são divididos entre os STRATFY_WORKERS workers; STRATFY_PROCESSOS_CATEGORIZACAO fixa o tamanho do pool.
+PROCESSOS_CATEGORIZACAO = int(os.environ.get('STRATFY_PROCESSOS_CATEGORIZACAO')
+                              or max(1, (os.cpu_count() or 1) // int(os.environ.get('STRATFY_WORKERS', 1))))
+TAMANHO_SHARD = 20000
+
+PADRAO_ID_TAREFA = re.compile(r'^[0-9a-f]{32}$')
+
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def obter_pool():
+    """Cria o pool de processos na primeira utilização e o reaproveita nas seguintes.
+
+    Os processos não saem de um fork do worker: o worker gthread tem várias threads e o fork poderia
+    copiar um lock travado por outra delas. Eles vêm do forkserver (spawn onde não há forkserver), sem
+    nada pré-carregado; cada processo importa o módulo da função recebida e carrega o próprio modelo.
+    """
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                contexto = multiprocessing.get_context('forkserver')
+                contexto.set_forkserver_preload([])
+            else:
+                contexto = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=PROCESSOS_CATEGORIZACAO, mp_context=contexto)
+        return _pool
+
+
+def dividir_em_shards(df, tamanho_shard=TAMANHO_SHARD):
+    return [df.iloc[inicio:inicio + tamanho_shard] for inicio in range(0, len(df), tamanho_shard)]
+
+
+def concatenar_listas(resultados):
+    return list(chain.from_iterable(resultados))
+
+
+def executar_shard(funcao, shard):
+    """Roda num processo do pool: aplica `funcao` ao shard e devolve também as métricas registradas nele."""
+    metricas = metricas_processo()
+    # Descarta o que o processo registrou ao iniciar (importação do módulo, carga do modelo)
+    metricas.extrair()
+    resultado = funcao(shard)
+    return resultado, metricas.extrair()
+
+
+def processar_em_paralelo(df, funcao, ao_concluir_shard=None, juntar=concatenar_listas):
+    """Divide o DataFrame em shards, aplica `funcao` a cada um no pool de processos e junta os resultados na ordem original.
+
+    `funcao` precisa ser definida no nível de um módulo para poder ser enviada aos processos.
+    `ao_concluir_shard(concluidos, total)` é chamada a cada shard finalizado.
+    `juntar` recebe a lista de resultados dos shards (por padrão, listas concatenadas).
+    Contadores e histogramas registrados nos processos do pool são somados às métricas deste processo.
+    """
+    shards = dividir_em_shards(df)
+    if len(shards) <= 1:
+        resultado = funcao(df)
+        if ao_concluir_shard:
+            ao_concluir_shard(1, 1)
+        return resultado
+
+    pool = obter_pool()
+    futuros = {pool.submit(executar_shard, funcao, shard): indice for indice, shard in enumerate(shards)}
+    resultados = [None] * len(shards)
+    for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+        resultados[futuros[futuro]], metricas_shard = futuro.result()
+        metricas_processo().somar(metricas_shard)
+        if ao_concluir_shard:
+            ao_concluir_shard(concluidos, len(shards))
+    return juntar(resultados)
+
+
+def _caminho_tarefa(id_tarefa):
+    return os.path.join(PASTA_TAREFAS, f"{id_tarefa}.json")
+
+
+def caminho_upload_tarefa(id_tarefa):
+    return os.path.join(PASTA_TAREFAS, f"{id_tarefa}.csv")
+
+
+def caminho_resultado_tarefa(id_tarefa):
+    return os.path.join(PASTA_TAREFAS, f"{id_tarefa}.resultado.json")
+
+
+def _gravar_json(caminho, conteudo):
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(conteudo, arquivo)
+    os.replace(temporario, caminho)
+
+
+def _gravar_tarefa(id_tarefa, status):
+    _gravar_json(_caminho_tarefa(id_tarefa), status)
+
+
+def _marcar_se_orfa(status):
+    """Marca como erro a tarefa pendente ou em andamento cujo processo não existe mais. Retorna o status."""
+    if status.get("estado") in ("pendente", "processando") and not processo_vivo(status.get("pid", 0)):
+        status = {"id": status["id"], "estado": "erro", "progresso": status.get("progresso", 0.0),
+                  "erro": "Tarefa interrompida: o processo que a executava foi encerrado. Envie o arquivo de novo."}
+        _gravar_tarefa(status["id"], status)
+    return status
+
+
+def marcar_tarefas_orfas():
+    """Na inicialização do servidor: marca como erro as tarefas deixadas por processos encerrados."""
+    for nome in os.listdir(PASTA_TAREFAS) if os.path.isdir(PASTA_TAREFAS) else []:
+        id_tarefa = nome[:-len(".json")]
+        if not (nome.endswith(".json") and PADRAO_ID_TAREFA.match(id_tarefa)):
+            continue
+        try:
+            with open(_caminho_tarefa(id_tarefa), 'r', encoding='utf-8') as arquivo:
+                _marcar_se_orfa(json.load(arquivo))
+        except (OSError, ValueError):
+            continue
+
+
+def limpar_tarefas_antigas():
+    limite = time.time() - VALIDADE_TAREFAS_SEGUNDOS
+    for nome in os.listdir(PASTA_TAREFAS):
+        caminho = os.path.join(PASTA_TAREFAS, nome)
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except OSError:
+            pass
+
+
+def criar_tarefa():
+    """Registra uma nova tarefa pendente e retorna seu id."""
+    os.makedirs(PASTA_TAREFAS, exist_ok=True)
+    limpar_tarefas_antigas()
+    id_tarefa = uuid.uuid4().hex
+    _gravar_tarefa(id_tarefa, {"id": id_tarefa, "estado": "pendente", "progresso": 0.0, "pid": os.getpid()})
+    return id_tarefa
+
+
+def consultar_tarefa(id_tarefa):
+    """Retorna o status da tarefa, ou None se o id não existir.
+
+    Concluída, o status traz em "arquivo_resultado" o nome do arquivo do resultado (ver caminho_resultado_tarefa).
+    """
+    if not PADRAO_ID_TAREFA.match(id_tarefa):
+        return None
+    try:
+        with open(_caminho_tarefa(id_tarefa), 'r', encoding='utf-8') as arquivo:
+            return _marcar_se_orfa(json.load(arquivo))
+    except FileNotFoundError:
+        return None
+
+
+def executar_tarefa(id_tarefa, funcao, *args):
+    """Executa `funcao(*args, ao_concluir_shard=...)` em uma thread e registra progresso, resultado ou erro.
+
+    `funcao` retorna uma tupla (resultado, mensagem_erro); o resultado é gravado em caminho_resultado_tarefa.
+    """
+    pid = os.getpid()
+
+    def atualizar_progresso(concluidos, total):
+        _gravar_tarefa(id_tarefa, {"id": id_tarefa, "estado": "processando", "progresso": concluidos / total,
+                                   "shards_concluidos": concluidos, "total_shards": total, "pid": pid})
+
+    def rodar():
+        _gravar_tarefa(id_tarefa, {"id": id_tarefa, "estado": "processando", "progresso": 0.0, "pid": pid})
+        try:
+            resultado, erro = funcao(*args, ao_concluir_shard=atualizar_progresso)
+        except Exception as e:
+            traceback.print_exc()
+            resultado, erro = None, str(e)
+
+        if erro:
+            _gravar_tarefa(id_tarefa, {"id": id_tarefa, "estado": "erro", "progresso": 1.0, "erro": erro})
+        else:
+            _gravar_json(caminho_resultado_tarefa(id_tarefa), resultado)
+            _gravar_tarefa(id_tarefa, {"id": id_tarefa, "estado": "concluida", "progresso": 1.0,
+                                       "arquivo_resultado": os.path.basename(caminho_resultado_tarefa(id_tarefa))})
+
+    threading.Thread(target=rodar, daemon=True).start()
@@ -0,0 +1,56 @@
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def enviar(url, conteudo, nome_arquivo):
+    inicio = time.perf_counter()
+    resposta = requests.post(url, files={'file': (nome_arquivo, conteudo, 'text/csv')})
+    return time.perf_counter() - inicio, resposta.status_code
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def teste_carga(url, conteudo, nome_arquivo, concorrencia, total):
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        inicio = time.perf_counter()
+        resultados = list(executor.map(lambda _: enviar(url, conteudo, nome_arquivo), range(total)))
+        duracao = time.perf_counter() - inicio
+
+    latencias = [latencia for latencia, status in resultados if status == 200]
+    erros = len(resultados) - len(latencias)
+
+    print(f"Requisições: {total}  Concorrência: {concorrencia}  Erros: {erros}")
+    print(f"Vazão: {total / duracao:.1f} req/s")
+    if latencias:
+        print(f"p50: {percentil(latencias, 50) * 1000:.0f} ms")
+        print(f"p99: {percentil(latencias, 99) * 1000:.0f} ms")
+        print(f"média: {statistics.mean(latencias) * 1000:.0f} ms  máx: {max(latencias) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Teste de carga do /api/uploadcsv com uploads simultâneos.")
+    parser.add_argument('--url', default='http://127.0.0.1:8000/api/uploadcsv')
+    parser.add_argument('--concorrencia', type=int, default=8)
+    parser.add_argument('--requisicoes', type=int, default=100)
+    parser.add_argument('--arquivo', default='Exemplo Extrato.csv',
+                        help="CSV enviado em cada requisição")
+    parser.add_argument('--linhas', type=int,
+                        help="Gera um extrato sintético com esse número de linhas em vez de usar --arquivo")
+    args = parser.parse_args()
+
+    if args.linhas:
+        from benchmark import gerar_csv
+        conteudo = gerar_csv(args.linhas)
+    else:
+        with open(args.arquivo, 'rb') as arquivo:
+            conteudo = arquivo.read()
+
+    teste_carga(args.url, conteudo, 'extrato.csv', args.concorrencia, args.requisicoes)
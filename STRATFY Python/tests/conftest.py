@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Os módulos ficam soltos na pasta "STRATFY Python" e abrem os artefatos (modelo, TreinoML.json) por caminho
+# relativo, como quando são executados direto de lá
+PASTA_PACOTE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PASTA_PACOTE)
+os.chdir(PASTA_PACOTE)
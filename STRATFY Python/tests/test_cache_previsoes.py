@@ -0,0 +1,91 @@
+import json
+
+import numpy as np
+
+from modelo_categorizacao import CachePrevisoes, agrupar_descricoes, normalizar_descricao, prever_categorias
+
+
+class ModeloContador:
+    """Modelo falso: a categoria é a primeira palavra e cada descrição enviada ao predict é registrada."""
+
+    versao = "v1"
+    classes_ = np.array(["mercado", "uber"])
+
+    def __init__(self):
+        self.recebidas = []
+
+    def predict(self, descricoes):
+        self.recebidas.append(list(descricoes))
+        return np.array([descricao.split()[0].lower() for descricao in descricoes], dtype=object)
+
+
+def test_normalizar_descricao_so_muda_o_que_o_vetorizador_ignora():
+    assert normalizar_descricao("  PAGTO Açaí 12/03/2024  R$ 1.234,56 ") == "pagto açaí 12/03/2024 r$ 1.234,56"
+
+
+def test_agrupar_descricoes_junta_textos_com_a_mesma_chave():
+    codigos, chaves = agrupar_descricoes(["Uber 01/02", "UBER  01/02", "Mercado", "Uber 01/02"])
+    assert chaves == ["uber 01/02", "mercado"]
+    assert codigos.tolist() == [0, 0, 1, 0]
+
+
+def test_prever_categorias_consulta_o_modelo_so_para_chaves_novas():
+    modelo, cache = ModeloContador(), CachePrevisoes()
+
+    assert prever_categorias(modelo, ["Uber 01/02", "Mercado 10,00", "uber 01/02"], cache) == ["uber", "mercado", "uber"]
+    assert modelo.recebidas == [["uber 01/02", "mercado 10,00"]]
+    assert cache.estatisticas()["falhas"] == 2
+    assert cache.estatisticas()["acertos"] == 1
+
+    assert prever_categorias(modelo, ["UBER 01/02", "Mercado  10,00"], cache) == ["uber", "mercado"]
+    assert len(modelo.recebidas) == 1
+    assert cache.estatisticas()["acertos"] == 3
+
+
+def test_previsao_do_cache_e_igual_a_previsao_sem_cache():
+    from modelo_compacto import carregar_modelo_compacto
+    from modelo_categorizacao import PASTA_MODELO_COMPACTO
+
+    modelo = carregar_modelo_compacto(PASTA_MODELO_COMPACTO)
+    variantes = ["Compra débito 123 loja", "Compra debito 456 loja", "COMPRA  DÉBITO 123 LOJA",
+                 "Pix João 01/02", "pix joao 02/03", "Mercado R$ 10,00", "mercado 99,90"]
+    esperadas = modelo.predict(variantes).tolist()
+    # Em qualquer ordem de chegada, o que vem do cache é o que o modelo prevê para a própria descrição
+    for ordem in (variantes, variantes[::-1]):
+        cache = CachePrevisoes()
+        previstas = [prever_categorias(modelo, [descricao], cache)[0] for descricao in ordem + ordem]
+        assert previstas == [esperadas[variantes.index(descricao)] for descricao in ordem + ordem]
+
+
+def test_cache_e_descartado_quando_a_versao_do_modelo_muda():
+    modelo, cache = ModeloContador(), CachePrevisoes()
+    prever_categorias(modelo, ["Uber"], cache)
+
+    modelo.versao = "v2"
+    prever_categorias(modelo, ["Uber"], cache)
+    assert modelo.recebidas == [["uber"], ["uber"]]
+
+
+def test_cache_respeita_o_tamanho_maximo():
+    modelo, cache = ModeloContador(), CachePrevisoes(tamanho_maximo=2)
+    prever_categorias(modelo, ["Uber a", "Uber b", "Uber c"], cache)
+    assert len(cache) == 2
+    prever_categorias(modelo, ["Uber a"], cache)
+    assert modelo.recebidas[-1] == ["uber a"]
+
+
+def test_cache_persistido_em_disco(tmp_path):
+    arquivo = str(tmp_path / "cache.json")
+    modelo, cache = ModeloContador(), CachePrevisoes(arquivo=arquivo)
+    prever_categorias(modelo, ["Uber 01/02"], cache)
+    cache.salvar()
+
+    recarregado = CachePrevisoes(arquivo=arquivo)
+    assert prever_categorias(modelo, ["UBER 01/02"], recarregado) == ["uber"]
+    assert len(modelo.recebidas) == 1
+
+
+def test_cache_gravado_com_outro_formato_de_chave_e_descartado(tmp_path):
+    arquivo = tmp_path / "cache.json"
+    arquivo.write_text(json.dumps({"versao": "v1", "entradas": [["uber <data>", "mercado"]]}))
+    assert len(CachePrevisoes(arquivo=str(arquivo))) == 0
@@ -0,0 +1,68 @@
+import io
+import json
+import os
+import stat
+
+import pytest
+
+from cache_resultados import CacheResultados
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CacheResultados(pasta=str(tmp_path / "resultados"), tamanho_maximo=10_000)
+
+
+def chave(cache, conteudo, *componentes):
+    return cache.chave(io.BytesIO(conteudo), *componentes)
+
+
+def test_chave_depende_do_conteudo_e_dos_componentes(cache):
+    assert chave(cache, b"a;b", "v1", "json") == chave(cache, b"a;b", "v1", "json")
+    assert chave(cache, b"a;b", "v1", "json") != chave(cache, b"a;c", "v1", "json")
+    assert chave(cache, b"a;b", "v1", "json") != chave(cache, b"a;b", "v2", "json")
+
+
+def test_corpo_e_cabecalhos_voltam_juntos(cache):
+    assert cache.obter("x") is None
+    cache.guardar("x", b"[1, 2]", {"X-Linhas-Invalidas": '{"data": 1}'})
+    assert cache.obter("x") == (b"[1, 2]", {"X-Linhas-Invalidas": '{"data": 1}'})
+    cache.guardar("y", b"[]")
+    assert cache.obter("y") == (b"[]", {})
+
+
+def test_descarta_os_menos_usados(cache):
+    for indice in range(3):
+        cache.guardar(f"k{indice}", b"x" * 3000)
+        os.utime(cache._caminho(f"k{indice}"), (indice, indice))
+    cache.obter("k0")
+    cache.guardar("k3", b"x" * 3000)
+
+    presentes = [nome for nome in ["k0", "k1", "k2", "k3"] if cache.obter(nome) is not None]
+    assert presentes == ["k0", "k2", "k3"]
+
+
+def test_pasta_so_acessivel_ao_dono(cache):
+    os.makedirs(cache.pasta, mode=0o755)
+    cache.guardar("x", b"extrato")
+    assert stat.S_IMODE(os.stat(cache.pasta).st_mode) == 0o700
+
+
+def test_reenvio_devolve_a_resposta_gravada_com_o_relatorio(tmp_path, monkeypatch):
+    import api_csv
+
+    monkeypatch.setattr(api_csv, "cache_resultados", CacheResultados(pasta=str(tmp_path / "api")))
+    monkeypatch.setitem(api_csv.app.config, "CACHE_RESULTADOS", True)
+    cliente = api_csv.app.test_client()
+    extrato = "data;descricao;valor\n01/02/2025;Uber;-20,00\nontem;Mercado;-10,00\n".encode()
+
+    def enviar(consulta=""):
+        return cliente.post(f"/api/uploadcsv{consulta}", data={"file": (io.BytesIO(extrato), "a.csv")})
+
+    primeira, segunda = enviar(), enviar()
+    assert (primeira.headers["X-Cache"], segunda.headers["X-Cache"]) == ("MISS", "HIT")
+    assert segunda.data == primeira.data
+    assert json.loads(segunda.headers["X-Linhas-Invalidas"]) == json.loads(primeira.headers["X-Linhas-Invalidas"])
+    assert json.loads(primeira.headers["X-Linhas-Invalidas"])["data"]["linhas"] == [3]
+    # Outras opções de confiança não reaproveitam a resposta
+    assert enviar("?topk=2").headers["X-Cache"] == "MISS"
@@ -0,0 +1,90 @@
+import io
+
+import numpy as np
+import pytest
+
+from formato_colunar import MIME_ARROW, ler_tabela
+from modelo_categorizacao import CachePrevisoes, calibrar_probabilidades, prever_probabilidades, top_k_categorias
+
+EXTRATO = "data;descricao;valor\n01/02/2025;Posto Shell;-20,00\n02/02/2025;Mercado;-10,00\n03/02/2025;xyz;-5,00\n"
+
+
+def test_top_k_ordena_por_probabilidade_e_desempata_pela_ordem_das_classes():
+    classes = np.array(["A", "B", "C"])
+    probabilidades = np.array([[0.2, 0.5, 0.3], [0.4, 0.2, 0.4]])
+    nomes, valores = top_k_categorias(classes, probabilidades, 2)
+    assert nomes.tolist() == [["B", "C"], ["A", "C"]]
+    assert valores.tolist() == [[0.5, 0.3], [0.4, 0.4]]
+
+
+def test_temperatura_muda_a_confianca_mas_nao_a_ordem():
+    probabilidades = np.array([[0.5, 0.3, 0.2], [0.1, 0.1, 0.8]])
+    calibradas = calibrar_probabilidades(probabilidades, 0.5)
+    assert np.allclose(calibradas.sum(axis=1), 1)
+    assert (calibradas.argmax(axis=1) == probabilidades.argmax(axis=1)).all()
+    assert (calibradas.max(axis=1) > probabilidades.max(axis=1)).all()
+    assert calibrar_probabilidades(probabilidades, 1.0) is probabilidades
+
+
+class ModeloSemTemperatura:
+    versao = "sem-temperatura"
+    classes_ = np.array(["A", "B"])
+
+    def predict_proba(self, descricoes):
+        return np.tile([0.7, 0.3], (len(descricoes), 1))
+
+
+def test_modelo_sem_temperatura_avisa_uma_vez_e_nao_calibra(capsys):
+    modelo = ModeloSemTemperatura()
+    _, probabilidades = prever_probabilidades(modelo, ["x", "y"])
+    prever_probabilidades(modelo, ["z"])
+    assert probabilidades.tolist() == [[0.7, 0.3], [0.7, 0.3]]
+    assert capsys.readouterr().out.count("sem-temperatura não tem temperatura calibrada") == 1
+
+
+def test_cache_de_probabilidades_devolve_os_mesmos_vetores():
+    import api_csv
+
+    modelo, cache = api_csv.obter_modelo(), CachePrevisoes()
+    descricoes = ["Posto Shell 12/03", "POSTO  shell 12/03", "Mercado", "xyz"]
+    _, esperadas = prever_probabilidades(modelo, descricoes)
+    _, primeira = prever_probabilidades(modelo, descricoes, cache)
+    _, segunda = prever_probabilidades(modelo, descricoes, cache)
+    assert np.allclose(primeira, esperadas) and np.allclose(segunda, esperadas)
+    assert cache.estatisticas()["falhas"] == 3
+
+
+@pytest.fixture
+def cliente():
+    import api_csv
+
+    return api_csv.app.test_client()
+
+
+def enviar(cliente, consulta, **cabecalhos):
+    return cliente.post(f"/api/uploadcsv{consulta}", data={"file": (io.BytesIO(EXTRATO.encode()), "a.csv")},
+                        headers=cabecalhos)
+
+
+def test_revisao_traz_as_mesmas_linhas_em_json_e_arrow(cliente):
+    import api_csv
+
+    _, probabilidades = prever_probabilidades(api_csv.obter_modelo(), ["Posto Shell"])
+    confianca = float(probabilidades.max())
+    # Limiares entre a confiança e o valor arredondado (4 casas, como no JSON) e logo acima dela
+    for limiar in ((confianca + round(confianca, 4)) / 2, float(np.nextafter(confianca, 1))):
+        consulta = f"?revisao={limiar!r}"
+        json_ = [movimentacao["Descricao"] for movimentacao in enviar(cliente, consulta).get_json()]
+        resposta = enviar(cliente, consulta, Accept=MIME_ARROW)
+        arrow = ler_tabela(resposta.data, MIME_ARROW).column("Descricao").to_pylist()
+        assert ("Posto Shell" in json_) == (confianca < limiar)
+        assert json_ == arrow
+
+
+def test_lote_com_revisao_mantem_o_arquivo_de_cada_movimentacao(cliente):
+    arquivos = [(io.BytesIO(EXTRATO.encode()), "a.csv"),
+                (io.BytesIO(EXTRATO.replace("xyz", "abc").encode()), "b.csv")]
+    resposta = cliente.post("/api/uploadcsv/lote?revisao=1", data={"files": arquivos}).get_json()
+    origem = {movimentacao["Descricao"]: movimentacao["Arquivo"] for movimentacao in resposta["movimentacoes"]}
+    assert origem["xyz"] == "a.csv" and origem["abc"] == "b.csv"
+    assert [item["movimentacoes"] for item in resposta["arquivos"]] == [3, 1]
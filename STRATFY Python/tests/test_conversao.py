@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conversao import (converter_datas, converter_valores, detectar_formato_data, detectar_separador_decimal,
+                       relatorio_invalidas)
+
+
+def serie(*valores):
+    return pd.Series(list(valores), dtype=object)
+
+
+@pytest.mark.parametrize("valores, formato", [
+    (["2025-02-01", "2025-02-13"], "%Y-%m-%d"),
+    (["01/02/2025", "13/02/2025"], "%d/%m/%Y"),
+    (["01/02/25", "13/02/25"], "%d/%m/%y"),
+    (["01.02.2025", "13.02.2025"], "%d.%m.%Y"),
+    (["02/13/2025", "02/01/2025"], "%m/%d/%Y"),
+])
+def test_detectar_formato_data(valores, formato):
+    assert detectar_formato_data(serie(*valores)) == formato
+
+
+def test_datas_ambiguas_sao_lidas_como_dia_mes():
+    datas = converter_datas(serie("01/02/2025", "03/04/2025"))
+    assert datas.tolist() == [pd.Timestamp("2025-02-01"), pd.Timestamp("2025-04-03")]
+
+
+def test_converter_datas_com_valores_invalidos_e_ausentes():
+    originais = serie("01/02/2025", "ontem", None, " 13/02/2025 ", "01/02/2025", "")
+    datas = converter_datas(originais)
+    assert datas.index.equals(originais.index)
+    assert datas.iloc[0] == datas.iloc[4] == pd.Timestamp("2025-02-01")
+    assert datas.iloc[3] == pd.Timestamp("2025-02-13")
+    assert datas.iloc[[1, 2, 5]].isna().all()
+
+
+def test_converter_datas_sem_formato_conhecido_infere_por_elemento():
+    datas = converter_datas(serie("1 de fev", "2025-02-01T10:00:00Z"))
+    assert pd.isna(datas.iloc[0])
+
+
+def test_converter_datas_ja_convertidas():
+    datas = pd.Series(pd.to_datetime(["2025-02-01"]))
+    assert converter_datas(datas) is datas
+
+
+@pytest.mark.parametrize("valores, decimal", [
+    (["1.234,56", "-30,00", "5,5"], ","),
+    (["1,234.56", "-30.00", "5.5"], "."),
+    (["R$ 1.234.567,89"], ","),
+    (["1,234,567.89"], "."),
+])
+def test_detectar_separador_decimal(valores, decimal):
+    assert detectar_separador_decimal(serie(*valores)) == decimal
+
+
+def test_converter_valores_em_formato_brasileiro():
+    valores = converter_valores(serie("1.234,56", "R$ -30,00", "(12,50)", "7,00-", "−3,20", "R$ 10,00", "42"))
+    np.testing.assert_allclose(valores, [1234.56, -30.0, -12.5, -7.0, -3.2, 10.0, 42.0])
+
+
+def test_converter_valores_em_formato_com_ponto():
+    valores = converter_valores(serie("1,234.56", "-30.00", "+5", ".5", "1e3"))
+    np.testing.assert_allclose(valores, [1234.56, -30.0, 5.0, 0.5, 1000.0])
+
+
+def test_converter_valores_invalidos_viram_nan():
+    valores = converter_valores(serie("10,00", "abc", None, "", "1,2,3,4", "R$"), decimal=",")
+    assert valores.iloc[0] == 10.0
+    assert valores.iloc[1:].isna().all()
+
+
+def test_converter_valores_numericos():
+    valores = pd.Series([1, 2, 3])
+    assert converter_valores(valores).dtype == float
+
+
+def test_relatorio_invalidas_numera_como_no_arquivo():
+    originais = serie("01/02/2025", "ontem", None, "  ", "32/13/2025", "01/02/2025")
+    relatorio = relatorio_invalidas(originais, converter_datas(originais))
+    # Cabeçalho é a linha 1; vazios e ausentes não contam como inválidos
+    assert relatorio == {"quantidade": 2, "linhas": [3, 6], "exemplos": ["ontem", "32/13/2025"]}
+
+
+def test_relatorio_invalidas_usa_a_posicao_e_nao_o_indice():
+    originais = pd.Series(["10,00", "abc", "x"], index=["a", "b", "c"], dtype=object)
+    relatorio = relatorio_invalidas(originais, converter_valores(originais), limite=1)
+    assert relatorio == {"quantidade": 2, "linhas": [3], "exemplos": ["abc"]}
+
+
+def test_relatorio_invalidas_sem_invalidas():
+    originais = serie("10,00", None)
+    assert relatorio_invalidas(originais, converter_valores(originais)) is None
@@ -0,0 +1,83 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from modelo_categorizacao import ModeloComCorrecoes, aplicar_correcoes, ler_correcoes
+
+
+class ModeloPrimeiraPalavra:
+    """Modelo falso: a categoria é a primeira palavra da descrição."""
+
+    versao = "v1"
+    temperatura = 0.5
+    classes_ = np.array(["mercado", "uber"], dtype=object)
+
+    def predict(self, descricoes):
+        return np.array([descricao.split()[0] for descricao in descricoes], dtype=object)
+
+    def predict_proba(self, descricoes):
+        return np.array([[0.9, 0.1] if descricao.startswith("mercado") else [0.2, 0.8] for descricao in descricoes])
+
+
+def aplicar_lote(pasta, indice):
+    aplicar_correcoes([f"uber viagem {indice}"] * 3, ["Transporte"] * 3, ModeloPrimeiraPalavra(),
+                      os.path.join(pasta, "correcoes.jsonl"))
+
+
+@pytest.mark.skipif(os.name != "posix", reason="o lock entre processos usa fcntl")
+def test_correcoes_simultaneas_de_processos_diferentes_nao_se_perdem(tmp_path):
+    contexto = multiprocessing.get_context("fork")
+    processos = [contexto.Process(target=aplicar_lote, args=(str(tmp_path), indice)) for indice in range(8)]
+    for processo in processos:
+        processo.start()
+    for processo in processos:
+        processo.join()
+    assert all(processo.exitcode == 0 for processo in processos)
+
+    with open(tmp_path / "correcoes.jsonl", encoding="utf-8") as arquivo:
+        assert len(arquivo.readlines()) == 8 * 3
+    assert sorted(ler_correcoes(str(tmp_path / "correcoes.jsonl"))) == [f"uber viagem {indice}" for indice in range(8)]
+
+
+def test_correcao_so_muda_a_descricao_corrigida():
+    base = ModeloPrimeiraPalavra()
+    modelo = ModeloComCorrecoes(base, {"uber eats": "Alimentação"})
+    descricoes = ["mercado x", "UBER  Eats", "uber viagem"]
+
+    assert modelo.predict(descricoes).tolist() == ["mercado", "Alimentação", "uber"]
+    assert modelo.classes_.tolist() == ["Alimentação", "mercado", "uber"]
+    assert modelo.predict_proba(descricoes).tolist() == [[0, 0.9, 0.1], [1, 0, 0], [0, 0.2, 0.8]]
+    assert modelo.temperatura == base.temperatura
+    assert modelo.versao != base.versao
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    import api_csv
+
+    monkeypatch.setattr(api_csv, "ARQUIVO_CORRECOES", str(tmp_path / "correcoes.jsonl"))
+    api_csv.carregar_modelo_inicial()
+    yield api_csv
+    monkeypatch.undo()
+    api_csv.carregar_modelo_inicial()
+
+
+def test_uma_correcao_nao_muda_as_outras_previsoes_do_extrato(api):
+    cliente = api.app.test_client()
+
+    def categorias():
+        with open("Exemplo Extrato.csv", "rb") as arquivo:
+            resposta = cliente.post("/api/uploadcsv", data={"file": (arquivo, "Exemplo Extrato.csv")})
+        return [movimentacao["Categoria"]["Nome"] for movimentacao in resposta.get_json()]
+
+    temperatura = api.obter_modelo().temperatura
+    antes = categorias()
+    resposta = cliente.post("/api/correcoes", json=[{"descricao": "Netflix assinatura", "categoriaId": 6}])
+    assert resposta.status_code == 200
+
+    assert categorias() == antes
+    assert api.obter_modelo().temperatura == temperatura
+    corrigida = api.prever_categorias(api.obter_modelo(), ["NETFLIX assinatura"])
+    assert corrigida == [nome for nome, id_categoria in api.categoria_nome_para_id.items() if id_categoria == 6]
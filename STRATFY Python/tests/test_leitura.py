@@ -0,0 +1,16 @@
+import io
+
+
+def test_bytes_legados_depois_da_amostra_nao_viram_caractere_de_substituicao(monkeypatch):
+    import api_csv
+
+    monkeypatch.setattr(api_csv, "TAMANHO_AMOSTRA", 1024)
+    # Amostra inicial em UTF-8 válido; a última linha veio de um sistema em cp1252
+    extrato = ("data;descricao;valor\n" + "01/02/2025;Padaria São João;-10,00\n" * 40).encode()
+    extrato += "02/02/2025;Farmácia Saúde;-30,00\n".encode('cp1252')
+
+    resposta = api_csv.app.test_client().post(
+        "/api/uploadcsv?stream=1", data={"file": (io.BytesIO(extrato), "a.csv")})
+    descricoes = [movimentacao["Descricao"] for movimentacao in resposta.get_json()]
+    assert descricoes[0] == "Padaria São João"
+    assert descricoes[-1] == "Farmácia Saúde"
@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+
+from metricas import RegistroMetricas
+
+
+def gravar_instantaneo(pasta, pid, valor):
+    with open(os.path.join(pasta, f"{pid}.json"), "w", encoding="utf-8") as arquivo:
+        json.dump({"valores": [["stratfy_requisicoes_total", [], valor]], "histogramas": []}, arquivo)
+
+
+def pid_encerrado():
+    processo = subprocess.Popen([sys.executable, "-c", "pass"])
+    processo.wait()
+    return processo.pid
+
+
+def test_coletar_soma_processos_vivos_e_apaga_os_encerrados(tmp_path):
+    registro = RegistroMetricas(pasta=str(tmp_path))
+    registro.incrementar("stratfy_requisicoes_total", 2)
+    gravar_instantaneo(tmp_path, os.getppid(), 3)
+    morto = pid_encerrado()
+    gravar_instantaneo(tmp_path, morto, 100)
+
+    valores, _ = registro.coletar()
+    assert valores["stratfy_requisicoes_total", ()] == 5
+    assert not (tmp_path / f"{morto}.json").exists()
+
+
+def test_exportar_no_formato_do_prometheus(tmp_path):
+    registro = RegistroMetricas(pasta=str(tmp_path))
+    registro.incrementar("stratfy_requisicoes_total", rota="/api/uploadcsv", status=200)
+    registro.observar("stratfy_requisicao_segundos", 0.02, rota="/api/uploadcsv")
+
+    texto = registro.exportar()
+    assert '# TYPE stratfy_requisicoes_total counter' in texto
+    assert 'stratfy_requisicoes_total{rota="/api/uploadcsv",status="200"} 1' in texto
+    assert 'stratfy_requisicao_segundos_bucket{rota="/api/uploadcsv",le="0.025"} 1' in texto
+    assert 'stratfy_requisicao_segundos_count{rota="/api/uploadcsv"} 1' in texto
+
+
+def test_extrair_e_somar_levam_contadores_e_histogramas_de_um_registro_para_outro(tmp_path):
+    origem, destino = RegistroMetricas(pasta=str(tmp_path)), RegistroMetricas(pasta=str(tmp_path))
+    origem.incrementar("stratfy_linhas_invalidas_total", 2, campo="data")
+    origem.definir("stratfy_cache_previsoes_tamanho", 7)
+    origem.observar("stratfy_etapa_segundos", 0.002, etapa="montar")
+    destino.observar("stratfy_etapa_segundos", 0.5, etapa="montar")
+
+    destino.somar(origem.extrair())
+    assert destino.valores["stratfy_linhas_invalidas_total", (("campo", "data"),)] == 2
+    assert ("stratfy_cache_previsoes_tamanho", ()) not in destino.valores
+    assert destino.histogramas["stratfy_etapa_segundos", (("etapa", "montar"),)][-1] == 2
+    # O que foi extraído não é contado de novo
+    assert origem.extrair() == {"valores": [], "histogramas": []}
+
+
+def test_metricas_dos_shards_do_pool_chegam_ao_processo_principal(monkeypatch):
+    from functools import partial
+
+    import api_csv
+    import tarefas
+
+    df = api_csv.preparar_df(api_csv.pd.DataFrame({
+        "data": ["01/02/2025"] * 4, "descricao": ["Uber", "Mercado", "Farmácia", "Aluguel"], "valor": ["-1,00"] * 4,
+    }))[0]
+    monkeypatch.setattr(tarefas, "dividir_em_shards", lambda df: [df.iloc[:2], df.iloc[2:]])
+    chave = "stratfy_modelo_latencia_segundos", (("etapa", "categorizacao"),)
+    antes = api_csv.metricas.histogramas.get(chave, [0])[-1]
+
+    movimentacoes = tarefas.processar_em_paralelo(df, partial(api_csv.montar_movimentacoes))
+    assert len(movimentacoes) == 4
+    assert api_csv.metricas.histogramas[chave][-1] == antes + 2
@@ -0,0 +1,64 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modelo_categorizacao import PASTA_MODELO_COMPACTO, carregar_modelo, prever_probabilidades
+from modelo_compacto import carregar_modelo_compacto, exportar_modelo_compacto
+
+DESCRICOES_EXTRAS = [
+    "",
+    "   ",
+    "financiamento imobiliáriozzzzzz",
+    "pagamento " + "x" * 200,
+    "palavraquenaoexistenovocabulario outra",
+    "UBER *TRIP 12/03 R$ 23,90",
+    "Farmácia São João",
+    "123 456",
+    "a b c",
+]
+
+
+@pytest.fixture(scope="module")
+def descricoes():
+    treino = pd.read_json("TreinoML.json")["descricao"].tolist()
+    # Tokens maiores que o maior termo do vocabulário, formados a partir de termos conhecidos
+    alongadas = [descricao + "zzzzzzzzzzzzzzzzzzzzzzzzzz" for descricao in treino[:50]]
+    return treino + alongadas + DESCRICOES_EXTRAS
+
+
+@pytest.fixture(scope="module")
+def modelos():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        pipeline = carregar_modelo()
+    return pipeline, carregar_modelo_compacto(PASTA_MODELO_COMPACTO)
+
+
+def test_compacto_preve_como_o_pipeline(modelos, descricoes):
+    pipeline, compacto = modelos
+    assert compacto.classes_.tolist() == pipeline.classes_.tolist()
+    assert compacto.predict(descricoes).tolist() == pipeline.predict(descricoes).tolist()
+    np.testing.assert_allclose(compacto.predict_proba(descricoes), pipeline.predict_proba(descricoes), atol=1e-9)
+
+
+def test_compacto_calibra_como_o_pipeline(modelos, descricoes):
+    pipeline, compacto = modelos
+    assert compacto.temperatura == pytest.approx(getattr(pipeline, "temperatura", 1.0))
+    np.testing.assert_allclose(prever_probabilidades(compacto, descricoes)[1],
+                               prever_probabilidades(pipeline, descricoes)[1], atol=1e-9)
+
+
+def test_exportacao_reproduz_o_pipeline(tmp_path, modelos, descricoes):
+    pipeline, _ = modelos
+    exportar_modelo_compacto(pipeline, str(tmp_path), "teste")
+    compacto = carregar_modelo_compacto(str(tmp_path))
+    assert compacto.versao == "teste"
+    np.testing.assert_allclose(compacto.predict_proba(descricoes), pipeline.predict_proba(descricoes), atol=1e-9)
+
+
+def test_lista_vazia(modelos):
+    _, compacto = modelos
+    assert compacto.predict([]).tolist() == []
+    assert compacto.predict_proba([]).shape == (0, len(compacto.classes_))
@@ -0,0 +1,59 @@
+import io
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+import tarefas
+
+
+@pytest.fixture(autouse=True)
+def pasta_tarefas(tmp_path, monkeypatch):
+    monkeypatch.setattr(tarefas, "PASTA_TAREFAS", str(tmp_path))
+    return tmp_path
+
+
+def pid_encerrado():
+    processo = subprocess.Popen([sys.executable, "-c", "pass"])
+    processo.wait()
+    return processo.pid
+
+
+def test_tarefa_de_processo_encerrado_vira_erro(pasta_tarefas):
+    id_tarefa = tarefas.criar_tarefa()
+    status = {"id": id_tarefa, "estado": "processando", "progresso": 0.5, "pid": pid_encerrado()}
+    (pasta_tarefas / f"{id_tarefa}.json").write_text(json.dumps(status))
+
+    tarefa = tarefas.consultar_tarefa(id_tarefa)
+    assert tarefa["estado"] == "erro" and "interrompida" in tarefa["erro"]
+    assert json.loads((pasta_tarefas / f"{id_tarefa}.json").read_text())["estado"] == "erro"
+
+
+def test_inicializacao_marca_as_tarefas_orfas(pasta_tarefas):
+    orfa, viva = tarefas.criar_tarefa(), tarefas.criar_tarefa()
+    (pasta_tarefas / f"{orfa}.json").write_text(json.dumps(
+        {"id": orfa, "estado": "pendente", "progresso": 0.0, "pid": pid_encerrado()}))
+
+    tarefas.marcar_tarefas_orfas()
+    assert json.loads((pasta_tarefas / f"{orfa}.json").read_text())["estado"] == "erro"
+    assert json.loads((pasta_tarefas / f"{viva}.json").read_text())["estado"] == "pendente"
+
+
+def test_resultado_fica_fora_do_status():
+    import api_csv
+
+    cliente = api_csv.app.test_client()
+    extrato = "data;descricao;valor\n01/02/2025;Uber;-20,00\n02/02/2025;Mercado;-10,00\n".encode()
+    id_tarefa = cliente.post("/api/uploadcsv?async=1", data={"file": (io.BytesIO(extrato), "a.csv")}).get_json()["id"]
+
+    for _ in range(100):
+        tarefa = cliente.get(f"/api/jobs/{id_tarefa}").get_json()
+        if tarefa["estado"] not in ("pendente", "processando"):
+            break
+        time.sleep(0.05)
+    assert tarefa["estado"] == "concluida" and "resultado" not in tarefa
+
+    movimentacoes = cliente.get(tarefa["resultado_url"]).get_json()
+    assert [movimentacao["Descricao"] for movimentacao in movimentacoes] == ["Uber", "Mercado"]
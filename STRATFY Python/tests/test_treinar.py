@@ -0,0 +1,69 @@
+import json
+import warnings
+
+import pandas as pd
+import pytest
+
+from modelo_categorizacao import carregar_modelo, treinar_modelo, versao_modelo
+from treinar import promover_modelo
+
+
+@pytest.fixture(scope="module")
+def dados():
+    return pd.read_json("TreinoML.json")
+
+
+@pytest.fixture
+def pasta_antiga(tmp_path):
+    """Pasta compacta de um modelo anterior, que a API carregaria antes do pkl."""
+    pasta = tmp_path / "modelo_categorizacao_npy"
+    pasta.mkdir()
+    (pasta / "metadados.json").write_text(json.dumps({"formato": 1, "versao": "antigo"}))
+    return pasta
+
+
+def test_promover_char_wb_remove_o_modelo_compacto_antigo(tmp_path, dados, pasta_antiga):
+    modelo = treinar_modelo(dados, {"analyzer": "char_wb", "ngram_range": (2, 4)})
+    arquivo = tmp_path / "modelo_categorizacao.pkl"
+
+    assert promover_modelo(modelo, str(arquivo), str(pasta_antiga)) is False
+    assert not pasta_antiga.exists()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        promovido = carregar_modelo(str(arquivo))
+    assert promovido.named_steps["tfidf"].analyzer == "char_wb"
+    assert versao_modelo(promovido) == versao_modelo(modelo)
+
+
+def test_promover_word_substitui_o_modelo_compacto(tmp_path, dados, pasta_antiga):
+    modelo = treinar_modelo(dados, {"analyzer": "word", "ngram_range": (1, 1)})
+
+    assert promover_modelo(modelo, str(tmp_path / "modelo_categorizacao.pkl"), str(pasta_antiga)) is True
+    metadados = json.loads((pasta_antiga / "metadados.json").read_text())
+    assert metadados["versao"] == versao_modelo(modelo)
+
+
+def test_api_serve_o_modelo_promovido_depois_de_uma_correcao(tmp_path, dados, monkeypatch):
+    import api_csv
+
+    pasta, arquivo = tmp_path / "modelo_categorizacao_npy", tmp_path / "modelo_categorizacao.pkl"
+    monkeypatch.setattr(api_csv, "PASTA_MODELO_COMPACTO", str(pasta))
+    monkeypatch.setattr(api_csv, "ARQUIVO_MODELO", str(arquivo))
+    monkeypatch.setattr(api_csv, "ARQUIVO_CORRECOES", str(tmp_path / "correcoes.jsonl"))
+    promover_modelo(treinar_modelo(dados, {"alpha": 1.0}), str(arquivo), str(pasta))
+    api_csv.carregar_modelo_inicial()
+    try:
+        cliente = api_csv.app.test_client()
+        resposta = cliente.post("/api/correcoes", json=[{"descricao": "Netflix assinatura", "categoriaId": 6}])
+        assert resposta.status_code == 200
+
+        promovido = treinar_modelo(dados, {"alpha": 0.1})
+        promover_modelo(promovido, str(arquivo), str(pasta))
+
+        servido = api_csv.obter_modelo()
+        assert versao_modelo(servido.base) == versao_modelo(promovido)
+        categoria = [nome for nome, id_categoria in api_csv.categoria_nome_para_id.items() if id_categoria == 6]
+        assert api_csv.prever_categorias(servido, ["Netflix assinatura"]) == categoria
+    finally:
+        monkeypatch.undo()
+        api_csv.carregar_modelo_inicial()
@@ -0,0 +1,260 @@
+import argparse
+import itertools
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Memory, Parallel, delayed
+
+from modelo_categorizacao import (treinar_modelo, criar_vetorizador, criar_pipeline, calibrar_probabilidades,
+                                  carregar_modelo, salvar_modelo, salvar_versao_modelo, versao_modelo,
+                                  ARQUIVO_CORRECOES, PASTA_MODELO_COMPACTO, PASTA_VERSOES_MODELO)
+from modelo_compacto import exportar_modelo_compacto
+
+# Busca de hiperparâmetros do modelo de categorização com validação cruzada.
+#
+# A matriz TF-IDF de cada (vetorizador, fold) é calculada uma vez e guardada em disco com joblib.Memory:
+# os valores de alpha reaproveitam a mesma matriz e uma nova execução com os mesmos dados não vetoriza
+# de novo. Cada (vetorizador, fold) é uma tarefa independente, distribuída entre todos os núcleos.
+ARQUIVO_TREINO = 'TreinoML.json'
+PASTA_CACHE_TREINO = os.path.join(tempfile.gettempdir(), 'stratfy_treino')
+
+GRADE_VETORIZADORES = (
+    [{"analyzer": "word", "ngram_range": ngramas, "min_df": min_df}
+     for ngramas, min_df in itertools.product([(1, 1), (1, 2), (1, 3)], [1, 2])]
+    + [{"analyzer": "char_wb", "ngram_range": ngramas, "min_df": min_df}
+       for ngramas, min_df in itertools.product([(2, 4), (3, 5)], [1, 2])]
+)
+GRADE_ALPHA = [0.1, 0.3, 1.0]
+FOLDS_PADRAO = 5
+
+# Acurácias mais próximas que isso empatam; o desempate é pela latência de previsão
+TOLERANCIA_EMPATE = 0.002
+
+# Faixa de busca da temperatura que calibra as probabilidades do vencedor (ver ajustar_temperatura)
+LIMITES_TEMPERATURA = (0.05, 20.0)
+
+memoria = Memory(PASTA_CACHE_TREINO, verbose=0)
+
+
+def carregar_dados(arquivo_treino=ARQUIVO_TREINO, arquivo_correcoes=ARQUIVO_CORRECOES):
+    """Base inicial mais as correções dos usuários (a correção mais recente de cada descrição prevalece)."""
+    dados = [pd.read_json(arquivo_treino)]
+    if os.path.exists(arquivo_correcoes):
+        dados.append(pd.read_json(arquivo_correcoes, lines=True))
+    dados = pd.concat(dados, ignore_index=True)[['descricao', 'categoria']]
+    return dados.drop_duplicates('descricao', keep='last').reset_index(drop=True)
+
+
+@memoria.cache
+def vetorizar_fold(descricoes, parametros_vetorizador, indices_treino, indices_teste):
+    """Ajusta o vetorizador no treino do fold e transforma treino e teste. Retorna também o tempo de ajuste."""
+    vetorizador = criar_vetorizador(parametros_vetorizador)
+    inicio = time.perf_counter()
+    X_treino = vetorizador.fit_transform(descricoes[indices_treino])
+    tempo_ajuste = time.perf_counter() - inicio
+    return X_treino, vetorizador.transform(descricoes[indices_teste]), tempo_ajuste
+
+
+def avaliar_fold(descricoes, categorias, parametros_vetorizador, indices_treino, indices_teste, alphas):
+    """Acurácia e tempo de ajuste de cada alpha num fold, sobre a mesma matriz de features."""
+    from sklearn.naive_bayes import MultinomialNB
+
+    X_treino, X_teste, tempo_vetorizacao = vetorizar_fold(descricoes, parametros_vetorizador,
+                                                          indices_treino, indices_teste)
+    resultados = []
+    for alpha in alphas:
+        inicio = time.perf_counter()
+        classificador = MultinomialNB(alpha=alpha).fit(X_treino, categorias[indices_treino])
+        tempo_ajuste = tempo_vetorizacao + time.perf_counter() - inicio
+        acuracia = float((classificador.predict(X_teste) == categorias[indices_teste]).mean())
+        resultados.append({**parametros_vetorizador, "alpha": alpha, "acuracia": acuracia, "tempo_ajuste": tempo_ajuste})
+    return resultados
+
+
+def medir_candidato(dados, parametros):
+    """Treina na base toda e mede o ajuste, a latência de previsão e o tamanho do artefato."""
+    inicio = time.perf_counter()
+    modelo = treinar_modelo(dados, parametros)
+    tempo_ajuste = time.perf_counter() - inicio
+
+    descricoes = dados['descricao'].tolist()
+    inicio = time.perf_counter()
+    modelo.predict(descricoes)
+    latencia = (time.perf_counter() - inicio) / len(descricoes)
+    return {"tempo_ajuste_total": tempo_ajuste, "latencia_previsao": latencia,
+            "tamanho_bytes": len(pickle.dumps(modelo))}
+
+
+def buscar_hiperparametros(dados, folds=FOLDS_PADRAO, processos=-1, vetorizadores=GRADE_VETORIZADORES,
+                           alphas=GRADE_ALPHA):
+    """Validação cruzada estratificada de todas as combinações. Retorna uma linha por candidato."""
+    from sklearn.model_selection import StratifiedKFold
+
+    descricoes = dados['descricao'].to_numpy(dtype=object)
+    categorias = dados['categoria'].to_numpy(dtype=object)
+    divisoes = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=42).split(descricoes, categorias))
+
+    por_fold = Parallel(n_jobs=processos)(
+        delayed(avaliar_fold)(descricoes, categorias, parametros, treino, teste, alphas)
+        for parametros, (treino, teste) in itertools.product(vetorizadores, divisoes)
+    )
+    candidatos = (
+        pd.DataFrame([resultado for resultados in por_fold for resultado in resultados])
+        .assign(ngram_range=lambda df: df['ngram_range'].map(tuple))
+        .groupby(['analyzer', 'ngram_range', 'min_df', 'alpha'], sort=False)
+        .agg(acuracia=('acuracia', 'mean'), desvio=('acuracia', 'std'), tempo_ajuste_fold=('tempo_ajuste', 'mean'))
+        .reset_index()
+    )
+
+    medidas = Parallel(n_jobs=processos)(
+        delayed(medir_candidato)(dados, parametros) for parametros in candidatos[['analyzer', 'ngram_range', 'min_df', 'alpha']].to_dict('records')
+    )
+    return pd.concat([candidatos, pd.DataFrame(medidas)], axis=1)
+
+
+def escolher_vencedor(candidatos):
+    """Maior acurácia; entre os empatados (TOLERANCIA_EMPATE), o de previsão mais rápida."""
+    empatados = candidatos[candidatos['acuracia'] >= candidatos['acuracia'].max() - TOLERANCIA_EMPATE]
+    return empatados.sort_values(['latencia_previsao', 'tamanho_bytes']).iloc[0]
+
+
+def ajustar_temperatura(dados, parametros, folds=FOLDS_PADRAO, processos=-1):
+    """Temperatura que minimiza a log-loss das probabilidades fora do fold.
+
+    O Naive Bayes costuma errar a confiança, não a ordem das categorias; dividir o log das
+    probabilidades por uma temperatura corrige isso sem mudar a previsão. Retorna
+    (temperatura, log-loss sem calibração, log-loss calibrada).
+    """
+    from scipy.optimize import minimize_scalar
+    from sklearn.model_selection import StratifiedKFold, cross_val_predict
+
+    descricoes = dados['descricao'].to_numpy(dtype=object)
+    categorias = dados['categoria'].to_numpy(dtype=object)
+    divisoes = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    probabilidades = cross_val_predict(criar_pipeline(parametros), descricoes, categorias, cv=divisoes,
+                                       method='predict_proba', n_jobs=processos)
+    # As colunas de cross_val_predict seguem as classes em ordem
+    corretas = np.searchsorted(np.unique(categorias), categorias)
+
+    def perda(temperatura):
+        calibradas = calibrar_probabilidades(probabilidades, temperatura)
+        return float(-np.log(np.maximum(calibradas[np.arange(len(corretas)), corretas], np.finfo(float).tiny)).mean())
+
+    resultado = minimize_scalar(perda, bounds=LIMITES_TEMPERATURA, method='bounded')
+    return float(resultado.x), perda(1.0), float(resultado.fun)
+
+
+def parametros_do_modelo(modelo):
+    """Parâmetros (no formato de criar_pipeline) de um pipeline já treinado."""
+    vetorizador, classificador = modelo.named_steps['tfidf'], modelo.named_steps['clf']
+    return {"analyzer": vetorizador.analyzer, "ngram_range": list(vetorizador.ngram_range),
+            "min_df": vetorizador.min_df, "alpha": float(classificador.alpha)}
+
+
+def promover_modelo(modelo, arquivo_modelo='modelo_categorizacao.pkl', pasta_compacta=PASTA_MODELO_COMPACTO):
+    """Grava o modelo como o pkl padrão e o exporta para o formato compacto.
+
+    Retorna False se o formato compacto não suportar o modelo (ex.: analyzer='char_wb'). Nesse caso a
+    pasta compacta anterior é apagada: a API a carrega antes do pkl e continuaria servindo o modelo antigo.
+    """
+    salvar_modelo(modelo, arquivo_modelo)
+    try:
+        exportar_modelo_compacto(modelo, pasta_compacta, versao_modelo(modelo))
+    except ValueError:
+        shutil.rmtree(pasta_compacta, ignore_errors=True)
+        return False
+    return True
+
+
+def formatar_relatorio(candidatos):
+    tabela = pd.DataFrame({
+        "analyzer": candidatos['analyzer'],
+        "ngram": candidatos['ngram_range'].map(lambda ngramas: f"{ngramas[0]}-{ngramas[1]}"),
+        "min_df": candidatos['min_df'],
+        "alpha": candidatos['alpha'],
+        "acurácia": candidatos['acuracia'].map(lambda valor: f"{valor:.3f}"),
+        "±": candidatos['desvio'].map(lambda valor: f"{valor:.3f}"),
+        "ajuste (ms)": (candidatos['tempo_ajuste_total'] * 1000).map(lambda valor: f"{valor:.1f}"),
+        "previsão (µs/linha)": (candidatos['latencia_previsao'] * 1e6).map(lambda valor: f"{valor:.1f}"),
+        "tamanho (KB)": (candidatos['tamanho_bytes'] / 1024).map(lambda valor: f"{valor:.0f}"),
+    })
+    ordem = candidatos.sort_values(['acuracia', 'latencia_previsao'], ascending=[False, True]).index
+    return tabela.loc[ordem].to_string(index=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Busca de hiperparâmetros e versionamento do modelo de categorização.")
+    parser.add_argument('--folds', type=int, default=FOLDS_PADRAO)
+    parser.add_argument('--processos', type=int, default=-1, help="Processos em paralelo (-1 usa todos os núcleos)")
+    parser.add_argument('--promover', action='store_true',
+                        help="Também grava o vencedor como modelo_categorizacao.pkl e exporta o modelo compacto")
+    parser.add_argument('--limpar-cache', action='store_true', help="Descarta as matrizes de features em cache")
+    parser.add_argument('--calibrar', action='store_true',
+                        help="Só ajusta a temperatura do modelo_categorizacao.pkl atual e o promove de novo, sem busca")
+    args = parser.parse_args()
+
+    if args.limpar_cache:
+        memoria.clear(warn=False)
+
+    dados = carregar_dados()
+    if args.calibrar:
+        modelo = carregar_modelo()
+        if modelo is None:
+            sys.exit(1)
+        parametros = parametros_do_modelo(modelo)
+        temperatura, perda_original, perda_calibrada = ajustar_temperatura(dados, parametros, args.folds, args.processos)
+        # A versão muda junto com as probabilidades, invalidando os caches que dependem dela
+        modelo.temperatura, modelo.versao = temperatura, None
+        compacto = promover_modelo(modelo)
+        print(f"Temperatura {temperatura:.2f}: log-loss de validação {perda_original:.3f} -> {perda_calibrada:.3f}")
+        print(f"'modelo_categorizacao.pkl' regravado como versão {versao_modelo(modelo)}"
+              + (f" e exportado para '{PASTA_MODELO_COMPACTO}'" if compacto else ""))
+        sys.exit(0)
+
+    print(f"{len(dados)} amostras, {dados['categoria'].nunique()} categorias, "
+          f"{len(GRADE_VETORIZADORES) * len(GRADE_ALPHA)} candidatos, {args.folds} folds")
+
+    inicio = time.perf_counter()
+    candidatos = buscar_hiperparametros(dados, args.folds, args.processos)
+    print(f"Busca concluída em {time.perf_counter() - inicio:.1f} s\n")
+    print(formatar_relatorio(candidatos))
+
+    vencedor = escolher_vencedor(candidatos)
+    parametros = {"analyzer": vencedor['analyzer'], "ngram_range": list(vencedor['ngram_range']),
+                  "min_df": int(vencedor['min_df']), "alpha": float(vencedor['alpha'])}
+    modelo = treinar_modelo(dados, parametros)
+    temperatura, perda_original, perda_calibrada = ajustar_temperatura(dados, parametros, args.folds, args.processos)
+    modelo.temperatura = temperatura
+    versao = salvar_versao_modelo(modelo, {
+        "criado_em": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "parametros": parametros,
+        "acuracia_validacao": float(vencedor['acuracia']),
+        "desvio_validacao": float(vencedor['desvio']),
+        "folds": args.folds,
+        "amostras": len(dados),
+        "categorias": sorted(dados['categoria'].unique().tolist()),
+        "tempo_ajuste_segundos": float(vencedor['tempo_ajuste_total']),
+        "latencia_previsao_segundos": float(vencedor['latencia_previsao']),
+        "tamanho_bytes": int(vencedor['tamanho_bytes']),
+        "temperatura": temperatura,
+        "log_loss_validacao": perda_calibrada,
+        "log_loss_validacao_sem_calibracao": perda_original,
+    })
+    print(f"\nVencedor: {parametros} (acurácia {vencedor['acuracia']:.3f})")
+    print(f"Temperatura {temperatura:.2f}: log-loss de validação {perda_original:.3f} -> {perda_calibrada:.3f}")
+    print(f"Salvo como versão {versao} em '{os.path.join(PASTA_VERSOES_MODELO, versao)}'")
+
+    if args.promover:
+        compacto = promover_modelo(modelo)
+        print("Promovido para 'modelo_categorizacao.pkl'")
+        if not compacto:
+            print(f"Erro: o formato compacto só suporta analyzer='word'; '{PASTA_MODELO_COMPACTO}' foi removido "
+                  f"e a API vai carregar o pkl", file=sys.stderr)
+            sys.exit(1)
+        print(f"Modelo compacto exportado para '{PASTA_MODELO_COMPACTO}'")
@@ -2,6 +2,9 @@
 using System;
 using System.Collections.Generic;
 using System.Linq;
+using System.Security.Cryptography;
+using System.Text;
+using System.Text.Json;
 using System.Threading.Tasks;
 using Microsoft.AspNetCore.Authorization;
 using Microsoft.AspNetCore.Mvc;
@@ -199,7 +202,17 @@ namespace STRATFY.Controllers
                 {
                     return NotFound();
                 }
-                return Ok(dashboardData);
+
+                // ETag calculado sobre o conteúdo: o dashboard em Python reaproveita os dados em cache
+                // e só recebe o corpo de novo quando algo mudou (If-None-Match -> 304)
+                var json = JsonSerializer.Serialize(dashboardData, new JsonSerializerOptions(JsonSerializerDefaults.Web));
+                var etag = $"\"{Convert.ToHexString(SHA256.HashData(Encoding.UTF8.GetBytes(json)))[..16]}\"";
+                if (Request.Headers.IfNoneMatch.ToString().Contains(etag))
+                {
+                    return StatusCode(304);
+                }
+                Response.Headers.ETag = etag;
+                return Content(json, "application/json");
             }
             catch (ApplicationException ex)
             {
@@ -31,6 +31,8 @@ namespace STRATFY.DTOs
         public string Tipo { get; set; }
         public string Cor { get; set; }
         public bool AtivarLegenda { get; set; }
+        public int? LimitePontos { get; set; }
+        public int? TopN { get; set; }
     }
 
     public class CartaoDTO
@@ -21,5 +21,9 @@ public partial class Grafico
 
     public bool AtivarLegenda { get; set; }
 
+    public int? LimitePontos { get; set; }
+
+    public int? TopN { get; set; }
+
     public virtual Dashboard Dashboard { get; set; } = null!;
 }
@@ -213,7 +213,9 @@ namespace STRATFY.Services
                     Campo2 = g.Campo2,
                     Tipo = g.Tipo,
                     Cor = g.Cor,
-                    AtivarLegenda = g.AtivarLegenda
+                    AtivarLegenda = g.AtivarLegenda,
+                    LimitePontos = g.LimitePontos,
+                    TopN = g.TopN
                 }) ?? Enumerable.Empty<GraficoDTO>(),
                 Cartoes = dashboard.Cartoes?.Select(c => new CartaoDTO
                 {